@@ -20,9 +20,13 @@
 
 """Module for implementing dialog box for viewing/editing data."""
 
-import veusz.qtall as qt4
+from itertools import izip
+
+import numpy as N
 
+import veusz.qtall as qt4
 import veusz.document as document
+import veusz.utils as utils
 from veusz.qtwidgets.datasetbrowser import DatasetBrowser
 from veuszdialog import VeuszDialog
 
@@ -34,16 +38,38 @@ def _(text, disambiguation=None, context="DataEditDialog"):
     return unicode(
         qt4.QCoreApplication.translate(context, text, disambiguation))
 
+def _valuesEqual(a, b):
+    """Are the values in columns a and b the same?"""
+    if a is None or b is None:
+        return a is b
+    if isinstance(a, N.ndarray):
+        return ( a.shape == b.shape and
+                 N.all((a == b) | (N.isnan(a) & N.isnan(b))) )
+    return a == b
+
 class DatasetTableModel1D(qt4.QAbstractTableModel):
-    """Provides access to editing and viewing of datasets."""
+    """Provides access to editing and viewing of datasets.
+
+    Rows are converted for display in blocks, which are cached. When
+    the document is modified, only the blocks whose values have
+    changed are updated in the view.
+    """
+
+    # number of rows in each block
+    blockrows = 256
+    # maximum number of blocks kept
+    maxblocks = 64
 
     def __init__(self, parent, document, datasetname):
         qt4.QAbstractTableModel.__init__(self, parent)
 
         self.document = document
         self.dsname = datasetname
-        self.connect(document, qt4.SIGNAL('sigModified'),
-                     self.slotDocumentModified)
+        self.blocks = utils.LRUCache(self.maxblocks)
+        self.version = self.document.datasetVersion(self.dsname)
+        self.numrows = self.rowCount(None)
+        self.connect(document, qt4.SIGNAL('sigChanged'),
+                     self.slotDocumentChanged)
 
     def rowCount(self, parent):
         """Return number of rows."""
@@ -51,10 +77,71 @@ class DatasetTableModel1D(qt4.QAbstractTableModel):
             return len(self.document.data[self.dsname].data)+1
         except (KeyError, AttributeError):
             return 0
-        
+
+    def _readBlockValues(self, blocknum):
+        """Get copies of values in each column in block."""
+        ds = self.document.data[self.dsname]
+        start = blocknum*self.blockrows
+        vals = []
+        for col in ds.columns:
+            data = getattr(ds, col)
+            if data is not None:
+                data = data[start:start+self.blockrows]
+                if isinstance(data, N.ndarray):
+                    data = data.copy()
+            vals.append(data)
+        return vals
+
+    def _getBlock(self, blocknum):
+        """Get (values, converted values) for block, using the cache."""
+        block = self.blocks.get(blocknum)
+        if block is None:
+            ds = self.document.data[self.dsname]
+            vals = self._readBlockValues(blocknum)
+            conv = []
+            for data in vals:
+                if data is not None:
+                    data = ds.uiDataItemsToQVariants(data)
+                conv.append(data)
+            block = self.blocks[blocknum] = (vals, conv)
+        return block
+
+    def slotDocumentChanged(self, changes):
+        """Check for updates if any datasets have changed, as the
+        dataset may be derived from others."""
+        if changes.datasetsChanged():
+            self.slotDocumentModified()
+
     def slotDocumentModified(self):
         """Called when document modified."""
-        self.emit( qt4.SIGNAL('layoutChanged()') )
+
+        version = self.document.datasetVersion(self.dsname)
+        if version == self.version:
+            return
+        oldversion, self.version = self.version, version
+
+        numrows = self.rowCount(None)
+        if numrows != self.numrows or version[0] != oldversion[0]:
+            # rows have moved, or the dataset was replaced
+            self.numrows = numrows
+            self.blocks.clear()
+            self.emit( qt4.SIGNAL('layoutChanged()') )
+            return
+
+        # only update blocks shown which have different values
+        for blocknum in self.blocks.keys():
+            oldvals = self.blocks.get(blocknum)[0]
+            newvals = self._readBlockValues(blocknum)
+            if not all([_valuesEqual(o, n) for o, n in
+                        izip(oldvals, newvals)]):
+                del self.blocks[blocknum]
+                start = blocknum*self.blockrows
+                end = min(start+self.blockrows, numrows-1)-1
+                self.emit(
+                    qt4.SIGNAL('dataChanged(const QModelIndex &, '
+                               'const QModelIndex &)'),
+                    self.index(start, 0),
+                    self.index(end, len(newvals)-1) )
 
     def columnCount(self, parent):
         """Return number of columns."""
@@ -66,19 +153,13 @@ class DatasetTableModel1D(qt4.QAbstractTableModel):
 
     def data(self, index, role):
         """Return data associated with column given."""
-        # get dataset
-        ds = self.document.data[self.dsname]
-        if ds is not None:
-            # select correct part of dataset
-            data = getattr(ds, ds.columns[index.column()])
-        if ds is not None and data is not None and role == qt4.Qt.DisplayRole:
-            # blank row at end of data
-            if index.row() == len(data):
-                return qt4.QVariant()
-
-            # convert data to QVariant
-            d = data[index.row()]
-            return ds.uiDataItemToQVariant(d)
+        # blank row at end of data
+        if role == qt4.Qt.DisplayRole and index.row() < self.numrows-1:
+            # look up converted data in block
+            blocknum, blockrow = divmod(index.row(), self.blockrows)
+            data = self._getBlock(blocknum)[1][index.column()]
+            if data is not None:
+                return data[blockrow]
 
         # empty entry
         return qt4.QVariant()
@@ -168,8 +249,8 @@ class DatasetTableModel2D(qt4.QAbstractTableModel):
 
         self.document = document
         self.dsname = datasetname
-        self.connect(document, qt4.SIGNAL('sigModified'),
-                     self.slotDocumentModified)
+        self.connect(document, qt4.SIGNAL('sigChanged'),
+                     self.slotDocumentChanged)
 
     def rowCount(self, parent):
         ds = self.document.data[self.dsname].data
@@ -222,6 +303,12 @@ class DatasetTableModel2D(qt4.QAbstractTableModel):
         else:
             return qt4.QAbstractTableModel.flags(self, index) | qt4.Qt.ItemIsEditable
 
+    def slotDocumentChanged(self, changes):
+        """Update if any datasets have changed, as the dataset may be
+        derived from others."""
+        if changes.datasetsChanged():
+            self.slotDocumentModified()
+
     def slotDocumentModified(self):
         """Called when document modified."""
         self.emit( qt4.SIGNAL('layoutChanged()') )
@@ -278,8 +365,8 @@ class DataEditDialog(VeuszDialog):
         self.linkedlabel.viewport().setBackgroundRole(qt4.QPalette.Window)
 
         # document changes
-        self.connect(document, qt4.SIGNAL('sigModified'),
-                     self.slotDocumentModified)
+        self.connect(document, qt4.SIGNAL('sigChanged'),
+                     self.slotDocumentChanged)
 
         # select first item, if any or initialise if none
         if len(self.document.data) > 0:
@@ -350,6 +437,11 @@ class DataEditDialog(VeuszDialog):
         self.deletebutton.setEnabled(ds is not None)
         self.duplicatebutton.setEnabled(ds is not None)
 
+    def slotDocumentChanged(self, changes):
+        """Update if datasets have changed."""
+        if changes.datasetsChanged():
+            self.slotDocumentModified()
+
     def slotDocumentModified(self):
         """Set unlink status when document modified."""
         self.setUnlinkState()
@@ -0,0 +1,111 @@
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Dialog showing how long each widget takes to draw."""
+
+import sys
+
+import veusz.qtall as qt4
+import veusz.document as document
+from veuszdialog import VeuszDialog
+import exceptiondialog
+
+def _(text, disambiguation=None, context="DrawProfileDialog"):
+    """Translate text."""
+    return unicode(
+        qt4.QCoreApplication.translate(context, text, disambiguation))
+
+class DrawProfileDialog(VeuszDialog):
+    """Draw the current page, showing statistics for each widget."""
+
+    def __init__(self, mainwindow, doc):
+        VeuszDialog.__init__(self, mainwindow, 'drawprofile.ui')
+        self.document = doc
+
+        self.profilebutton = self.buttonBox.addButton(
+            _("&Profile again"), qt4.QDialogButtonBox.ApplyRole)
+        self.connect(self.profilebutton, qt4.SIGNAL('clicked()'),
+                     self.profilePage)
+
+        # select widget in editing window when clicked
+        self.connect(self.profileTree,
+                     qt4.SIGNAL('itemClicked(QTreeWidgetItem*, int)'),
+                     self.slotItemClicked)
+
+        self.profilePage()
+
+    def profilePage(self):
+        """Draw the page shown in the plot window, and show the
+        profiles of the widgets."""
+
+        plot = self.mainwindow.plot
+        pagenum = plot.getPageNumber()
+        self.profileTree.clear()
+        if pagenum < 0 or pagenum >= self.document.getNumberPages():
+            self.summaryLabel.setText(_('No page to profile'))
+            return
+
+        # draw in the same way as the plot window
+        size = self.document.pageSize(pagenum, scaling=plot.zoomfactor)
+        helper = document.PaintHelper(size, scaling=plot.zoomfactor,
+                                      dpi=plot.dpi, profile=True)
+        try:
+            self.document.paintTo(helper, pagenum)
+        except Exception:
+            # leave the table empty and show the problem
+            self.summaryLabel.setText(_('Page %i could not be drawn') %
+                                      (pagenum+1))
+            d = exceptiondialog.ExceptionDialog(sys.exc_info(), self)
+            d.exec_()
+            return
+
+        total = 0.
+        for p in helper.profiles:
+            if p.typename == 'page':
+                total += p.drawtime
+
+            item = qt4.QTreeWidgetItem(self.profileTree)
+            item.setText(0, p.path)
+            item.setText(1, p.typename)
+            for col, val in ( (2, p.drawtime), (3, p.selftime),
+                              (4, p.evaltime) ):
+                item.setData(col, qt4.Qt.DisplayRole, round(val*1000, 1))
+            for col, val in ( (5, p.primitives), (6, p.records) ):
+                if val is not None:
+                    item.setData(col, qt4.Qt.DisplayRole, val)
+            for col in xrange(2, 7):
+                item.setTextAlignment(col, qt4.Qt.AlignRight)
+
+        self.summaryLabel.setText(
+            _('Page %i drawn in %.1f ms by %i widgets') % (
+                pagenum+1, total*1000, len(helper.profiles)) )
+
+        # show slowest widgets first
+        self.profileTree.sortItems(3, qt4.Qt.DescendingOrder)
+        for col in xrange(7):
+            self.profileTree.resizeColumnToContents(col)
+
+    def slotItemClicked(self, item, column):
+        """Select the widget of the item in the editing window."""
+        try:
+            widget = self.document.resolveFullWidgetPath(
+                unicode(item.text(0)))
+        except AssertionError:
+            # widget no longer exists
+            return
+        self.mainwindow.treeedit.selectWidget(widget)
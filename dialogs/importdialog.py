@@ -870,6 +870,7 @@ class ImportDialog(VeuszDialog):
 
         VeuszDialog.__init__(self, parent, 'import.ui')
         self.document = document
+        document.loadPendingPlugins()
 
         # whether file import looks likely to work
         self.filepreviewokay = False
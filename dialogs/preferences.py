@@ -61,6 +61,8 @@ class PreferencesDialog(VeuszDialog):
             setdb['plot_updatepolicy'])
         self.intervalCombo.setCurrentIndex(index)
         self.threadSpinBox.setValue( setdb['plot_numthreads'] )
+        self.renderCacheCheck.setChecked( setdb['plot_rendercache'] )
+        self.renderCacheSizeSpinBox.setValue( setdb['plot_rendercache_size'] )
 
         # disable thread option if not supported
         if not qt4.QFontDatabase.supportsThreadedFontRendering():
@@ -215,6 +217,8 @@ class PreferencesDialog(VeuszDialog):
         setdb['plot_antialias'] = self.antialiasCheck.isChecked()
         setdb['ui_english'] = self.englishCheck.isChecked()
         setdb['plot_numthreads'] = self.threadSpinBox.value()
+        setdb['plot_rendercache'] = self.renderCacheCheck.isChecked()
+        setdb['plot_rendercache_size'] = self.renderCacheSizeSpinBox.value()
 
         # use cwd
         setdb['dirname_usecwd'] = self.cwdCheck.isChecked()
@@ -113,7 +113,7 @@ class ReloadData(VeuszDialog):
         try:
             # try to reload the datasets
             datasets, errors = self.document.reloadLinkedDatasets(
-                self.filenames)
+                self.filenames, tailfollow=self.appendCheck.isChecked())
 
             # show errors in read data
             for var, count in errors.items():
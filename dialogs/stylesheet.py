@@ -37,6 +37,8 @@ class StylesheetDialog(VeuszDialog):
         VeuszDialog.__init__(self, parent, 'stylesheet.ui')
         self.document = document
         self.stylesheet = document.basewidget.settings.StyleSheet
+        # widget settings are otherwise only added when first used
+        self.stylesheet.fillAll()
 
         self.stylesListWidget.setMinimumWidth(100)
 
@@ -30,5 +30,7 @@ from mime import *
 from dataset_histo import *
 from painthelper import *
 from export import Export
-from dbusinterface import *
 from importparams import *
+from fastload import parseSavedDocument, runSavedCommands
+from snapshot import DocumentSnapshot, SaveThread
+from rendercache import RenderCache, getRenderCache, pageCacheKey
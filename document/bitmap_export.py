@@ -0,0 +1,213 @@
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Writers for PNG and TIFF images which are given the image a band
+of rows at a time, so that large images do not have to be held in
+memory."""
+
+import struct
+import zlib
+
+import numpy as N
+import veusz.qtall as qt4
+
+# 1m in inch
+m_inch = 39.370079
+
+def imageToRGBA(image):
+    """Convert QImage to a (height, width, 4) array of RGBA bytes,
+    without premultiplied alpha."""
+
+    img = image.convertToFormat(qt4.QImage.Format_ARGB32)
+    width, height = img.width(), img.height()
+
+    # pixels are stored as native 32 bit integers 0xAARRGGBB
+    pix = N.fromstring( img.bits().asstring(img.byteCount()),
+                        dtype=N.uint32 )
+    pix = pix.reshape(height, img.bytesPerLine()//4)[:, :width]
+
+    out = N.empty( (height, width, 4), dtype=N.uint8 )
+    out[:,:,0] = pix >> 16
+    out[:,:,1] = pix >> 8
+    out[:,:,2] = pix
+    out[:,:,3] = pix >> 24
+    return out
+
+def _horizontalDifference(pixels):
+    """Subtract the previous pixel in each row from each pixel.
+    This is the Sub filter in PNG and horizontal predictor in TIFF,
+    which makes plots with large flat areas compress much better."""
+    diff = pixels.copy()
+    diff[:,1:,:] -= pixels[:,:-1,:]
+    return diff
+
+class PNGStreamWriter(object):
+    """Write a PNG image in bands of rows."""
+
+    def __init__(self, filename, width, height, dpi, alpha=True):
+        """Write PNG of size width x height with dpi given.
+        If alpha is False, the alpha channel is not written."""
+
+        self.alpha = alpha
+        self.fileobj = open(filename, 'wb')
+        self.fileobj.write('\x89PNG\r\n\x1a\n')
+
+        colortype = (2, 6)[alpha]
+        self._writeChunk( 'IHDR', struct.pack('>IIBBBBB', width, height,
+                                              8, colortype, 0, 0, 0) )
+        # resolution in pixels per metre
+        ppm = int(round(dpi*m_inch))
+        self._writeChunk( 'pHYs', struct.pack('>IIB', ppm, ppm, 1) )
+
+        self.compressor = zlib.compressobj()
+
+    def _writeChunk(self, chunktype, data):
+        """Write a PNG chunk to the file."""
+        crc = zlib.crc32(data, zlib.crc32(chunktype)) & 0xffffffff
+        self.fileobj.write( struct.pack('>I', len(data)) )
+        self.fileobj.write(chunktype)
+        self.fileobj.write(data)
+        self.fileobj.write( struct.pack('>I', crc) )
+
+    def writeRows(self, rgba):
+        """Write next rows from (rows, width, 4) array of RGBA bytes."""
+
+        if not self.alpha:
+            rgba = rgba[:,:,:3]
+        rows = _horizontalDifference(rgba).reshape(rgba.shape[0], -1)
+
+        # each row starts with its filter type (1 is Sub)
+        filtered = N.empty( (rows.shape[0], rows.shape[1]+1), dtype=N.uint8 )
+        filtered[:,0] = 1
+        filtered[:,1:] = rows
+
+        data = self.compressor.compress(filtered.tostring())
+        if data:
+            self._writeChunk('IDAT', data)
+
+    def close(self):
+        """Finish writing image."""
+        self._writeChunk('IDAT', self.compressor.flush())
+        self._writeChunk('IEND', '')
+        self.fileobj.close()
+
+class TIFFStreamWriter(object):
+    """Write a deflate-compressed TIFF image in bands of rows.
+
+    Each band is written as a strip. All bands apart from the last
+    must have the same number of rows.
+    """
+
+    # tag types
+    SHORT = 3
+    LONG = 4
+    RATIONAL = 5
+
+    def __init__(self, filename, width, height, dpi, alpha=False):
+        """Write TIFF of size width x height with dpi given.
+        If alpha is False, the alpha channel is not written."""
+
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.alpha = alpha
+
+        self.stripoffsets = []
+        self.stripbytes = []
+        self.rowsperstrip = None
+
+        self.fileobj = open(filename, 'wb')
+        # little endian header, with offset to directory written later
+        self.fileobj.write( struct.pack('<2sHI', 'II', 42, 0) )
+
+    def writeRows(self, rgba):
+        """Write next rows from (rows, width, 4) array of RGBA bytes."""
+
+        if not self.alpha:
+            rgba = rgba[:,:,:3]
+        if self.rowsperstrip is None:
+            self.rowsperstrip = rgba.shape[0]
+
+        data = zlib.compress(_horizontalDifference(rgba).tostring())
+        self.stripoffsets.append( self.fileobj.tell() )
+        self.stripbytes.append( len(data) )
+        self.fileobj.write(data)
+
+        # keep word alignment
+        if self.fileobj.tell() % 2:
+            self.fileobj.write('\0')
+
+    def close(self):
+        """Write image directory and finish writing image."""
+
+        samples = (3, 4)[self.alpha]
+        # resolution as rational
+        res = (int(round(self.dpi*1000)), 1000)
+        entries = [
+            (256, self.LONG, [self.width]),             # ImageWidth
+            (257, self.LONG, [self.height]),            # ImageLength
+            (258, self.SHORT, [8]*samples),             # BitsPerSample
+            (259, self.SHORT, [8]),                     # Compression=Deflate
+            (262, self.SHORT, [2]),                     # Photometric=RGB
+            (273, self.LONG, self.stripoffsets),        # StripOffsets
+            (277, self.SHORT, [samples]),               # SamplesPerPixel
+            (278, self.LONG, [self.rowsperstrip or 1]), # RowsPerStrip
+            (279, self.LONG, self.stripbytes),          # StripByteCounts
+            (282, self.RATIONAL, [res]),                # XResolution
+            (283, self.RATIONAL, [res]),                # YResolution
+            (284, self.SHORT, [1]),                     # PlanarConfiguration
+            (296, self.SHORT, [2]),                     # ResolutionUnit=inch
+            (317, self.SHORT, [2]),                     # Predictor=horizontal
+            ]
+        if self.alpha:
+            # unassociated alpha
+            entries.append( (338, self.SHORT, [2]) )    # ExtraSamples
+
+        # values which do not fit in the directory go after it
+        f = self.fileobj
+        diroffset = f.tell()
+        extraoffset = diroffset + 2 + len(entries)*12 + 4
+
+        directory = [struct.pack('<H', len(entries))]
+        extra = []
+        for tag, ttype, vals in entries:
+            if ttype == self.SHORT:
+                data = struct.pack('<%iH' % len(vals), *vals)
+            elif ttype == self.LONG:
+                data = struct.pack('<%iI' % len(vals), *vals)
+            else:
+                data = ''.join([struct.pack('<II', *v) for v in vals])
+
+            if len(data) <= 4:
+                valfield = data + '\0'*(4-len(data))
+            else:
+                valfield = struct.pack('<I', extraoffset)
+                extra.append(data)
+                extraoffset += len(data)
+            directory.append( struct.pack('<HHI', tag, ttype, len(vals)) +
+                              valfield )
+        # no further directories
+        directory.append( struct.pack('<I', 0) )
+
+        f.write(''.join(directory))
+        f.write(''.join(extra))
+
+        # update pointer to directory in header
+        f.seek(4)
+        f.write( struct.pack('<I', diroffset) )
+        f.close()
@@ -39,6 +39,7 @@ import operations
 import dataset_histo
 import mime
 import export
+import painthelper
 
 class CommandInterface(qt4.QObject):
     """Class provides command interface."""
@@ -52,6 +53,7 @@ class CommandInterface(qt4.QObject):
         'CloneWidget',
         'CreateHistogram',
         'DatasetPlugin',
+        'FitWidgets',
         'Get',
         'GetChildren',
         'GetData',
@@ -67,6 +69,7 @@ class CommandInterface(qt4.QObject):
         'List',
         'NodeChildren',
         'NodeType',
+        'ProfileDraw',
         'ReloadData',
         'Remove',
         'RemoveCustom',
@@ -266,6 +269,7 @@ class CommandInterface(qt4.QObject):
         if they are renamed. The new name None means dataset is deleted."""
 
         # lookup plugin (urgh)
+        self.document.loadPendingPlugins()
         plugin = None
         for pkls in plugins.datasetpluginregistry:
             if pkls.name == pluginname:
@@ -854,16 +858,20 @@ class CommandInterface(qt4.QObject):
             self.document.log(exc)
         return op.outdatasets, op.outcustoms
 
-    def ReloadData(self):
+    def ReloadData(self, tailfollow=False):
         """Reload any linked datasets.
 
+        If tailfollow is True, only data appended to linked text and
+        CSV files since they were last read are parsed. The files are
+        read in full if they have shrunk or their start has changed.
+
         Returned is a tuple (datasets, errors)
          where datasets is a list of datasets read
          errors is a dict of the datasets with the number of errors while
          converting the data
         """
 
-        return self.document.reloadLinkedDatasets()
+        return self.document.reloadLinkedDatasets(tailfollow=tailfollow)
 
     def Action(self, action, widget='.'):
         """Performs action on current widget."""
@@ -873,6 +881,32 @@ class CommandInterface(qt4.QObject):
         # run action
         w.getAction(action).function()
 
+    def FitWidgets(self, widgets=None, processes=None):
+        """Fit the fit widgets with the paths given (default is all
+        fit widgets in the document), in parallel worker processes.
+
+        processes is the number of processes to use (default is the
+        number of CPUs). The results are applied in a single operation.
+        """
+
+        from veusz.widgets.fit import batchFit
+
+        if widgets is None:
+            fitwidgets = []
+            def addfit(path, w):
+                if w.typename == 'fit':
+                    fitwidgets.append(w)
+            self.document.walkNodes(addfit, nodetypes=('widget',))
+        else:
+            fitwidgets = []
+            for path in widgets:
+                w = self.document.resolve(self.currentwidget, path)
+                if w.typename != 'fit':
+                    raise ValueError, "Widget '%s' is not a fit widget" % path
+                fitwidgets.append(w)
+
+        batchFit(self.document, fitwidgets, processes=processes)
+
     def Print(self):
         """Print document."""
         p = qt4.QPrinter()
@@ -904,6 +938,28 @@ class CommandInterface(qt4.QObject):
                           pdfdpi=pdfdpi, svgtextastext=svgtextastext)
         e.export()
 
+    def ProfileDraw(self, page=0, dpi=100):
+        """Draw page, returning statistics of drawing each widget.
+
+        dpi is the number of dots per inch to draw at
+
+        Returns a list of dicts, one for each widget in the order
+        drawn, with keys:
+         path: path of widget
+         type: type of widget
+         drawtime: time taken drawing widget and its children (s)
+         selftime: time taken excluding its children (s)
+         evaltime: time taken evaluating datasets and expressions (s)
+         primitives: number of items painted (None if unknown)
+         records: number of paint operations recorded (None if unknown)
+        """
+
+        helper = painthelper.PaintHelper(
+            self.document.pageSize(page, dpi=(dpi, dpi)),
+            dpi=(dpi, dpi), profile=True)
+        self.document.paintTo(helper, page)
+        return [p.asDict() for p in helper.profiles]
+
     def Rename(self, widget, newname):
         """Rename the widget with the path given to the new name.
 
@@ -47,6 +47,7 @@ import pickle
 import os.path
 
 from commandinterface import CommandInterface
+import fastload
 import veusz.utils as utils
 
 class CommandInterpreter(object):
@@ -175,7 +176,7 @@ class CommandInterpreter(object):
     def Load(self, filename):
         """Replace the document with a new one from the filename."""
 
-        f = open(filename, 'rU')
+        script = open(filename, 'rU').read()
         self.document.wipe()
         self.interface.To('/')
         oldfile = self.globals['__file__']
@@ -183,7 +184,7 @@ class CommandInterpreter(object):
 
         self.interface.importpath.append(
             os.path.dirname(os.path.abspath(filename)))
-        self.runFile(f)
+        self.runSavedDocument(script)
         self.interface.importpath.pop()
         self.globals['__file__'] = oldfile
         self.document.setModified()
@@ -217,6 +218,37 @@ class CommandInterpreter(object):
         sys.stdout = temp_stdout
         sys.stderr = temp_stderr
 
+    def runSavedDocument(self, script):
+        """Run the text of a saved document in the preserved environment.
+
+        Documents which only contain the commands written when saving
+        are loaded without executing them, which is much faster.
+        """
+
+        commands = fastload.parseSavedDocument(script)
+        if commands is None:
+            self.runFile(script)
+            return
+
+        temp_stdout = sys.stdout
+        temp_stderr = sys.stderr
+        sys.stdout = self.write_stdout
+        sys.stderr = self.write_stderr
+
+        self.document.suspendUpdates()
+        try:
+            fastload.runSavedCommands(commands, self.interface, self.globals)
+        except Exception:
+            # print out the backtrace to stderr
+            i = sys.exc_info()
+            backtrace = traceback.format_exception( *i )
+            for l in backtrace:
+                sys.stderr.write(l)
+        self.document.enableUpdates()
+
+        sys.stdout = temp_stdout
+        sys.stderr = temp_stderr
+
     # FIXME: need a version of this that can throw exceptions instead
     def evaluate(self, expression):
         """ Evaluate an expression in the environment."""
@@ -17,8 +17,9 @@
 ###############################################################################
 
 import numpy as N
-from datasets import Dataset, simpleEvalExpression
+from datasets import Dataset, simpleEvalExpression, _substituteDatasets
 import veusz.qtall as qt4
+import veusz.utils as utils
 
 def _(text, disambiguation=None, context="Datasets"):
     """Translate text."""
@@ -41,6 +42,9 @@ class DatasetHistoGenerator(object):
         """
 
         self.changeset = -1
+        # cached (input version, evaluation context, bin edges,
+        #         counts, number of values)
+        self.countcache = None
 
         self.document = document
         self.inexpr = inexpr
@@ -68,10 +72,11 @@ class DatasetHistoGenerator(object):
                 data = self.getData()
                 if len(data) == 0:
                     return N.array([])
+                automin, automax = utils.chunkedRange(data)
                 if minval == 'Auto':
-                    minval = N.nanmin(data)
+                    minval = automin
                 if maxval == 'Auto':
-                    maxval = N.nanmax(data)
+                    maxval = automax
 
             if not islog:
                 delta = (maxval - minval) / numbins
@@ -85,14 +90,49 @@ class DatasetHistoGenerator(object):
                 delta = (lmax - lmin) / numbins
                 return N.exp( N.arange(numbins+1)*delta + lmin )
 
+    def inputVersion(self):
+        """Return an object which changes if the input data or
+        evaluation context may have changed."""
+
+        doc = self.document
+        dslist = _substituteDatasets(doc.data, self.inexpr, 'data')[1]
+        versions = [ (name, doc.datasetVersion(name)) for name in dslist ]
+        return (tuple(versions), self.binparams,
+                self.binmanual and tuple(self.binmanual))
+
+    def getCounts(self):
+        """Return bin edges, counts in each bin and number of values.
+
+        The counts are cached until the input or bin parameters change.
+        """
+
+        version = self.inputVersion()
+        cache = self.countcache
+        if ( cache is not None and cache[0] == version and
+             cache[1] is self.document.eval_context ):
+            return cache[2:]
+
+        data = self.getData()
+        if len(data) == 0:
+            binlocs = counts = N.array([])
+        else:
+            binlocs = self.binLocations()
+            spacing = None
+            if not self.binmanual:
+                spacing = ('linear', 'log')[bool(self.binparams[3])]
+            counts = utils.chunkedHistogram(data, binlocs, spacing=spacing)
+
+        self.countcache = ( version, self.document.eval_context,
+                            binlocs, counts, len(data) )
+        return binlocs, counts, len(data)
+
     def getBinLocations(self):
         """Return bin centre, -ve bin width, +ve bin width."""
 
-        if len(self.getData()) == 0:
+        binlocs, counts, numvals = self.getCounts()
+        if numvals == 0:
             return (N.array([]), None, None)
 
-        binlocs = self.binLocations()
-
         if self.binparams and self.binparams[3]:
             # log bins
             lbin = N.log(binlocs)
@@ -106,16 +146,14 @@ class DatasetHistoGenerator(object):
         perr = binlocs[1:] - data
         return data, nerr, perr
 
-    def getErrors(self, data, binlocs):
-        """Compute error bars if requried."""
-
-        hist, edges = N.histogram(data, bins=binlocs)
+    def getErrors(self, hist, edges, numvals):
+        """Compute error bars if requried, given counts in bins."""
 
         # calculate scaling values for error bars
         if self.method == 'density':
-            ratio = 1. / (hist.size*(edges[1]-edges[0]))
+            ratio = 1. / (hist.sum()*N.diff(edges))
         elif self.method == 'fractions':
-            ratio = 1. / data.size
+            ratio = 1. / numvals
         else:
             ratio = 1.
 
@@ -134,16 +172,16 @@ class DatasetHistoGenerator(object):
     def getBinVals(self):
         """Return results for each bin."""
 
-        data = self.getData()
-        if len(data) == 0:
+        binlocs, counts, numvals = self.getCounts()
+        if numvals == 0:
             return (N.array([]), None, None)
 
-        normed = self.method == 'density'
-        binlocs = self.binLocations()
-        hist, edges = N.histogram(data, bins=binlocs, normed=normed)
-        
-        if self.method == 'fractions':
-            hist = hist * (1./data.size)
+        if self.method == 'density':
+            hist = counts * (1./counts.sum()) / N.diff(binlocs)
+        elif self.method == 'fractions':
+            hist = counts * (1./numvals)
+        else:
+            hist = counts
 
         # if cumulative wanted
         if self.cumulative == 'smalltolarge':
@@ -152,7 +190,7 @@ class DatasetHistoGenerator(object):
             hist = N.cumsum(hist[::-1])[::-1]
 
         if self.errors:
-            nerr, perr = self.getErrors(data, binlocs)
+            nerr, perr = self.getErrors(counts, binlocs, numvals)
         else:
             nerr, perr = None, None
 
@@ -220,6 +258,10 @@ class DatasetHistoBins(Dataset):
         """Save dataset (counterpart does this)."""
         pass
 
+    def isDerived(self):
+        """Values are computed from the input expression."""
+        return True
+
     def linkedInformation(self):
         """Informating about linking."""
         return self.generator.linkedInformation() + _(" (bin positions)")
@@ -253,6 +295,10 @@ class DatasetHistoValues(Dataset):
         """Save dataset and its counterpart to a file."""
         self.generator.saveToFile(fileobj)
 
+    def isDerived(self):
+        """Values are computed from the input expression."""
+        return True
+
     def linkedInformation(self):
         """Informating about linking."""
         return self.generator.linkedInformation() + _(" (bin values)")
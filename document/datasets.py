@@ -20,6 +20,8 @@
 """Classes to represent datasets."""
 
 import re
+import copy
+import StringIO
 from itertools import izip
 
 import numpy as N
@@ -28,6 +30,8 @@ import veusz.qtall as qt4
 import veusz.utils as utils
 import veusz.setting as setting
 
+import painthelper
+
 def _(text, disambiguation=None, context="Datasets"):
     """Translate text."""
     return unicode(
@@ -115,6 +119,28 @@ def generateValidDatasetParts(*datasets):
             yield retn
         lastindex = index+1
 
+# number of values formatted at a time when writing datasets as text
+textchunksize = 65536
+
+def columnsAsTextChunks(cols, fmt, join):
+    """Yield the rows of values in the list of columns cols as text,
+    a chunk of rows at a time.
+
+    Each chunk is formatted with a single format operation, rather
+    than formatting each row separately.
+    """
+
+    if not cols:
+        return
+    rowformat = join.join([fmt]*len(cols)) + '\n'
+    length = min([len(c) for c in cols])
+    chunkrows = max(1, textchunksize // len(cols))
+
+    for start in xrange(0, length, chunkrows):
+        stop = min(start+chunkrows, length)
+        vals = N.column_stack([c[start:stop] for c in cols])
+        yield (rowformat*(stop-start)) % tuple(vals.ravel().tolist())
+
 def datasetNameToDescriptorName(name):
     """Return descriptor name for dataset."""
     if re.match('^[0-9A-Za-z_]+$', name):
@@ -209,6 +235,10 @@ class DatasetBase(object):
     def uiDataItemToQVariant(self, val):
         """Return val converted to QVariant."""
         return qt4.QVariant(float(val))
+
+    def uiDataItemsToQVariants(self, vals):
+        """Return list of vals converted to QVariants."""
+        return [self.uiDataItemToQVariant(v) for v in vals]
     
     def _getItemHelper(self, key):
         """Help get arguments to constructor."""
@@ -246,6 +276,11 @@ class DatasetBase(object):
         """Can dataset be unlinked?"""
         return self.linked is not None
 
+    def isDerived(self):
+        """Are the values computed from other datasets, so that they can
+        change without this dataset being modified?"""
+        return self.linked is None and self.canUnlink()
+
     def linkedInformation(self):
         """Return information about any linking for the user."""
         if self.linked is None:
@@ -265,6 +300,32 @@ class DatasetBase(object):
         """Return dataset as text (for use by user)."""
         return ''
 
+    def saveSnapshot(self, name):
+        """Save the dataset as it is now, later.
+
+        Returns (function, size), where function takes a file object
+        to save to and may be called in another thread, and size is
+        the rough length of the text it writes.
+
+        Datasets which hold their own values are copied cheaply, as
+        their arrays are replaced rather than modified in place. For
+        other datasets the text is generated immediately.
+        """
+        if type(self) in _snapshotclasses:
+            ds = copy.copy(self)
+            size = 0
+            if self.linked is None:
+                for col in self.columns:
+                    vals = getattr(self, col)
+                    if vals is not None:
+                        size += getattr(vals, 'size', len(vals)) * _savecharspervalue
+            return (lambda fileobj: ds.saveToFile(fileobj, name)), size
+
+        f = StringIO.StringIO()
+        self.saveToFile(f, name)
+        text = f.getvalue()
+        return (lambda fileobj: fileobj.write(text)), len(text)
+
 class Dataset2D(DatasetBase):
     '''Represents a two-dimensional dataset.'''
 
@@ -325,22 +386,21 @@ class Dataset2D(DatasetBase):
         fileobj.write("ImportString2D(%s, '''\n" % repr(name))
         fileobj.write("xrange %e %e\n" % self.xrange)
         fileobj.write("yrange %e %e\n" % self.yrange)
-        fileobj.write(self.datasetAsText(fmt='%e', join=' '))
+        for text in self.datasetAsTextChunks(fmt='%e', join=' '):
+            fileobj.write(text)
         fileobj.write("''')\n")
 
+    def datasetAsTextChunks(self, fmt='%g', join='\t'):
+        """Yield dataset as text, a chunk of rows at a time."""
+        # write rows backwards, so lowest y comes first
+        return columnsAsTextChunks(list(self.data[::-1].T), fmt, join)
+
     def datasetAsText(self, fmt='%g', join='\t'):
         """Return dataset as text.
         fmt is the format specifier to use
         join is the string to separate the items
         """
-        format = ((fmt+join) * (self.data.shape[1]-1)) + fmt + '\n'
-
-        # write rows backwards, so lowest y comes first
-        lines = []
-        for row in self.data[::-1]:
-            line = format % tuple(row)
-            lines.append(line)
-        return ''.join(lines)
+        return ''.join(self.datasetAsTextChunks(fmt=fmt, join=join))
 
     def userSize(self):
         """Return dimensions of dataset for user."""
@@ -540,26 +600,23 @@ class Dataset(DatasetBase):
             descriptor += ',-'
 
         fileobj.write( "ImportString(%s,'''\n" % repr(descriptor) )
-        fileobj.write( self.datasetAsText(fmt='%e', join=' ') )
+        for text in self.datasetAsTextChunks(fmt='%e', join=' '):
+            fileobj.write(text)
         fileobj.write( "''')\n" )
 
-    def datasetAsText(self, fmt='%g', join='\t'):
-        """Return data as text."""
+    def datasetAsTextChunks(self, fmt='%g', join='\t'):
+        """Yield data as text, a chunk of rows at a time."""
 
         # work out which columns to write
         cols = []
         for c in (self.data, self.serr, self.perr, self.nerr):
             if c is not None:
                 cols.append(c)
+        return columnsAsTextChunks(cols, fmt, join)
 
-        # format statement
-        format = (fmt + join) * (len(cols)-1) + fmt + '\n'
-
-        # do the conversion
-        lines = []
-        for line in izip(*cols):
-            lines.append( format % line )
-        return ''.join(lines)
+    def datasetAsText(self, fmt='%g', join='\t'):
+        """Return data as text."""
+        return ''.join(self.datasetAsTextChunks(fmt=fmt, join=join))
 
     def deleteRows(self, row, numrows):
         """Delete numrows rows starting from row.
@@ -571,7 +628,8 @@ class Dataset(DatasetBase):
             if coldata is not None:
                 retn[col] = coldata[row:row+numrows]
                 setattr(self, col, N.delete( coldata, N.s_[row:row+numrows] ))
-        
+
+        self._invalidpoints = None
         self.document.modifiedData(self)
         return retn
 
@@ -587,6 +645,7 @@ class Dataset(DatasetBase):
             if coldata is not None:
                 setattr(self, col, N.insert(coldata, [row]*numrows, data))
 
+        self._invalidpoints = None
         self.document.modifiedData(self)
 
     def returnCopy(self):
@@ -632,6 +691,10 @@ class DatasetDateTime(Dataset):
         """Return val converted to QVariant."""
         return qt4.QVariant(utils.dateFloatToString(val))
 
+    def uiDataItemsToQVariants(self, vals):
+        """Return list of vals converted to QVariants."""
+        return [qt4.QVariant(t) for t in utils.dateFloatsToStrings(vals)]
+
     def saveToFile(self, fileobj, name):
         '''Save data to file.
         '''
@@ -647,7 +710,7 @@ class DatasetDateTime(Dataset):
 
     def datasetAsText(self, fmt=None, join=None):
         """Return data as text."""
-        lines = [ utils.dateFloatToString(val) for val in self.data ]
+        lines = utils.dateFloatsToStrings(self.data)
         lines.append('')
         return '\n'.join(lines)
 
@@ -724,7 +787,8 @@ class DatasetText(DatasetBase):
         Returns deleted rows as a dict of {column:data, ...}
         """
         retn = {'data': self.data[row:row+numrows]}
-        del self.data[row:row+numrows]
+        # the list is replaced, as it may be shared with a snapshot
+        self.data = self.data[:row] + self.data[row+numrows:]
         
         self.document.modifiedData(self)
         return retn
@@ -736,8 +800,7 @@ class DatasetText(DatasetBase):
         data = rowdata.get('data', [])
 
         insdata = data + (['']*(numrows-len(data)))
-        for d in insdata[::-1]:
-            self.data.insert(row, d)
+        self.data = self.data[:row] + insdata + self.data[row:]
 
         self.document.modifiedData(self)
 
@@ -745,6 +808,11 @@ class DatasetText(DatasetBase):
         """Returns version of dataset with no linking."""
         return DatasetText(self.data)
 
+# datasets which can be saved later from a shallow copy
+_snapshotclasses = set((Dataset2D, Dataset, DatasetDateTime, DatasetText))
+# rough number of characters each value takes when saved
+_savecharspervalue = 14
+
 class DatasetExpressionException(DatasetException):
     """Raised if there is an error evaluating a dataset expression."""
     pass
@@ -755,21 +823,29 @@ dataexpr_split_re = re.compile(r'(`.*?`|[\.+\-*/\(\)\[\],<>=!|%^~& ])')
 dataexpr_quote_re = re.compile(r'^`.*`$')
 dataexpr_columns = {'data':True, 'serr':True, 'perr':True, 'nerr':True}
 
-def _substituteDatasets(datasets, expression, thispart):
-    """Substitute the names of datasets with calls to a function which will
-    evaluate them.
+# split expressions, keyed by (expression, part)
+_splitexprs = utils.LRUCache(1024)
 
-    Returns (new expression, list of substituted datasets)
+def _splitExpression(expression, thispart):
+    """Split expression into parts which could be dataset names.
 
-    This is horribly hacky, but python-2.3 can't use eval with dict subclass
+    Returns (list of bits of expression, list of (index of bit,
+    dataset name, dataset part)).
     """
 
+    key = (expression, thispart)
+    split = _splitexprs.get(key)
+    if split is not None:
+        return split
+
     # split apart the expression to look for dataset names
-    # re could be compiled if this gets slow
     bits = dataexpr_split_re.split(expression)
 
-    dslist = []
+    names = []
     for i, bit in enumerate(bits):
+        if not bit:
+            continue
+
         # test whether there's an _data, _serr or such at the end of the name
         part = thispart
 
@@ -783,6 +859,25 @@ def _substituteDatasets(datasets, expression, thispart):
                 part = bitbits.pop(-1)
             bit = '_'.join(bitbits)
 
+        names.append( (i, bit, part) )
+
+    split = _splitexprs[key] = (bits, names)
+    return split
+
+def _substituteDatasets(datasets, expression, thispart):
+    """Substitute the names of datasets with calls to a function which will
+    evaluate them.
+
+    Returns (new expression, list of substituted datasets)
+
+    This is horribly hacky, but python-2.3 can't use eval with dict subclass
+    """
+
+    bits, names = _splitExpression(expression, thispart)
+    bits = list(bits)
+
+    dslist = []
+    for i, bit, part in names:
         if bit in datasets:
             # replace name with a function to call
             bits[i] = "_DS_(%s, %s)" % (repr(bit), repr(part))
@@ -790,6 +885,12 @@ def _substituteDatasets(datasets, expression, thispart):
 
     return ''.join(bits), dslist
 
+def _compileDatasetExpression(datasets, expression, part):
+    """Substitute datasets in expression and compile it.
+    Returns a utils.CompiledExpression."""
+    return utils.compileExpression(
+        _substituteDatasets(datasets, expression, part)[0])
+
 def _evaluateDataset(datasets, dsname, dspart):
     """Return the dataset given.
 
@@ -806,7 +907,7 @@ def _evaluateDataset(datasets, dsname, dspart):
         raise DatasetExpressionException(
             'Internal error - invalid dataset part')
 
-_safeexpr = set()
+@painthelper.profileEvaluation
 def simpleEvalExpression(doc, expr, part='data'):
     """Evaluate expression and return data.
 
@@ -814,24 +915,17 @@ def simpleEvalExpression(doc, expr, part='data'):
     dataset parts which are evaluated by the expression
     """
 
-    expr = _substituteDatasets(doc.data, expr, part)[0]
+    expr = _compileDatasetExpression(doc.data, expr, part)
 
-    if expr not in _safeexpr:
-        if ( not setting.transient_settings['unsafe_mode'] and
-             utils.checkCode(expr, securityonly=True) ):
-            doc.log("Unsafe expression: %s\n" % expr)
-            return N.array([])
-
-    # for speed, track safe expressions
-    _safeexpr.add(expr)
+    if not setting.transient_settings['unsafe_mode'] and expr.problems:
+        doc.log("Unsafe expression: %s\n" % expr.text)
+        return N.array([])
 
-    env = doc.eval_context.copy()
     def evaluateDataset(dsname, dspart):
         return _evaluateDataset(doc.data, dsname, dspart)
 
-    env['_DS_'] = evaluateDataset
     try:
-        evalout = eval(expr, env)
+        evalout = expr.evaluate(doc.eval_context, {'_DS_': evaluateDataset})
     except Exception, ex:
         doc.log(unicode(ex))
         return N.array([])
@@ -859,8 +953,6 @@ class DatasetExpression(Dataset):
         self.expr['perr'] = perr
         self.parametric = parametric
 
-        self.cachedexpr = {}
-
         self.docchangeset = -1
         self.evaluated = {}
 
@@ -875,19 +967,17 @@ class DatasetExpression(Dataset):
     def _evaluatePart(self, expr, part):
         """Evaluate expression expr for part part."""
         # replace dataset names with calls
-        expr = _substituteDatasets(self.document.data, expr, part)[0]
+        expr = _compileDatasetExpression(self.document.data, expr, part)
 
-        # check expression for nasties if it has changed
-        if self.cachedexpr.get(part) != expr:
-            if ( not setting.transient_settings['unsafe_mode'] and
-                 utils.checkCode(expr, securityonly=True) ):
-                raise DatasetExpressionException(
-                    _("Unsafe expression '%s' in %s part of dataset") % (
-                        self.expr[part], part))
-            self.cachedexpr[part] = expr
+        # check expression for nasties
+        if not setting.transient_settings['unsafe_mode'] and expr.problems:
+            raise DatasetExpressionException(
+                _("Unsafe expression '%s' in %s part of dataset") % (
+                    self.expr[part], part))
 
-        # set up environment to evaluate expressions in
-        environment = self.document.eval_context.copy()
+        # variables to evaluate expression with, in addition to the
+        # document context
+        environment = {}
 
         # create dataset using parametric expression
         if self.parametric:
@@ -904,7 +994,7 @@ class DatasetExpression(Dataset):
 
         # actually evaluate the expression
         try:
-            result = eval(expr, environment)
+            result = expr.evaluate(self.document.eval_context, environment)
             evalout = N.array(result, N.float64)
 
             if len(evalout.shape) != 1:
@@ -932,6 +1022,7 @@ class DatasetExpression(Dataset):
 
         self.evaluated[part] = evalout
 
+    @painthelper.profileEvaluation
     def updateEvaluation(self):
         """Update evaluation of parts of dataset.
         Throws DatasetExpressionException if error
@@ -1149,9 +1240,6 @@ class Dataset2DXYZExpression(Dataset2D):
         self.expry = expry
         self.exprz = exprz
 
-        # cache x y and z expressions
-        self.cachedexpr = {}
-
     def evaluateDataset(self, dsname, dspart):
         """Return the dataset given.
         
@@ -1160,6 +1248,7 @@ class Dataset2DXYZExpression(Dataset2D):
         """
         return _evaluateDataset(self.document.data, dsname, dspart)
                     
+    @painthelper.profileEvaluation
     def evalDataset(self):
         """Return the evaluated dataset."""
         # return cached data if document unchanged
@@ -1168,29 +1257,27 @@ class Dataset2DXYZExpression(Dataset2D):
 
         evaluated = {}
 
-        environment = self.document.eval_context.copy()
-        environment['_DS_'] = self.evaluateDataset
+        environment = {'_DS_': self.evaluateDataset}
 
         # evaluate the x, y and z expressions
         for name in ('exprx', 'expry', 'exprz'):
-            expr = _substituteDatasets(self.document.data, getattr(self, name),
-                                       'data')[0]
+            expr = _compileDatasetExpression(
+                self.document.data, getattr(self, name), 'data')
 
-            # check expression if not checked before
-            if self.cachedexpr.get(name) != expr:
-                if ( not setting.transient_settings['unsafe_mode'] and
-                     utils.checkCode(expr, securityonly=True) ):
-                    raise DatasetExpressionException(
-                        "Unsafe expression '%s'" % (
-                            expr))
-                self.cachedexpr[name] = expr
+            # check expression for nasties
+            if ( not setting.transient_settings['unsafe_mode'] and
+                 expr.problems ):
+                raise DatasetExpressionException(
+                    "Unsafe expression '%s'" % (
+                        expr.text))
 
             try:
-                evaluated[name] = eval(expr, environment)
+                evaluated[name] = expr.evaluate(self.document.eval_context,
+                                                environment)
             except Exception, e:
                 raise DatasetExpressionException(
                     "Error evaluating expression: %s\n"
-                    "Error: %s" % (expr, unicode(e)) )
+                    "Error: %s" % (expr.text, unicode(e)) )
 
         minx, maxx, stepx, stepsx = getSpacing(evaluated['exprx'])
         miny, maxy, stepy, stepsy = getSpacing(evaluated['expry'])
@@ -1280,7 +1367,6 @@ class Dataset2DExpression(Dataset2D):
 
         self.expr = expr
         self.lastchangeset = -1
-        self.cachedexpr = None
 
         if utils.checkCode(expr, securityonly=True) is not None:
             raise DatasetExpressionException("Unsafe expression '%s'" % expr)
@@ -1312,39 +1398,36 @@ class Dataset2DExpression(Dataset2D):
             self.document.log(unicode(ex))
             return [0., 1.]
 
+    @painthelper.profileEvaluation
     def evalDataset(self):
         """Do actual evaluation."""
 
         if self.document.changeset == self.lastchangeset:
             return self._cacheddata
 
-        environment = self.document.eval_context.copy()
-
         def getdataset(dsname, dspart):
             """Return the dataset given in document."""
             return _evaluateDataset(self.document.data, dsname, dspart)
-        environment['_DS_'] = getdataset
 
         # substituted expression
-        expr, datasets = _substituteDatasets(self.document.data, self.expr,
-                                             'data')
+        subst, datasets = _substituteDatasets(self.document.data, self.expr,
+                                              'data')
+        expr = utils.compileExpression(subst)
 
-        # check expression if not checked before
-        if self.cachedexpr != expr:
-            if ( not setting.transient_settings['unsafe_mode'] and
-                 utils.checkCode(expr, securityonly=True) ):
-                raise DatasetExpressionException(
-                    _("Unsafe expression '%s'") % (
-                        expr))
-            self.cachedexpr = expr
+        # check expression for nasties
+        if not setting.transient_settings['unsafe_mode'] and expr.problems:
+            raise DatasetExpressionException(
+                _("Unsafe expression '%s'") % (
+                    subst))
 
         # do evaluation
         try:
-            evaluated = eval(expr, environment)
+            evaluated = expr.evaluate(self.document.eval_context,
+                                      {'_DS_': getdataset})
         except Exception, e:
             raise DatasetExpressionException(
                 _("Error evaluating expression: %s\n"
-                  "Error: %s") % (expr, str(e)) )
+                  "Error: %s") % (subst, str(e)) )
 
         # find 2d dataset dimensions
         dsdim = None
@@ -1420,14 +1503,13 @@ class Dataset2DXYFunc(Dataset2D):
             self.document.log(unicode(ex))
             return N.array([[]])
 
+    @painthelper.profileEvaluation
     def evalDataset(self):
         """Evaluate the 2d dataset."""
 
         if self.document.changeset == self.lastchangeset:
             return self.cacheddata
 
-        env = self.document.eval_context.copy()
-
         xarange = N.arange(self.xstep[0], self.xstep[1]+self.xstep[2],
                            self.xstep[2])
         yarange = N.arange(self.ystep[0], self.ystep[1]+self.ystep[2],
@@ -1436,10 +1518,10 @@ class Dataset2DXYFunc(Dataset2D):
         xstep = xarange[xstep]
         ystep = yarange[ystep]
 
-        env['x'] = xstep
-        env['y'] = ystep
+        expr = utils.compileExpression(self.expr)
         try:
-            data = eval(self.expr, env)
+            data = expr.evaluate(self.document.eval_context,
+                                 {'x': xstep, 'y': ystep})
         except Exception, e:
             raise DatasetExpressionException(
                 _("Error evaluating expression: %s\n"
@@ -1475,9 +1557,9 @@ class _DatasetPlugin(object):
         self.pluginmanager = manager
         self.pluginds = ds
 
+    @painthelper.profileEvaluation
     def getPluginData(self, attr):
-        self.pluginmanager.update()
-        return getattr(self.pluginds, attr)
+        return self.pluginmanager.getOutput(self.pluginds, attr)
 
     def linkedInformation(self):
         """Return information about how this dataset was created."""
@@ -22,6 +22,24 @@ import numpy as N
 import veusz.utils.vzdbus as vzdbus
 import commandinterpreter
 
+# type of numeric data returned as bytes
+bufferdtype = N.dtype(N.float64).str
+
+def _toBytes(a):
+    """Return numpy array as bytes in bufferdtype, or empty if None."""
+    if a is None:
+        return vzdbus.ByteArray('')
+    return vzdbus.ByteArray(N.asarray(a, dtype=bufferdtype).tostring())
+
+def _fromBytes(b, dtype, blanknone=True):
+    """Convert bytes in dtype to numpy array.
+    If blanknone is set, return None if there are no bytes."""
+    if not b:
+        if blanknone:
+            return None
+        return N.zeros(0)
+    return N.frombuffer(b, dtype=N.dtype(str(dtype))).astype(N.float64)
+
 class DBusInterface(vzdbus.Object):
     """DBus interface to Veusz document command interface."""
 
@@ -119,6 +137,31 @@ class DBusInterface(vzdbus.Object):
                  data[1][0], data[1][1], data[2][0], data[2][1],
                  list(data[0].flat) )
 
+    @vzdbus.method(dbus_interface=interface,
+                   in_signature='s', out_signature='sayayayay')
+    def GetData1DBuffer(self, datasetname):
+        """Get a numeric dataset as bytes. Returns
+        (dtype, data, symmetric error, negative error, positive error)
+        dtype is the numpy type of the values (e.g. '<f8').
+        Empty byte arrays are returned for missing errors.
+        """
+        data, serr, nerr, perr = self.ci.GetData(unicode(datasetname))
+        return ( bufferdtype, _toBytes(data), _toBytes(serr),
+                 _toBytes(nerr), _toBytes(perr) )
+
+    @vzdbus.method(dbus_interface=interface,
+                   in_signature='s', out_signature='iiddddsay')
+    def GetData2DBuffer(self, datasetname):
+        """Get a 2D dataset as bytes. Returns
+        (X dim, Y dim, rangex min, rangex max,
+         rangey min, rangey max, dtype,
+         data (Y dim rows of X dim values))
+        """
+        data = self.ci.GetData(unicode(datasetname))
+        return ( data[0].shape[1], data[0].shape[0],
+                 data[1][0], data[1][1], data[2][0], data[2][1],
+                 bufferdtype, _toBytes(data[0]) )
+
     @vzdbus.method(dbus_interface=interface,
                    in_signature='s', out_signature='as')
     def GetDataText(self, datasetname):
@@ -217,6 +260,28 @@ class DBusInterface(vzdbus.Object):
         if not poserr: poserr = None
         self.ci.SetData(unicode(name), data, symerr, negerr, poserr)
 
+    @vzdbus.method(dbus_interface=interface,
+                   in_signature='ssayayayay', byte_arrays=True)
+    def SetDataBuffer(self, name, dtype, data, symerr, negerr, poserr):
+        """Set a numeric dataset from bytes.
+        dtype is the numpy type of the values (e.g. '<f8').
+        Pass empty byte arrays for missing errors.
+        """
+        self.ci.SetData( unicode(name),
+                         _fromBytes(data, dtype, blanknone=False),
+                         _fromBytes(symerr, dtype), _fromBytes(negerr, dtype),
+                         _fromBytes(poserr, dtype) )
+
+    @vzdbus.method(dbus_interface=interface,
+                   in_signature='ssayii(dd)(dd)', byte_arrays=True)
+    def SetData2DBuffer(self, name, dtype, data, nx, ny, xrange, yrange):
+        """Set a 2D dataset from bytes.
+        dtype is the numpy type of the values (e.g. '<f8').
+        data are ny rows of nx values.
+        """
+        data = _fromBytes(data, dtype, blanknone=False).reshape(ny, nx)
+        self.ci.SetData2D(unicode(name), data, xrange=xrange, yrange=yrange)
+
     @vzdbus.method(dbus_interface=interface,
                    in_signature='ssssa{sv}')
     def SetData2DExpressionXYZ(self, name, xexpr, yexpr, zexpr, optargs):
@@ -34,6 +34,7 @@ import veusz.qtall as qt4
 import widgetfactory
 import datasets
 import painthelper
+import snapshot
 
 import veusz.utils as utils
 import veusz.setting as setting
@@ -72,10 +73,175 @@ def getSuitableParent(widgettype, initialwidget):
         parent = parent.parent
     return parent
 
+def _addEvalFuncOrConst(context, ctype, name, val, log):
+    """Add a custom function or constant to the evaluation context."""
+
+    if ctype == 'constant':
+        if not identifier_re.match(name):
+            log( _("Invalid constant name '%s'") % name )
+            return
+        defn = val
+    elif ctype == 'function':
+        m = function_re.match(name)
+        if not m:
+            log( _("Invalid function specification '%s'") % name )
+            return
+        name = m.group(1)
+        args = m.group(2)
+        defn = 'lambda %s: %s' % (args, val)
+
+    # evaluate, but we ignore any unsafe commands or exceptions
+    checked = utils.checkCode(defn)
+    if checked is not None:
+        log( _("Expression '%s' failed safe code test") % defn )
+        return
+    try:
+        context[name] = eval(defn, context)
+    except Exception, e:
+        log( _("Error evaluating '%s': '%s'") % (name, unicode(e)) )
+
+def _addEvalImport(context, module, val, log, safeimports):
+    """Add an import statement to the evaluation context."""
+
+    if module_re.match(module):
+        # work out what is safe to import
+        symbols = identifier_split_re.findall(val)
+        toimport = safeimports(module, symbols)
+        if toimport:
+            defn = 'from %s import %s' % (module, ', '.join(toimport))
+            try:
+                exec defn in context
+            except Exception:
+                log(_("Failed to import '%s' from module '%s'") %
+                    (', '.join(toimport), module))
+                return
+
+        delta = set(symbols)-set(toimport)
+        if delta:
+            log(_("Did not import '%s' from module '%s'") %
+                (', '.join(list(delta)), module))
+
+    else:
+        log( _("Invalid module name '%s'") % module )
+
+def _ignoreMessage(message):
+    """Default log for makeEvalContext."""
+
+def _noSafeImports(module, symbols):
+    """Default safeimports for makeEvalContext."""
+    return []
+
+def makeEvalContext(customs, log=None, safeimports=None):
+    """Return a safe environment where things can be evaluated,
+    containing numpy, some safe functions and the custom constants,
+    functions and imports in customs (colormaps are ignored).
+
+    log is called with messages about invalid custom definitions.
+    safeimports is called with a module name and list of symbols to
+    return those which may be imported (default is none).
+    """
+
+    if log is None:
+        log = _ignoreMessage
+    if safeimports is None:
+        safeimports = _noSafeImports
+
+    c = {}
+
+    # add numpy things
+    # we try to avoid various bits and pieces for safety
+    for name, val in N.__dict__.iteritems():
+        if ( (callable(val) or type(val)==float) and
+             name not in __builtins__ and
+             name[:1] != '_' and name[-1:] != '_' ):
+            c[name] = val
+
+    # safe functions
+    c['os_path_join'] = os.path.join
+    c['os_path_dirname'] = os.path.dirname
+    c['veusz_markercodes'] = tuple(utils.MarkerCodes)
+
+    # custom definitions
+    for ctype, name, val in customs:
+        name = name.strip()
+        if ctype == 'constant' or ctype == 'function':
+            _addEvalFuncOrConst(c, ctype, name, val.strip(), log)
+        elif ctype == 'import':
+            _addEvalImport(c, name, val, log, safeimports)
+        elif ctype != 'colormap':
+            raise ValueError, 'Invalid custom type'
+
+    return c
+
+class DocumentChange(object):
+    """A record of what has changed in the document since listeners
+    were last notified.
+
+    unknown: anything may have changed (e.g. new document, custom
+             definitions changed or a change which was not recorded)
+    datasets: set of names of datasets which were changed
+    datasetstructure: datasets were added, removed, renamed, or
+                      their tags or links changed
+    settings: set of paths of settings which were changed
+    widgets: set of paths of widgets which had settings changed
+    widgetstructure: widgets were added, removed, renamed or moved
+    """
+
+    def __init__(self):
+        self.unknown = False
+        self.datasets = set()
+        self.datasetstructure = False
+        self.settings = set()
+        self.widgets = set()
+        self.widgetstructure = False
+
+    def isEmpty(self):
+        """Has nothing been recorded?"""
+        return not ( self.unknown or self.datasets or self.datasetstructure
+                     or self.settings or self.widgetstructure )
+
+    def datasetChanged(self, name, structure=False):
+        """Record change to dataset name.
+        structure is set if the dataset was added, removed or renamed,
+        or its tags or links changed."""
+        self.datasets.add(name)
+        if structure:
+            self.datasetstructure = True
+
+    def settingChanged(self, setting):
+        """Record change to the value of setting."""
+        self.settings.add(setting.path)
+        obj = setting.parent
+        while obj is not None and not obj.isWidget():
+            obj = obj.parent
+        if obj is not None:
+            self.widgets.add(obj.path)
+
+    def widgetsChanged(self):
+        """Record widgets being added, removed, renamed or moved."""
+        self.widgetstructure = True
+
+    def datasetsChanged(self, names=None):
+        """May any of the datasets with names have changed?
+        If names is None, return whether any dataset may have changed."""
+        if self.unknown or self.datasetstructure:
+            return True
+        if names is None:
+            return len(self.datasets) != 0
+        return not self.datasets.isdisjoint(names)
+
+    def settingsChanged(self, paths):
+        """May any of the settings with the paths given have changed?"""
+        if self.unknown or self.widgetstructure:
+            return True
+        return not self.settings.isdisjoint(paths)
+
 class Document( qt4.QObject ):
     """Document class for holding the graph data.
 
     Emits: sigModified when the document has been modified
+           sigChanged when the document has been modified, with a
+             DocumentChange saying what has changed
            sigWiped when document is wiped
     """
 
@@ -85,10 +251,6 @@ class Document( qt4.QObject ):
         """Initialise the document."""
         qt4.QObject.__init__( self )
 
-        if not Document.pluginsloaded:
-            Document.loadPlugins()
-            Document.pluginsloaded = True
-
         # change tracking of document as a whole
         self.changeset = 0            # increased when the document changes
 
@@ -96,6 +258,9 @@ class Document( qt4.QObject ):
         self.datachangeset = 0        # increased whan any dataset changes
         self.datachangesets = dict()  # each ds has an associated change set
 
+        # changes since listeners were last notified
+        self.changes = DocumentChange()
+
         # map tags to dataset names
         self.datasettags = defaultdict(list)
 
@@ -128,6 +293,7 @@ class Document( qt4.QObject ):
         self.basewidget = widgetfactory.thefactory.makeWidget(
             'document', None, None)
         self.basewidget.document = self
+        self.changes.unknown = True
         self.setModified(False)
         self.emit( qt4.SIGNAL("sigWiped") )
 
@@ -278,10 +444,12 @@ class Document( qt4.QObject ):
 
     def setData(self, name, dataset):
         """Set data to val, with symmetric or negative and positive errors."""
+        isnew = name not in self.data
         self.data[name] = dataset
         dataset.document = self
         
         # update the change tracking
+        self.changes.datasetChanged(name, structure=isnew)
         cs = self.datachangesets.get(name, 0)
         self.datachangesets[name] = cs + 1
         self.datachangeset += 1
@@ -293,6 +461,7 @@ class Document( qt4.QObject ):
             del self.data[name]
             
             # don't remove the changeset tracker, in case this action is later undone
+            self.changes.datasetChanged(name, structure=True)
             self.datachangesets[name] += 1
             self.datachangeset += 1
             self.setModified()
@@ -301,6 +470,7 @@ class Document( qt4.QObject ):
         """The named dataset was modified"""
         for name, ds in self.data.iteritems():
             if ds is dataset:
+                self.changes.datasetChanged(name)
                 self.datachangesets[name] += 1
                 self.datachangeset += 1
                 self.setModified()
@@ -316,9 +486,11 @@ class Document( qt4.QObject ):
                 links.add(ds.linked)
         return list(links)
 
-    def reloadLinkedDatasets(self, filenames=None):
+    def reloadLinkedDatasets(self, filenames=None, tailfollow=False):
         """Reload linked datasets from their files.
         If filenames is a set(), only reload from these filenames
+        If tailfollow is True, only read data appended to files since
+        they were last read, where possible
 
         Returns a tuple of
         - List of datasets read
@@ -333,7 +505,7 @@ class Document( qt4.QObject ):
         # load in the files, merging the vars read and errors
         if links:
             for lf in links:
-                nread, nerrors = lf.reloadLinks(self)
+                nread, nerrors = lf.reloadLinks(self, tailfollow=tailfollow)
                 read += nread
                 errors.update(nerrors)
             self.setModified()
@@ -351,6 +523,7 @@ class Document( qt4.QObject ):
     def deleteDataset(self, name):
         """Remove the selected dataset."""
         del self.data[name]
+        self.changes.datasetChanged(name, structure=True)
         self.setModified()
 
     def renameDataset(self, oldname, newname):
@@ -361,12 +534,24 @@ class Document( qt4.QObject ):
         # transfer change set to new name
         self.datachangesets[newname] = self.datachangesets[oldname]
 
+        self.changes.datasetChanged(oldname, structure=True)
+        self.changes.datasetChanged(newname, structure=True)
         self.setModified()
 
     def getData(self, name):
         """Get data with name"""
         return self.data[name]
 
+    def datasetVersion(self, name):
+        """Return a value which changes if the dataset with name may
+        have changed, including if it is replaced or deleted."""
+        ds = self.data.get(name)
+        version = (id(ds), self.datachangesets.get(name))
+        if ds is not None and ds.isDerived():
+            # values of derived datasets can depend on other datasets
+            version += (self.changeset,)
+        return version
+
     def hasData(self, name):
         """Whether dataset is defined."""
         return name in self.data
@@ -382,12 +567,30 @@ class Document( qt4.QObject ):
         self.changeset += 1
 
         if len(self.suspendupdates) == 0:
+            changes, self.changes = self.changes, DocumentChange()
+            if ismodified and changes.isEmpty():
+                # modification was not recorded, so could be anything
+                changes.unknown = True
+
             self.emit( qt4.SIGNAL("sigModified"), ismodified )
+            if not changes.isEmpty():
+                self.emit( qt4.SIGNAL("sigChanged"), changes )
 
     def isModified(self):
         """Return whether modified flag set."""
         return self.modified
 
+    @classmethod
+    def loadPendingPlugins(kls):
+        """Load the plugins in the user's settings, if not done already.
+
+        This is delayed until a plugin registry is first needed, so that
+        documents can be created without paying for the plugins.
+        """
+        if not kls.pluginsloaded:
+            kls.pluginsloaded = True
+            kls.loadPlugins()
+
     @classmethod
     def loadPlugins(kls, pluginlist=None):
         """Load plugins and catch exceptions."""
@@ -482,35 +685,21 @@ class Document( qt4.QObject ):
     def saveToFile(self, fileobj):
         """Save the text representing a document to a file."""
 
-        self._writeFileHeader(fileobj, 'saved document')
-        
         # add file directory to import path if we know it
         reldirname = None
         if getattr(fileobj, 'name', False):
             reldirname = os.path.dirname( os.path.abspath(fileobj.name) )
-            fileobj.write('AddImportPath(%s)\n' % repr(reldirname))
-
-        # add custom definitions
-        self.saveCustomDefinitions(fileobj)
 
-        # save those datasets which are linked
-        # we do this first in case the datasets are overridden below
-        savedlinks = {}
-        for name, dataset in sorted(self.data.items()):
-            dataset.saveLinksToSavedDoc(fileobj, savedlinks,
-                                        relpath=reldirname)
-
-        # save the remaining datasets
-        for name, dataset in sorted(self.data.items()):
-            dataset.saveToFile(fileobj, name)
+        self.saveSnapshot(reldirname=reldirname).write(fileobj)
+        self.setModified(False)
 
-        # save tags of datasets
-        self.saveDatasetTags(fileobj)
+    def saveSnapshot(self, reldirname=None):
+        """Return a DocumentSnapshot of the document as it is now,
+        which can be saved later, e.g. in another thread.
 
-        # save the actual tree structure
-        fileobj.write(self.basewidget.getSaveText())
-        
-        self.setModified(False)
+        reldirname is the directory to save links relative to
+        """
+        return snapshot.DocumentSnapshot(self, reldirname=reldirname)
 
     def exportStyleSheet(self, fileobj):
         """Export the StyleSheet to a file."""
@@ -679,31 +868,6 @@ class Document( qt4.QObject ):
 
         return toimport
 
-    def _updateEvalContextImport(self, module, val):
-        """Add an import statement to the eval function context."""
-        if module_re.match(module):
-            # work out what is safe to import
-            symbols = identifier_split_re.findall(val)
-            toimport = self._processSafeImports(module, symbols)
-            if toimport:
-                defn = 'from %s import %s' % (module,
-                                              ', '.join(toimport))
-                try:
-                    exec defn in self.eval_context
-                except Exception:
-                    self.log(_("Failed to import '%s' from "
-                               "module '%s'") % (', '.join(toimport),
-                                                 module))
-                    return
-
-            delta = set(symbols)-set(toimport)
-            if delta:
-                self.log(_("Did not import '%s' from module '%s'") %
-                         (', '.join(list(delta)), module))
-
-        else:
-            self.log( _("Invalid module name '%s'") % module )
-
     def validateProcessColormap(self, colormap):
         """Validate and process a colormap value.
 
@@ -749,66 +913,30 @@ class Document( qt4.QObject ):
         else:
             self.colormaps[ unicode(name) ] = cmap
 
-    def _updateEvalContextFuncOrConst(self, ctype, name, val):
-        """Update a function or constant in eval function context."""
-
-        if ctype == 'constant':
-            if not identifier_re.match(name):
-                self.log( _("Invalid constant name '%s'") % name )
-                return
-            defn = val
-        elif ctype == 'function':
-            m = function_re.match(name)
-            if not m:
-                self.log( _("Invalid function specification '%s'") % name )
-                return
-            name = m.group(1)
-            args = m.group(2)
-            defn = 'lambda %s: %s' % (args, val)
-
-        # evaluate, but we ignore any unsafe commands or exceptions
-        checked = utils.checkCode(defn)
-        if checked is not None:
-            self.log( _("Expression '%s' failed safe code test") %
-                      defn )
-            return
-        try:
-            self.eval_context[name] = eval(defn, self.eval_context)
-        except Exception, e:
-            self.log( _("Error evaluating '%s': '%s'") %
-                      (name, unicode(e)) )
-
     def updateEvalContext(self):
         """To be called after custom constants or functions are changed.
         This sets up a safe environment where things can be evaluated
         """
-        
-        self.eval_context = c = {}
-
-        # add numpy things
-        # we try to avoid various bits and pieces for safety
-        for name, val in N.__dict__.iteritems():
-            if ( (callable(val) or type(val)==float) and
-                 name not in __builtins__ and
-                 name[:1] != '_' and name[-1:] != '_' ):
-                c[name] = val
-        
-        # safe functions
-        c['os_path_join'] = os.path.join
-        c['os_path_dirname'] = os.path.dirname
-        c['veusz_markercodes'] = tuple(utils.MarkerCodes)
 
-        # custom definitions
+        # anything may depend on the custom definitions
+        self.changes.unknown = True
+
+        self.eval_context = makeEvalContext(
+            self.customs, log=self.log, safeimports=self._processSafeImports)
         for ctype, name, val in self.customs:
-            name = name.strip()
-            if ctype == 'constant' or ctype == 'function':
-                self._updateEvalContextFuncOrConst(ctype, name, val.strip())
-            elif ctype == 'import':
-                self._updateEvalContextImport(name, val)
-            elif ctype == 'colormap':
-                self._updateEvalContextColormap(name, val)
-            else:
-                raise ValueError, 'Invalid custom type'
+            if ctype == 'colormap':
+                self._updateEvalContextColormap(name.strip(), val)
+
+    def allowedImports(self):
+        """Return dict of the modules of custom imports and the symbols
+        which may be imported from them."""
+        allowed = {}
+        for ctype, name, val in self.customs:
+            if ctype == 'import':
+                module = name.strip()
+                allowed[module] = self._processSafeImports(
+                    module, identifier_split_re.findall(val))
+        return allowed
 
     def customDict(self):
         """Return a dictionary mapping custom names to (idx, type, value)."""
@@ -31,13 +31,17 @@ try:
 except ImportError:
     hasemf = False
 
-import svg_export
-import selftest_export
 import painthelper
 
 # 1m in inch
 m_inch = 39.370079
 
+# PNG and TIFF images bigger than maxbitmapbytes are rendered and
+# written in horizontal bands of around bitmapbandbytes, to limit
+# memory use
+maxbitmapbytes = 128*1024*1024
+bitmapbandbytes = 16*1024*1024
+
 def _(text, disambiguation=None, context="Export"):
     """Translate text."""
     return unicode(
@@ -129,38 +133,57 @@ class Export(object):
         painter.restore()
         painter.end()
 
-    def exportBitmap(self, format):
-        """Export to a bitmap format."""
-
-        # get size for bitmap's dpi
-        dpi = self.bitmapdpi
-        size = self.doc.pageSize(self.pagenumber, dpi=(dpi,dpi))
+    def makeBitmapImage(self, width, height, format):
+        """Make an image to render a bitmap of format given into,
+        filled with the background color."""
 
-        # create real output image
         backqcolor = utils.extendedColorToQColor(self.backcolor)
         if format == '.png':
             # transparent output
-            image = qt4.QImage(size[0], size[1],
+            image = qt4.QImage(width, height,
                                qt4.QImage.Format_ARGB32_Premultiplied)
         else:
             # non transparent output
-            image = qt4.QImage(size[0], size[1],
+            image = qt4.QImage(width, height,
                                qt4.QImage.Format_RGB32)
             backqcolor.setAlpha(255)
 
-        image.setDotsPerMeterX(dpi*m_inch)
-        image.setDotsPerMeterY(dpi*m_inch)
+        image.setDotsPerMeterX(self.bitmapdpi*m_inch)
+        image.setDotsPerMeterY(self.bitmapdpi*m_inch)
         if backqcolor.alpha() == 0:
             image.fill(qt4.qRgba(0,0,0,0))
         else:
             image.fill(backqcolor.rgb())
+        return image
 
-        # paint to the image
+    def renderBitmap(self, image, size, yoffset=0):
+        """Render page of size given into image, where the top of the
+        image is at yoffset on the page."""
+
+        dpi = self.bitmapdpi
         painter = qt4.QPainter(image)
         painter.setRenderHint(qt4.QPainter.Antialiasing, self.antialias)
         painter.setRenderHint(qt4.QPainter.TextAntialiasing, self.antialias)
+        painter.translate(0, -yoffset)
         self.renderPage(size, (dpi,dpi), painter)
 
+    def exportBitmap(self, format):
+        """Export to a bitmap format."""
+
+        # get size for bitmap's dpi
+        dpi = self.bitmapdpi
+        size = self.doc.pageSize(self.pagenumber, dpi=(dpi,dpi))
+
+        if ( format in ('.png', '.tiff') and
+             size[0]*size[1]*4 > maxbitmapbytes ):
+            # too big to hold in memory at once
+            self.exportBitmapBands(format, size)
+            return
+
+        # paint to the image
+        image = self.makeBitmapImage(size[0], size[1], format)
+        self.renderBitmap(image, size)
+
         # write image to disk
         writer = qt4.QImageWriter()
         # format below takes extension without dot
@@ -176,6 +199,31 @@ class Export(object):
 
         writer.write(image)
 
+    def exportBitmapBands(self, format, size):
+        """Export a large PNG or TIFF bitmap by rendering the page
+        in horizontal bands, writing each band before rendering the
+        next."""
+
+        import bitmap_export
+
+        width, height = size
+        if format == '.png':
+            writer = bitmap_export.PNGStreamWriter(
+                self.filename, width, height, self.bitmapdpi, alpha=True)
+        else:
+            writer = bitmap_export.TIFFStreamWriter(
+                self.filename, width, height, self.bitmapdpi, alpha=False)
+
+        bandheight = max(bitmapbandbytes // (width*4), 1)
+        for y in xrange(0, height, bandheight):
+            image = self.makeBitmapImage(
+                width, min(bandheight, height-y), format)
+            self.renderBitmap(image, size, yoffset=y)
+            writer.writeRows( bitmap_export.imageToRGBA(image) )
+            del image
+
+        writer.close()
+
     def exportPS(self, ext):
         """Export to EPS or PDF format."""
 
@@ -242,9 +290,9 @@ class Export(object):
     def exportSVG(self):
         """Export document as SVG"""
 
-
         if qt4.PYQT_VERSION >= 0x40600:
             # custom paint devices don't work in old PyQt versions
+            import svg_export
 
             dpi = svg_export.dpi * 1.
             size = self.doc.pageSize(
@@ -275,6 +323,9 @@ class Export(object):
     def exportSelfTest(self):
         """Export document for testing"""
 
+        import svg_export
+        import selftest_export
+
         dpi = svg_export.dpi * 1.
         size = width, height = self.doc.pageSize(
             self.pagenumber, dpi=(dpi,dpi), integer=False)
@@ -0,0 +1,258 @@
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Fast loading of saved documents.
+
+Documents written by Document.saveToFile only contain calls of
+commands with literal arguments. Rather than executing them, these
+are parsed, and the widgets, settings and datasets are created
+directly, without making operations. Blocks of data written by
+ImportString are read in one go with numpy.
+
+If a document contains anything else, parseSavedDocument returns None
+and the document should be executed as normal.
+"""
+
+import re
+
+import numpy as N
+
+import veusz.utils as utils
+import veusz.setting as setting
+
+import datasets
+import widgetfactory
+
+# start of a block of data, e.g. ImportString('x(numeric)','''
+_blockstart_re = re.compile(r"^(ImportString2D|ImportString)\((.*),\s*(r?)'''$")
+
+# descriptors written by saveToFile for numeric and date datasets
+_descriptor_re = re.compile(r'''^(?P<name>[0-9A-Za-z_]+|`[^`]+`)
+                                \((?P<type>numeric|date)\)
+                                (?P<errs>(,\+-)?(,\+)?(,-)?)$''', re.VERBOSE)
+
+# prefix of names standing in for blocks of data when parsing
+_blockname = '_vsz_block_'
+
+def _splitBlocks(script):
+    """Replace blocks of data in script by names.
+    Returns (text, blocks), where blocks maps the names to the text
+    of the blocks."""
+
+    lines = []
+    blocks = {}
+    pos = 0
+    while pos < len(script):
+        end = script.find('\n', pos)
+        if end < 0:
+            end = len(script)
+        line = script[pos:end]
+
+        m = _blockstart_re.match(line)
+        if m is None:
+            lines.append(line)
+            pos = end+1
+            continue
+
+        # find end of block, which must be on a line of its own
+        close = script.find("\n''')", end)
+        after = close+5
+        if close < 0 or script[after:after+1] not in ('\n', ''):
+            lines.append(line)
+            pos = end+1
+            continue
+
+        # leave blocks with quotes or escapes to the python parser
+        block = script[end+1:close+1]
+        if "'''" in block or (not m.group(3) and '\\' in block):
+            lines.append(script[pos:after])
+            pos = after+1
+            continue
+
+        name = '%s%i' % (_blockname, len(blocks))
+        blocks[name] = block
+        lines.append('%s(%s, %s)' % (m.group(1), m.group(2), name))
+        pos = after+1
+
+    return '\n'.join(lines), blocks
+
+def _argValue(node, blocks):
+    """Get value of argument node."""
+    import ast
+    if isinstance(node, ast.Name) and node.id in blocks:
+        return blocks[node.id]
+    return ast.literal_eval(node)
+
+def parseSavedDocument(script):
+    """Parse the text of a saved document into a list of commands
+    (name, args, kwargs).
+
+    Returns None if the document contains anything other than calls
+    with literal arguments, or if the ast module is not available
+    (Python < 2.6).
+    """
+
+    try:
+        import ast
+    except ImportError:
+        return None
+
+    text, blocks = _splitBlocks(script)
+
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError, TypeError):
+        return None
+
+    commands = []
+    try:
+        for stmt in tree.body:
+            if ( not isinstance(stmt, ast.Expr) or
+                 not isinstance(stmt.value, ast.Call) ):
+                return None
+            call = stmt.value
+            if ( not isinstance(call.func, ast.Name) or
+                 call.starargs is not None or call.kwargs is not None ):
+                return None
+
+            args = tuple([_argValue(a, blocks) for a in call.args])
+            kwargs = dict([ (k.arg, _argValue(k.value, blocks))
+                            for k in call.keywords ])
+            commands.append( (call.func.id, args, kwargs) )
+    except ValueError:
+        # not a literal
+        return None
+
+    return commands
+
+def _add(interface, widgettype, **args_opt):
+    """Add widget without making an operation."""
+    at = interface.currentwidget
+    if 'widget' in args_opt:
+        at = interface.document.resolve(at, args_opt['widget'])
+        del args_opt['widget']
+    return widgetfactory.thefactory.makeWidget(widgettype, at, **args_opt).name
+
+def _set(interface, var, val):
+    """Set setting without making an operation."""
+    interface.currentwidget.prefLookup(var).set(val)
+
+def _setToReference(interface, var, val):
+    """Set setting to reference without making an operation."""
+    interface.currentwidget.prefLookup(var).set(setting.Reference(val))
+
+def _numericColumns(text, numcols):
+    """Read text containing rows of numcols numbers.
+    Returns 2D array or None if the text could not be read."""
+
+    nrows = text.count('\n')
+    vals = N.fromstring(text, dtype=N.float64, sep=' ')
+    if nrows == 0 or len(vals) != nrows*numcols:
+        return None
+    return vals.reshape(nrows, numcols)
+
+def _importString(interface, descriptor, dstring, useblocks=False):
+    """Read a saved numeric or date dataset directly, falling back
+    to ImportString."""
+
+    m = _descriptor_re.match(descriptor)
+    ds = None
+    if m is not None and not useblocks and dstring.endswith('\n'):
+        name = m.group('name').strip('`')
+        if m.group('type') == 'date':
+            lines = [l for l in dstring.split('\n') if l.strip()]
+            if lines:
+                ds = datasets.DatasetDateTime(
+                    data=utils.dateStringsToFloats(lines))
+        else:
+            errs = m.group('errs').split(',')[1:]
+            cols = _numericColumns(dstring, len(errs)+1)
+            if cols is not None:
+                cols = [c.copy() for c in cols.T]
+                vals = dict(zip(errs, cols[1:]))
+                ds = datasets.Dataset(data=cols[0],
+                                      serr=vals.get('+-'),
+                                      perr=vals.get('+'),
+                                      nerr=vals.get('-'))
+
+    if ds is None:
+        return interface.ImportString(descriptor, dstring, useblocks=useblocks)
+
+    interface.document.setData(name, ds)
+    return ([name], {})
+
+def _importString2D(interface, datasetnames, dstring, **args):
+    """Read a saved 2D dataset directly, falling back to ImportString2D."""
+
+    # saved datasets have an xrange and yrange line, then the rows
+    lines = dstring.split('\n', 2)
+    data = None
+    if ( isinstance(datasetnames, basestring) and not args and
+         len(lines) == 3 and lines[2].endswith('\n') ):
+        xr, yr = lines[0].split(), lines[1].split()
+        numcols = len(lines[2][:lines[2].find('\n')].split())
+        if ( len(xr) == 3 and xr[0] == 'xrange' and
+             len(yr) == 3 and yr[0] == 'yrange' and numcols > 0 ):
+            try:
+                xrng = (float(xr[1]), float(xr[2]))
+                yrng = (float(yr[1]), float(yr[2]))
+            except ValueError:
+                pass
+            else:
+                data = _numericColumns(lines[2], numcols)
+
+    if data is None:
+        return interface.ImportString2D(datasetnames, dstring, **args)
+
+    # rows are saved with the lowest y first
+    ds = datasets.Dataset2D(data[::-1].copy(), xrange=xrng, yrange=yrng)
+    interface.document.setData(datasetnames, ds)
+
+_fastcommands = {
+    'Add': _add,
+    'Set': _set,
+    'SetToReference': _setToReference,
+    'ImportString': _importString,
+    'ImportString2D': _importString2D,
+    }
+
+def runSavedCommands(commands, interface, env):
+    """Run the commands from parseSavedDocument.
+
+    Commands are looked up in the dict env. Those which are the
+    standard commands of interface are applied to the document
+    directly, without making operations.
+    """
+
+    try:
+        for name, args, kwargs in commands:
+            try:
+                func = env[name]
+            except KeyError:
+                raise NameError, "name '%s' is not defined" % name
+
+            if ( name in _fastcommands and not interface.verbose and
+                 func == getattr(interface, name) ):
+                _fastcommands[name](interface, *args, **kwargs)
+            else:
+                func(*args, **kwargs)
+    finally:
+        # changes made directly are not recorded, so anything may
+        # have changed
+        interface.document.changes.unknown = True
+        interface.document.setModified()
@@ -20,9 +20,164 @@
 """Classes for linked files"""
 
 import sys
+import os.path
+import re
+import codecs
+import hashlib
 
 import veusz.utils as utils
 
+# a line of text, ended by \n, \r\n or \r, or a final unended line
+_line_re = re.compile(r'[^\r\n]*(?:\r\n?|\n)|[^\r\n]+')
+
+def splitLines(text):
+    """Split text into lines, keeping the line endings.
+
+    Unlike unicode.splitlines, only \\n, \\r\\n and \\r end lines.
+    """
+    return _line_re.findall(text)
+
+def _lastLineEnd(raw):
+    """Return position after the last line ending in raw (0 if none)."""
+    return max(raw.rfind('\n'), raw.rfind('\r')) + 1
+
+class _TailFailed(Exception):
+    """Raised if appended data cannot be read, so a full reload is
+    required."""
+
+class _DatasetCollector(object):
+    """Stand in for a document, collecting the datasets set."""
+
+    def __init__(self):
+        self.data = {}
+
+    def setData(self, name, dataset):
+        self.data[name] = dataset
+
+class TailState(object):
+    """Record of how far a linked file has been read, so that data
+    appended to the file can be read without reparsing the whole file.
+
+    Only the position after the last complete line and any partial
+    last line are stored, with checksums of the start of the file and
+    the end of the read region. parser is a copy of the reader without
+    any values, to carry on parsing from the end of the file.
+    """
+
+    # number of bytes to check at start and end of read region to see
+    # whether the file has been rewritten
+    checksize = 4096
+
+    def __init__(self, filename, size, parser):
+        """Record state for the first size bytes read of filename.
+
+        Raises _TailFailed if the end of the last complete line cannot
+        be found near the end of the data read.
+        """
+
+        self.parser = parser
+
+        f = open(filename, 'rb')
+        try:
+            self.headsize = min(self.checksize, size)
+            head = f.read(self.headsize)
+            self.tailstart = max(0, size-self.checksize)
+            f.seek(self.tailstart)
+            tail = f.read(size-self.tailstart)
+        finally:
+            f.close()
+
+        if len(tail) != size-self.tailstart:
+            # file has shrunk since it was read
+            raise _TailFailed()
+
+        end = _lastLineEnd(tail)
+        if end == 0 and self.tailstart > 0:
+            # last line too long to be checked later
+            raise _TailFailed()
+
+        # we carry on after the last complete line
+        self.offset = self.tailstart + end
+        # incomplete last line, which was read as a line
+        self.partial = tail[end:]
+
+        self.headsig = self._signature(head)
+        self.tailsig = self._signature(tail[:end])
+
+    @staticmethod
+    def _signature(data):
+        return hashlib.md5(data).digest()
+
+    @staticmethod
+    def supportsEncoding(encoding):
+        """Can files in encoding be read from a byte offset after
+        a newline?"""
+        try:
+            name = codecs.lookup(encoding).name
+        except LookupError:
+            return False
+        return not (name.startswith('utf-16') or name.startswith('utf-32'))
+
+    def readAppended(self, filename):
+        """Return bytes of complete lines appended to the file since
+        the last read, updating the offset.
+
+        Raises _TailFailed if the file has been changed other than by
+        appending, or the partial last line read before has been
+        continued.
+        """
+
+        f = open(filename, 'rb')
+        try:
+            f.seek(0, 2)
+            if f.tell() < self.offset + len(self.partial):
+                # file has shrunk
+                raise _TailFailed()
+
+            f.seek(0)
+            head = f.read(self.headsize)
+            f.seek(self.tailstart)
+            tail = f.read(self.offset-self.tailstart)
+            partial = f.read(len(self.partial))
+            if ( self._signature(head) != self.headsig or
+                 self._signature(tail) != self.tailsig or
+                 partial != self.partial ):
+                # file has been rewritten
+                raise _TailFailed()
+
+            raw = f.read()
+        finally:
+            f.close()
+
+        if not raw:
+            # nothing appended
+            return ''
+
+        skip = 0
+        if partial:
+            # the partial line was read as a line, so can only carry
+            # on if the line has now been ended
+            if raw[:2] == '\r\n':
+                skip = 2
+            elif raw[:1] in ('\r', '\n'):
+                skip = 1
+            else:
+                raise _TailFailed()
+
+        # only use complete lines (later partial lines are read when
+        # they are completed)
+        end = skip + _lastLineEnd(raw[skip:])
+
+        # new region at end of read data to check later
+        region = tail + partial + raw[:end]
+        self.offset += len(partial) + end
+        oldstart = self.tailstart
+        self.tailstart = max(oldstart, self.offset-self.checksize)
+        self.tailsig = self._signature(region[self.tailstart-oldstart:])
+        self.partial = ''
+
+        return raw[skip:end]
+
 class LinkedFileBase(object):
     """A base class for linked files containing common routines."""
 
@@ -30,6 +185,9 @@ class LinkedFileBase(object):
         """Save parameters."""
         self.params = params
 
+        # TailState if the file can be followed for appended data
+        self.tailstate = None
+
     def createOperation(self):
         """Return operation to recreate self."""
         return None
@@ -77,8 +235,114 @@ class LinkedFileBase(object):
                 ds.linked = self
         return read
 
-    def reloadLinks(self, document):
-        """Reload links using an operation"""
+    def _setTailState(self, parser, size):
+        """Remember that size bytes of the file have been read, so
+        that parser can carry on reading data appended later."""
+
+        self.tailstate = None
+        p = self.params
+        if ( size is None or not os.path.isfile(p.filename) or
+             not TailState.supportsEncoding(p.encoding) ):
+            return
+        try:
+            self.tailstate = TailState(p.filename, size, parser)
+        except (_TailFailed, EnvironmentError):
+            pass
+
+    def _readAppendedDatasets(self, collector):
+        """Read data appended to the file since the last read, setting
+        the datasets for the appended values in collector.
+
+        Raises _TailFailed if this is not possible."""
+        raise _TailFailed()
+
+    def _canExtendDatasets(self, document, newdatasets):
+        """Can the existing datasets be extended by newdatasets?"""
+        for name, newds in newdatasets.iteritems():
+            ds = document.data.get(name)
+            if ds is None:
+                continue
+            if ds.linked is not self or type(ds) is not type(newds):
+                return False
+            for col in ds.columns:
+                # changes in error bars need a full reload
+                if (getattr(ds, col) is None) != (getattr(newds, col) is None):
+                    return False
+        return True
+
+    def _extendDatasets(self, document, newdatasets):
+        """Append the values of each dataset in newdatasets to the
+        existing dataset in document of the same name.
+        """
+
+        for name, newds in newdatasets.iteritems():
+            if len(newds.data) == 0:
+                continue
+
+            ds = document.data.get(name)
+            if ds is None:
+                # new dataset started in appended data
+                newds.linked = self
+                document.setData(name, newds)
+            elif ds.datatype == 'text':
+                ds.data = ds.data + list(newds.data)
+                document.modifiedData(ds)
+            else:
+                rowdata = {}
+                for col in ds.columns:
+                    newcol = getattr(newds, col)
+                    if newcol is not None:
+                        rowdata[col] = newcol
+                ds.insertRows(len(ds.data), len(newds.data), rowdata)
+
+    def reloadAppended(self, document):
+        """Reload only data appended to the file since the last read,
+        extending the existing datasets.
+
+        Returns (read, errors) as for reloadLinks, or None if the file
+        has to be read again in full.
+        """
+
+        if self.tailstate is None or not os.path.isfile(self.filename):
+            return None
+
+        collector = _DatasetCollector()
+        try:
+            self._readAppendedDatasets(collector)
+        except _TailFailed:
+            # reader state is no longer valid
+            self.tailstate = None
+            return None
+
+        if not self._canExtendDatasets(document, collector.data):
+            self.tailstate = None
+            return None
+
+        document.suspendUpdates()
+        try:
+            self._extendDatasets(document, collector.data)
+        finally:
+            document.enableUpdates()
+
+        read = [name for name, ds in document.data.iteritems()
+                if ds.linked is self]
+        return (read, self._appendedErrors())
+
+    def _appendedErrors(self):
+        """Conversion errors after appended read."""
+        return {}
+
+    def reloadLinks(self, document, tailfollow=False):
+        """Reload links using an operation
+
+        If tailfollow is set, only data appended to the file since it
+        was last read are parsed, if possible.
+        """
+
+        if tailfollow:
+            retn = self.reloadAppended(document)
+            if retn is not None:
+                return retn
 
         # get the operation for reloading
         op = self.createOperation()(self.params)
@@ -98,6 +362,12 @@ class LinkedFileBase(object):
                            if ds.linked is self])
             return ([], errors)
 
+        # keep the read position of the new import
+        for ds in tempdoc.data.itervalues():
+            if ds.linked is not None:
+                self.tailstate = ds.linked.tailstate
+                break
+
         # delete datasets which are linked and imported here
         self._deleteLinkedDatasets(document)
         # move datasets into document
@@ -121,6 +391,35 @@ class LinkedFile(LinkedFileBase):
         import operations
         return operations.OperationDataImport
 
+    def setTailState(self, reader, size):
+        """Remember that size bytes of the file were read by the
+        SimpleRead reader, if appended data can be read later."""
+        if not self.params.useblocks:
+            self._setTailState(reader.copyParseState(), size)
+
+    def _readAppendedDatasets(self, collector):
+        import simpleread
+        p = self.params
+        state = self.tailstate
+        raw = state.readAppended(p.filename)
+        lines = splitLines(raw.decode(p.encoding, 'ignore'))
+        stream = simpleread.FileStream(iter(lines))
+
+        reader = state.parser
+        reader.readAppendedData(stream)
+
+        # values in errors must line up with data
+        counts = {}
+        for name, vals in reader.datasets.iteritems():
+            counts.setdefault(name[:name.rfind('\0')], set()).add(len(vals))
+        if any([len(c) > 1 for c in counts.itervalues()]):
+            raise _TailFailed()
+
+        reader.setInDocument(collector, prefix=p.prefix, suffix=p.suffix)
+
+    def _appendedErrors(self):
+        return self.tailstate.parser.getInvalidConversions()
+
     def saveToFile(self, fileobj, relpath=None):
         """Save the link to the document file.
         If relpath is set, save links relative to path given
@@ -197,6 +496,29 @@ class LinkedFileCSV(LinkedFileBase):
         import operations
         return operations.OperationDataImportCSV
 
+    def setTailState(self, reader, size):
+        """Remember that size bytes of the file were read by the
+        ReadCSV reader, if appended data can be read later."""
+        if not self.params.readrows:
+            self._setTailState(reader.copyParseState(), size)
+
+    def _readAppendedDatasets(self, collector):
+        state = self.tailstate
+        raw = state.readAppended(self.params.filename)
+
+        reader = state.parser
+        reader.readAppendedData(raw)
+
+        # values in errors must line up with data, or the datasets
+        # would be padded differently to a full read
+        counts = {}
+        for name, vals in reader.data.iteritems():
+            counts.setdefault(name.split('\0')[0], set()).add(len(vals))
+        if any([len(c) > 1 for c in counts.itervalues()]):
+            raise _TailFailed()
+
+        reader.setData(collector)
+
     def saveToFile(self, fileobj, relpath=None):
         """Save the link to the document file."""
 
@@ -27,6 +27,7 @@ because some operations cannot restore references (e.g. add object)
 """
 
 import os.path
+import copy
 from itertools import izip
 
 import numpy as N
@@ -73,11 +74,13 @@ class OperationSettingSet(object):
         else:
             self.oldvalue = setting.get()
         setting.set(self.value)
+        document.changes.settingChanged(setting)
         
     def undo(self, document):
         """Return old value back..."""
         setting = document.resolveFullSettingPath(self.settingpath)
         setting.set(self.oldvalue)
+        document.changes.settingChanged(setting)
 
 class OperationSettingPropagate(object):
     """Propagate setting to other widgets."""
@@ -138,6 +141,7 @@ class OperationSettingPropagate(object):
 
             self.restorevals[s.path] = s.val
             s.set(self.val)
+            document.changes.settingChanged(s)
           
     def undo(self, document):
         """Undo all those changes."""
@@ -145,6 +149,7 @@ class OperationSettingPropagate(object):
         for setpath, setval in self.restorevals.iteritems():
             setting = document.resolveFullSettingPath(setpath)
             setting.set(setval)
+            document.changes.settingChanged(setting)
 
     def _recursiveGet(root, name, typename, outlist, maxlevels):
         """Add those widgets in root with name and type to outlist.
@@ -188,12 +193,14 @@ class OperationWidgetRename(object):
         self.oldname = widget.name
         widget.rename(self.newname)
         self.newpath = widget.path
+        document.changes.widgetsChanged()
         
     def undo(self, document):
         """Undo rename."""
         
         widget = document.resolveFullWidgetPath(self.newpath)
         widget.rename(self.oldname)
+        document.changes.widgetsChanged()
         
 class OperationWidgetDelete(object):
     """Delete widget."""
@@ -214,6 +221,7 @@ class OperationWidgetDelete(object):
         self.oldparentpath = oldparent.path
         self.oldindex = oldparent.children.index(self.oldwidget)
         oldparent.removeChild(self.oldwidget.name)
+        document.changes.widgetsChanged()
         
     def undo(self, document):
         """Restore deleted widget."""
@@ -221,6 +229,7 @@ class OperationWidgetDelete(object):
         oldparent = document.resolveFullWidgetPath(self.oldparentpath)
         self.oldwidget.parent = oldparent
         oldparent.addChild(self.oldwidget, index=self.oldindex)
+        document.changes.widgetsChanged()
 
 class OperationWidgetsDelete(object):
     """Delete mutliple widget."""
@@ -259,6 +268,7 @@ class OperationWidgetsDelete(object):
             self.oldparentpaths.append( oldparent.path )
             self.oldindexes.append( oldparent.children.index(self.oldwidgets[-1]) )
             oldparent.removeChild(self.oldwidgets[-1].name)
+        document.changes.widgetsChanged()
 
     def undo(self, document):
         """Restore deleted widget."""
@@ -267,6 +277,7 @@ class OperationWidgetsDelete(object):
         for i in xrange(len(self.oldwidgets)-1,-1,-1):
             oldparent = document.resolveFullWidgetPath(self.oldparentpaths[i])
             oldparent.addChild(self.oldwidgets[i], index=self.oldindexes[i])
+        document.changes.widgetsChanged()
         
 class OperationWidgetMoveUpDown(object):
     """Move a widget up or down in the hierarchy."""
@@ -289,6 +300,7 @@ class OperationWidgetMoveUpDown(object):
         parent = widget.parent
         self.suceeded = parent.moveChild(widget, self.direction)
         self.newpath = widget.path
+        document.changes.widgetsChanged()
     
     def undo(self, document):
         """Move it back."""
@@ -296,6 +308,7 @@ class OperationWidgetMoveUpDown(object):
             widget = document.resolveFullWidgetPath(self.newpath)
             parent = widget.parent
             parent.moveChild(widget, -self.direction)
+            document.changes.widgetsChanged()
             
 class OperationWidgetMove(object):
     """Move a widget arbitrarily in the hierarchy."""
@@ -350,6 +363,7 @@ class OperationWidgetMove(object):
                 child.name = child.chooseName()
 
         self.newchildpath = child.path
+        document.changes.widgetsChanged()
 
     def undo(self, document):
         """Undo move."""
@@ -367,6 +381,7 @@ class OperationWidgetMove(object):
         # restore name
         if self.oldname is not None:
             child.name = self.oldname
+        document.changes.widgetsChanged()
 
 class OperationWidgetAdd(object):
     """Add a widget of specified type to parent."""
@@ -405,6 +420,7 @@ class OperationWidgetAdd(object):
                                                 index=self.index,
                                                 **self.defaultvals)
         self.createdname = w.name
+        document.changes.widgetsChanged()
         return w
         
     def undo(self, document):
@@ -412,6 +428,7 @@ class OperationWidgetAdd(object):
         
         parent = document.resolveFullWidgetPath(self.parentpath)
         parent.removeChild(self.createdname)
+        document.changes.widgetsChanged()
 
 ###############################################################################
 # Dataset operations
@@ -520,10 +537,12 @@ class OperationDatasetUnlinkFile(object):
         dataset = document.data[self.datasetname]
         self.oldfilelink = dataset.linked
         dataset.linked = None
+        document.changes.datasetChanged(self.datasetname, structure=True)
         
     def undo(self, document):
         dataset = document.data[self.datasetname]
         dataset.linked = self.oldfilelink
+        document.changes.datasetChanged(self.datasetname, structure=True)
 
 class OperationDatasetUnlinkRelation(object):
     """Remove association between dataset and another dataset.
@@ -788,6 +807,7 @@ class OperationDatasetUnlinkByFile(object):
             if ds.linked is not None and ds.linked.filename == self.filename:
                 self.oldlinks[name] = ds.linked
                 ds.linked = None
+                document.changes.datasetChanged(name, structure=True)
 
     def undo(self, document):
         """Restore links."""
@@ -796,6 +816,8 @@ class OperationDatasetUnlinkByFile(object):
                 document.data[name].linked = link
             except KeyError:
                 pass
+            else:
+                document.changes.datasetChanged(name, structure=True)
 
 class OperationDatasetDeleteByFile(object):
     """Delete all datasets associated with file."""
@@ -871,6 +893,7 @@ class OperationDataImportBase(object):
         if self.params.tags:
             for n in self.outdatasets:
                 document.data[n].tags.update(self.params.tags)
+                document.changes.datasetChanged(n, structure=True)
 
     def undo(self, document):
         """Undo import."""
@@ -908,8 +931,8 @@ class OperationDataImport(OperationDataImportBase):
         p = self.params
         # open stream to import data from
         if p.filename is not None:
-            stream = simpleread.FileStream(
-                utils.openEncoding(p.filename, p.encoding))
+            f = utils.openEncoding(p.filename, p.encoding)
+            stream = simpleread.FileStream(f)
         elif p.datastr is not None:
             stream = simpleread.StringStream(p.datastr)
         else:
@@ -925,6 +948,8 @@ class OperationDataImport(OperationDataImportBase):
         if p.linked:
             assert p.filename
             LF = linked.LinkedFile(p)
+            # size read, so that appended data can be read later
+            LF.setTailState(self.simpleread, f.tell())
 
         # actually set the data in the document
         self.outdatasets = self.simpleread.setInDocument(
@@ -945,6 +970,7 @@ class OperationDataImportCSV(OperationDataImportBase):
         LF = None
         if self.params.linked:
             LF = linked.LinkedFileCSV(self.params)
+            LF.setTailState(csvr, csvr.bytesread)
         
         # set the data
         self.outdatasets = csvr.setData(document, linkedfile=LF)
@@ -1087,6 +1113,7 @@ class OperationDataImportPlugin(OperationDataImportBase):
     def doImport(self, document):
         """Do import."""
 
+        document.loadPendingPlugins()
         pluginnames = [p.name for p in plugins.importpluginregistry]
         plugin = plugins.importpluginregistry[
             pluginnames.index(self.params.plugin)]
@@ -1207,11 +1234,13 @@ class OperationDataTag(object):
             if self.tag not in existing:
                 existing.add(self.tag)
                 self.removetags.append(name)
+                document.changes.datasetChanged(name, structure=True)
 
     def undo(self, document):
         """Remove tags, if not previously present."""
         for name in self.removetags:
             document.data[name].tags.remove(self.tag)
+            document.changes.datasetChanged(name, structure=True)
 
 class OperationDataUntag(object):
     """Add a tag to a list of datasets."""
@@ -1227,11 +1256,13 @@ class OperationDataUntag(object):
         """Add new tags, if required."""
         for name in self.datasetnames:
             document.data[name].tags.remove(self.tag)
+            document.changes.datasetChanged(name, structure=True)
 
     def undo(self, document):
         """Remove tags, if not previously present."""
         for name in self.datasetnames:
             document.data[name].tags.add(self.tag)
+            document.changes.datasetChanged(name, structure=True)
 
 ###############################################################################
 # Alter dataset
@@ -1281,7 +1312,9 @@ class OperationDatasetSetVal(object):
     def do(self, document):
         """Set the value."""
         ds = document.data[self.datasetname]
-        datacol = getattr(ds, self.columnname)
+        # values are changed in a copy, as the existing column may be
+        # shared with a snapshot of the document being saved
+        datacol = copy.copy(getattr(ds, self.columnname))
         self.oldval = datacol[self.row]
         datacol[self.row] = self.val
         ds.changeValues(self.columnname, datacol)
@@ -1289,7 +1322,7 @@ class OperationDatasetSetVal(object):
     def undo(self, document):
         """Restore the value."""
         ds = document.data[self.datasetname]
-        datacol = getattr(ds, self.columnname)
+        datacol = copy.copy(getattr(ds, self.columnname))
         datacol[self.row] = self.oldval
         ds.changeValues(self.columnname, datacol)
     
@@ -1309,12 +1342,14 @@ class OperationDatasetSetVal2D(object):
         """Set the value."""
         ds = document.data[self.datasetname]
         self.oldval = ds.data[self.row, self.col]
+        ds.data = ds.data.copy()
         ds.data[self.row, self.col] = self.val
         document.modifiedData(ds)
 
     def undo(self, document):
         """Restore the value."""
         ds = document.data[self.datasetname]
+        ds.data = ds.data.copy()
         ds.data[self.row, self.col] = self.oldval
         document.modifiedData(ds)
 
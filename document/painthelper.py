@@ -19,6 +19,9 @@
 """Helper for doing the plotting of the document.
 """
 
+import time
+import threading
+
 import veusz.qtall as qt4
 import veusz.setting as setting
 
@@ -50,6 +53,57 @@ class DrawState(object):
         # list of child widgets states
         self.children = []
 
+class DrawProfile(object):
+    """Statistics of drawing a widget, recorded if profiling."""
+
+    def __init__(self, widget):
+        self.path = widget.path
+        self.typename = widget.typename
+
+        # time drawing widget, including and excluding its children
+        self.drawtime = 0.
+        self.selftime = 0.
+        # time evaluating datasets and expressions
+        self.evaltime = 0.
+
+        # number of items painted and paint operations recorded, if known
+        self.primitives = None
+        self.records = None
+
+    def asDict(self):
+        """Return statistics as a dict."""
+        return {
+            'path': self.path, 'type': self.typename,
+            'drawtime': self.drawtime, 'selftime': self.selftime,
+            'evaltime': self.evaltime,
+            'primitives': self.primitives, 'records': self.records,
+            }
+
+# the DrawProfile of the widget being drawn in each thread, if profiling
+_evalstate = threading.local()
+
+def profileEvaluation(func):
+    """Decorator for functions which evaluate datasets or expressions,
+    adding the time taken to the profile of the widget being drawn."""
+
+    def wrapper(*args, **argsv):
+        profile = getattr(_evalstate, 'profile', None)
+        if profile is None:
+            return func(*args, **argsv)
+
+        # nested evaluations are not counted again
+        _evalstate.profile = None
+        start = time.time()
+        try:
+            return func(*args, **argsv)
+        finally:
+            profile.evaltime += time.time() - start
+            _evalstate.profile = profile
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
 class PaintHelper(object):
     """Helper used when painting widgets.
 
@@ -59,13 +113,16 @@ class PaintHelper(object):
     """
 
     def __init__(self, pagesize, scaling=1., dpi=(100, 100),
-                 directpaint=None):
+                 directpaint=None, profile=False):
         """Initialise using page size (tuple of pixelw, pixelh).
 
         If directpaint is set to a painter, use this directly rather
         than creating separate layers for rendering later. The user
         will need to call restore() on the painter before ending, if
         using this mode, however.
+
+        If profile is set, a DrawProfile is recorded for each widget
+        drawn, in the list profiles.
         """
 
         self.dpi = dpi
@@ -86,6 +143,10 @@ class PaintHelper(object):
         # state for root widget
         self.rootstate = None
 
+        # profiles of widgets drawn, and those being drawn
+        self.profiles = [] if profile else None
+        self.profilestack = []
+
     @property
     def maxsize(self):
         """Return maximum page dimension (using PaintHelper's DPI)."""
@@ -135,6 +196,38 @@ class PaintHelper(object):
 
         return p
 
+    def drawWidget(self, widget, parentposn, outerbounds=None):
+        """Draw widget within parentposn, returning its bounds.
+        Widgets should use this to draw their children."""
+
+        if self.profiles is None:
+            return widget.draw(parentposn, self, outerbounds=outerbounds)
+
+        profile = DrawProfile(widget)
+        self.profiles.append(profile)
+        self.profilestack.append(profile)
+        oldevalprofile = getattr(_evalstate, 'profile', None)
+        _evalstate.profile = profile
+
+        start = time.time()
+        try:
+            return widget.draw(parentposn, self, outerbounds=outerbounds)
+        finally:
+            profile.drawtime = time.time() - start
+            profile.selftime += profile.drawtime
+            _evalstate.profile = oldevalprofile
+            self.profilestack.pop()
+            if self.profilestack:
+                self.profilestack[-1].selftime -= profile.drawtime
+
+            state = self.states.get(widget)
+            if state is not None and not self.directpaint:
+                rec = state.record
+                if hasattr(rec, 'drawItemCount'):
+                    profile.primitives = rec.drawItemCount()
+                if hasattr(rec, 'elementCount'):
+                    profile.records = rec.elementCount()
+
     def setControlGraph(self, widget, cgis):
         """Records the control graph list for the widget given."""
         self.states[widget].cgis = cgis
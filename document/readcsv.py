@@ -20,6 +20,9 @@
 in an easy-to-use manner."""
 
 import re
+import copy
+import cStringIO
+
 import numpy as N
 
 import datasets
@@ -109,6 +112,9 @@ class ReadCSV(object):
         # created datasets. Each name is associated with a list
         self.data = {}
 
+        # number of bytes of the file read, if known
+        self.bytesread = None
+
     def _generateName(self, column):
         """Generate a name for a column."""
         if self.params.readrows:
@@ -276,8 +282,11 @@ class ReadCSV(object):
                 if not ok:
                     raise ValueError
             elif ctype == 'date':
+                # keep the text, converting all the dates in setData
                 m = self.datere.match(col)
-                v = utils.dateREMatchToDate(m)
+                if m is None or m.lastindex is None:
+                    raise ValueError
+                v = col
             elif ctype == 'string':
                 v = col
             else:
@@ -290,22 +299,50 @@ class ReadCSV(object):
             # conversion succeeded - append number to data
             self.data[self.colnames[colnum]].append(v)
 
-    def readData(self):
-        """Read the data into the document."""
+    def _makeReader(self, source):
+        """Make an iterator over the rows (or columns) of source, a
+        filename or an opened file."""
 
         par = self.params
 
-        # open the csv file
-        csvf = utils.UnicodeCSVReader( par.filename,
+        csvf = utils.UnicodeCSVReader( source,
                                        delimiter=par.delimiter,
                                        quotechar=par.textdelimiter,
                                        encoding=par.encoding )
 
         # make in iterator for the file
         if par.readrows:
-            it = _FileReaderRows(csvf)
+            return _FileReaderRows(csvf)
+        else:
+            return _FileReaderCols(csvf)
+
+    def _readLines(self, it):
+        """Process each line (or column) from iterator it."""
+
+        while True:
+            try:
+                line = it.next()
+            except StopIteration:
+                break
+
+            # iterate over items on line
+            for colnum, col in enumerate(line):
+                try:
+                    self._handleVal(colnum, col)
+                except _NextValue:
+                    pass
+
+    def readData(self):
+        """Read the data into the document."""
+
+        par = self.params
+
+        # open the csv file
+        if par.filename == '{clipboard}':
+            source = par.filename
         else:
-            it = _FileReaderCols(csvf)
+            source = open(par.filename, 'rb')
+        it = self._makeReader(source)
 
         # ignore rows (at top), if requested
         for i in xrange(par.rowsignore):
@@ -327,18 +364,52 @@ class ReadCSV(object):
         self.colblanks = {}
 
         # iterate over each line (or column)
-        while True:
-            try:
-                line = it.next()
-            except StopIteration:
-                break
+        self._readLines(it)
+
+        # needed to continue reading appended rows
+        self.rowmaxlen = getattr(it, 'maxlen', 0)
+        if source is not par.filename:
+            self.bytesread = source.tell()
+            source.close()
+
+    def copyParseState(self):
+        """Return a copy of this reader without the values read, which
+        can continue reading appended data with readAppendedData."""
+
+        reader = copy.copy(self)
+        reader.data = dict([(name, []) for name in self.data])
+        for attr in ('colnames', 'coltypes', 'nametypes', 'colignore',
+                     'colblanks'):
+            setattr(reader, attr, copy.copy(getattr(self, attr)))
+        return reader
+
+    def readAppendedData(self, raw):
+        """Continue reading rows from raw bytes appended to the file
+        previously read by readData (not possible if reading rows).
+
+        Only the values read in this call are kept, so that they can
+        be appended to existing datasets.
+        """
 
-            # iterate over items on line
-            for colnum, col in enumerate(line):
-                try:
-                    self._handleVal(colnum, col)
-                except _NextValue:
-                    pass
+        for name in self.data:
+            self.data[name] = []
+
+        it = self._makeReader(cStringIO.StringIO(raw))
+        it.maxlen = self.rowmaxlen
+        self._readLines(it)
+        self.rowmaxlen = it.maxlen
+
+    def _convertDates(self, vals):
+        """Convert list of date text and numbers to an array of dates."""
+        if vals is None:
+            return None
+        out = N.array([ (v, N.nan)[isinstance(v, basestring)]
+                        for v in vals ], dtype=N.float64)
+        idx = [ i for i, v in enumerate(vals) if isinstance(v, basestring) ]
+        if idx:
+            out[idx] = utils.dateStringsToFloats(
+                [vals[i] for i in idx], self.datere)
+        return out
 
     def setData(self, document, linkedfile=None):
         """Set the read-in datasets in the document."""
@@ -359,6 +430,11 @@ class ReadCSV(object):
             for k in (name, name+'\0+-', name+'\0+', name+'\0-'):
                 data.append( self.data.get(k, None) )
 
+            # convert text of dates
+            dstype = self.nametypes[name]
+            if dstype == 'date':
+                data = [ self._convertDates(d) for d in data ]
+
             # make them have a maximum length by adding NaNs
             maxlen = max([len(x) for x in data if x is not None])
             for i in range(len(data)):
@@ -367,7 +443,6 @@ class ReadCSV(object):
                         ( data[i], N.zeros(maxlen-len(data[i]))*N.nan ) )
 
             # create dataset
-            dstype = self.nametypes[name]
             if dstype == 'string':
                 ds = datasets.DatasetText(data=data[0], linked=linkedfile)
             elif dstype == 'date':
@@ -0,0 +1,321 @@
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""A cache on disk of drawn pages.
+
+Entries are keyed on a hash of most of what determines how a page
+looks: the settings of the page and its widgets, the document
+settings and stylesheet, the custom definitions, the values of the
+datasets named in the page settings, any files it reads, and the
+output parameters given (e.g. size, dpi and format).
+
+The key does not cover everything (e.g. datasets used indirectly,
+or the date and time), so a cached page may be out of date. The cache
+is therefore only used to show a page in the plot window while it is
+drawn again, and never for exported files.
+
+The cache is optional, enabled by the plot_rendercache setting, and
+holds at most plot_rendercache_size megabytes.
+"""
+
+import os
+import os.path
+import getpass
+import hashlib
+import tempfile
+import threading
+import weakref
+
+import numpy as N
+
+import veusz.qtall as qt4
+import veusz.utils as utils
+import veusz.setting as setting
+
+class RenderCache(object):
+    """Files stored in a directory, named by their keys.
+
+    When the total size of the files is more than maxsize bytes, the
+    least recently used are removed. The modification time of each
+    file is the time it was last used, so that the order is kept
+    between sessions.
+
+    This is safe to use from several threads.
+    """
+
+    def __init__(self, dirname, maxsize):
+        self.dirname = dirname
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+
+        # sizes of files keyed on name, and names least recently
+        # used first (read when needed)
+        self.entries = None
+        self.order = None
+
+        # whether the directory can be used (checked when needed)
+        self.usable = False
+
+    def _checkDirectory(self):
+        """Create the cache directory, readable only by the user, if
+        it does not exist. Returns whether the directory can be used:
+        it must not be owned or writable by other users."""
+
+        try:
+            if not os.path.isdir(self.dirname):
+                os.makedirs(self.dirname, 0700)
+            st = os.stat(self.dirname)
+        except EnvironmentError:
+            return False
+
+        if hasattr(os, 'getuid'):
+            return st.st_uid == os.getuid() and not (st.st_mode & 022)
+        return True
+
+    def _readEntries(self):
+        """Read the files in the cache directory, if not done already."""
+
+        if self.entries is not None:
+            return
+
+        self.usable = self._checkDirectory()
+        filenames = []
+        if self.usable:
+            try:
+                filenames = os.listdir(self.dirname)
+            except EnvironmentError:
+                pass
+
+        files = []
+        for fn in filenames:
+            if fn.endswith('.tmp'):
+                continue
+            try:
+                st = os.stat( os.path.join(self.dirname, fn) )
+            except EnvironmentError:
+                continue
+            files.append( (st.st_mtime, fn, st.st_size) )
+        files.sort()
+
+        self.entries = dict( [(fn, size) for mtime, fn, size in files] )
+        self.order = [fn for mtime, fn, size in files]
+
+    def _trim(self):
+        """Remove least recently used files until below the maximum size."""
+
+        total = sum(self.entries.itervalues())
+        while self.order and total > self.maxsize:
+            fn = self.order.pop(0)
+            total -= self.entries.pop(fn)
+            try:
+                os.unlink( os.path.join(self.dirname, fn) )
+            except EnvironmentError:
+                pass
+
+    def get(self, key):
+        """Return contents of entry with key, or None if not cached."""
+
+        self.lock.acquire()
+        try:
+            self._readEntries()
+            if key not in self.entries:
+                return None
+
+            filename = os.path.join(self.dirname, key)
+            try:
+                f = open(filename, 'rb')
+                try:
+                    data = f.read()
+                finally:
+                    f.close()
+                # mark as used
+                os.utime(filename, None)
+            except EnvironmentError:
+                del self.entries[key]
+                self.order.remove(key)
+                return None
+
+            self.order.remove(key)
+            self.order.append(key)
+            return data
+        finally:
+            self.lock.release()
+
+    def put(self, key, data):
+        """Store data in cache with key."""
+
+        if len(data) > self.maxsize:
+            return
+
+        self.lock.acquire()
+        try:
+            self._readEntries()
+            if not self.usable:
+                return
+
+            try:
+                # write to temporary file, so entries are never partial
+                fd, tempname = tempfile.mkstemp(suffix='.tmp',
+                                                dir=self.dirname)
+                f = os.fdopen(fd, 'wb')
+                try:
+                    f.write(data)
+                finally:
+                    f.close()
+                filename = os.path.join(self.dirname, key)
+                if os.path.exists(filename):
+                    os.unlink(filename)
+                os.rename(tempname, filename)
+            except EnvironmentError:
+                return
+
+            if key in self.entries:
+                self.order.remove(key)
+            self.entries[key] = len(data)
+            self.order.append(key)
+            self._trim()
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """Remove all the entries."""
+        self.lock.acquire()
+        try:
+            self._readEntries()
+            for fn in self.order:
+                try:
+                    os.unlink( os.path.join(self.dirname, fn) )
+                except EnvironmentError:
+                    pass
+            self.entries.clear()
+            del self.order[:]
+        finally:
+            self.lock.release()
+
+_cache = None
+
+def _tempCacheDir():
+    """Cache directory for the user in the temporary directory."""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = 'unknown'
+    return os.path.join(tempfile.gettempdir(), 'veusz-cache-%s' % user)
+
+def getRenderCache():
+    """Return the RenderCache to use, or None if caching is disabled."""
+
+    global _cache
+
+    setdb = setting.settingdb
+    if not setdb['plot_rendercache']:
+        return None
+
+    dirname = setdb['plot_rendercache_dir']
+    if not dirname:
+        dirname = unicode( qt4.QDesktopServices.storageLocation(
+                qt4.QDesktopServices.CacheLocation) )
+        if not dirname:
+            dirname = _tempCacheDir()
+        dirname = os.path.join(dirname, 'rendercache')
+    maxsize = setdb['plot_rendercache_size']*1024*1024
+
+    if _cache is None or _cache.dirname != dirname:
+        _cache = RenderCache(dirname, maxsize)
+    _cache.maxsize = maxsize
+    return _cache
+
+# hashes of dataset values, keyed on the name and version
+_datasethashes = utils.LRUCache(1024)
+
+def _datasetHash(document, name):
+    """Return hash of the values of the dataset with name."""
+
+    ds = document.data[name]
+    key = (name, document.datasetVersion(name))
+    cached = _datasethashes.get(key)
+    if cached is not None and cached[0]() is ds:
+        return cached[1]
+
+    h = hashlib.sha1()
+    h.update(type(ds).__name__)
+    if ds.dimensions == 2:
+        h.update(repr( (ds.xrange, ds.yrange) ))
+    # 2D datasets do not list their columns
+    for col in (ds.columns or ('data',)):
+        vals = getattr(ds, col)
+        if vals is None:
+            h.update('none')
+        elif isinstance(vals, N.ndarray):
+            h.update(repr(vals.shape))
+            h.update(buffer(N.ascontiguousarray(vals)))
+        else:
+            h.update(repr(vals))
+
+    digest = h.hexdigest()
+    _datasethashes[key] = (weakref.ref(ds), digest)
+    return digest
+
+def _filenameStats(widget, settings=None):
+    """Yield (filename, modification time, size) of files read by
+    the widget and its children."""
+
+    if settings is None:
+        settings = widget.settings
+        for child in widget.children:
+            for f in _filenameStats(child):
+                yield f
+
+    for s in settings.getSettingList():
+        if isinstance(s, setting.Filename) and s.val:
+            try:
+                st = os.stat(s.val)
+                yield (s.val, st.st_mtime, st.st_size)
+            except EnvironmentError:
+                yield (s.val, None, None)
+    for s in settings.getSettingsList():
+        for f in _filenameStats(widget, settings=s):
+            yield f
+
+def pageCacheKey(document, pagenumber, params):
+    """Return a key for the page in a RenderCache.
+
+    params is a tuple of the output parameters, which should have a
+    repr which is the same if they are the same.
+    """
+
+    page = document.getPage(pagenumber)
+    text = page.getSaveText(saveall=True)
+
+    h = hashlib.sha1()
+    h.update(utils.version())
+    h.update(repr(params))
+    h.update(document.basewidget.settings.saveText(True).encode('utf-8'))
+    h.update(repr(document.customs))
+    h.update(text.encode('utf-8'))
+
+    # the datasets the page may use are those with names in its text
+    for name in sorted(document.data):
+        if name in text:
+            h.update(repr(name))
+            h.update(_datasetHash(document, name))
+
+    for vals in _filenameStats(page):
+        h.update(repr(vals))
+
+    return h.hexdigest()
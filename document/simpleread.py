@@ -42,6 +42,7 @@ x +- y + -
 
 import re
 import cStringIO
+import copy
 
 import numpy as N
 
@@ -273,7 +274,8 @@ class DescriptorPart(object):
                         dat = val
                         
                 elif self.datatype == 'date':
-                    dat = utils.dateStringToDate(val)
+                    # converted all at once when setting the dataset
+                    dat = val
 
                 # add data into dataset
                 dataset.append(dat)
@@ -329,6 +331,7 @@ class DescriptorPart(object):
                                            nerr = neg, perr = pos,
                                            linked = linkedfile )
                 elif self.datatype == 'date':
+                    vals = utils.dateStringsToFloats(vals)
                     ds = datasets.DatasetDateTime( data=vals,
                                                    linked=linkedfile )
                 elif self.datatype == 'string':
@@ -455,6 +458,7 @@ class SimpleRead(object):
         self.datasets = {}
         self.blocks = None
         self.tail = None
+        self.currentparts = self.parts
 
     def _parseDescriptor(self, descriptor):
         """Take a descriptor, and parse it into its individual parts."""
@@ -511,9 +515,39 @@ class SimpleRead(object):
 
             stream.flushLine()
 
+        # parts in use at end of data, for continuing reading later
+        self.currentparts = self.parts
         self.parts = allparts
         self.blocks = None
 
+    def copyParseState(self):
+        """Return a copy of this reader without the values read, which
+        can continue reading appended data with readAppendedData."""
+
+        reader = copy.copy(self)
+        reader.datasets = {}
+        reader.parts, reader.currentparts = copy.deepcopy(
+            (self.parts, self.currentparts))
+        return reader
+
+    def readAppendedData(self, stream):
+        """Continue reading data appended to a stream previously read
+        with readData without blocks.
+
+        Only the values read in this call are kept, so that they can
+        be appended to existing datasets.
+        """
+
+        oldparts = self.parts
+        for name in self.datasets:
+            self.datasets[name] = []
+
+        self.parts = self.currentparts
+        self._readDataUnblocked(stream, self.ignoretext)
+
+        # keep parts from the earlier read, adding any new ones
+        self.parts = oldparts + [p for p in self.parts if p not in oldparts]
+
     def _readDataBlocked(self, stream, ignoretext):
         """Read in the data, using blocks."""
 
@@ -0,0 +1,174 @@
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Saving documents in the background.
+
+A DocumentSnapshot records the state of a document cheaply: the text
+of the widgets and settings is generated, but the datasets holding
+values keep references to their arrays, which are never modified in
+place. The snapshot can then be written to a file by a SaveThread,
+while the document carries on changing.
+"""
+
+import os
+import sys
+import stat
+import StringIO
+
+import veusz.qtall as qt4
+
+class _ProgressFile(object):
+    """Pass writes on to a file object, counting the characters written."""
+
+    def __init__(self, fileobj, callback):
+        self.fileobj = fileobj
+        self.callback = callback
+        self.written = 0
+
+    def write(self, text):
+        self.fileobj.write(text)
+        self.written += len(text)
+        self.callback(self.written)
+
+class DocumentSnapshot(object):
+    """The state of a document at a point in time, which can be saved
+    later, in another thread."""
+
+    def __init__(self, document, reldirname=None):
+        """Take snapshot of document.
+
+        reldirname is the directory to save linked files relative to,
+        which is added to the import path.
+        """
+
+        # changeset of document when snapshot was taken
+        self.changeset = document.changeset
+
+        # list of (function taking file object, estimated size)
+        self.parts = []
+
+        f = StringIO.StringIO()
+        document._writeFileHeader(f, 'saved document')
+
+        # add file directory to import path if we know it
+        if reldirname:
+            f.write('AddImportPath(%s)\n' % repr(reldirname))
+
+        # add custom definitions
+        document.saveCustomDefinitions(f)
+
+        # save those datasets which are linked
+        # we do this first in case the datasets are overridden below
+        savedlinks = {}
+        for name, dataset in sorted(document.data.items()):
+            dataset.saveLinksToSavedDoc(f, savedlinks, relpath=reldirname)
+        self._addText(f.getvalue())
+
+        # save the remaining datasets
+        for name, dataset in sorted(document.data.items()):
+            self.parts.append( dataset.saveSnapshot(name) )
+
+        # save tags of datasets and the actual tree structure
+        f = StringIO.StringIO()
+        document.saveDatasetTags(f)
+        f.write(document.basewidget.getSaveText())
+        self._addText(f.getvalue())
+
+    def _addText(self, text):
+        """Add a part which is fixed text."""
+        self.parts.append( (lambda fileobj: fileobj.write(text), len(text)) )
+
+    def estimatedSize(self):
+        """Return rough size of saved document in characters."""
+        return sum([size for func, size in self.parts])
+
+    def write(self, fileobj, progress=None):
+        """Write snapshot to file object.
+
+        progress is an optional function called with the number of
+        characters written so far.
+        """
+
+        if progress is not None:
+            fileobj = _ProgressFile(fileobj, progress)
+        for func, size in self.parts:
+            func(fileobj)
+
+    def writeToFilename(self, filename, progress=None):
+        """Write snapshot to filename.
+
+        The document is written to a temporary file in the same
+        directory, which replaces filename when complete, so that an
+        existing file is not left partially written.
+        """
+
+        # replace the file a symlink points to, not the symlink
+        filename = os.path.realpath(filename)
+        tempname = '%s.%i.tmp' % (filename, os.getpid())
+
+        try:
+            f = open(tempname, 'w')
+            try:
+                self.write(f, progress=progress)
+            finally:
+                f.close()
+
+            if os.path.exists(filename):
+                # keep the permissions of the existing file
+                mode = stat.S_IMODE(os.stat(filename).st_mode)
+                os.chmod(tempname, mode)
+                if sys.platform == 'win32':
+                    # rename does not replace files on windows
+                    os.unlink(filename)
+            os.rename(tempname, filename)
+        except:
+            try:
+                os.unlink(tempname)
+            except EnvironmentError:
+                pass
+            raise
+
+class SaveThread(qt4.QThread):
+    """Write a DocumentSnapshot to a file in the background.
+
+    Emits sigProgress(percent) as the file is written. When the thread
+    has finished, error is None or the EnvironmentError which occurred.
+    """
+
+    def __init__(self, snapshot, filename):
+        qt4.QThread.__init__(self)
+        self.snapshot = snapshot
+        self.filename = filename
+        self.error = None
+
+        self.total = max(snapshot.estimatedSize(), 1)
+        self.percent = -1
+
+    def _progress(self, written):
+        """Emit progress if the percentage has changed."""
+        percent = min(written*100 // self.total, 99)
+        if percent != self.percent:
+            self.percent = percent
+            self.emit( qt4.SIGNAL('sigProgress'), percent )
+
+    def run(self):
+        try:
+            self.snapshot.writeToFilename(self.filename,
+                                          progress=self._progress)
+        except EnvironmentError, e:
+            self.error = e
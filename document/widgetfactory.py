@@ -20,15 +20,39 @@
 ##############################################################################
 
 class WidgetFactory(object):
-    """Class to help produce any type of widget you want by name."""
+    """Class to help produce any type of widget you want by name.
+
+    Widget types can be registered lazily with the name of the module
+    defining them, so that the module is only imported when the widget
+    type is first used.
+    """
 
     def __init__(self):
         """Initialise the class."""
         self.regwidgets = {}
+        # map widget type names to modules to import on first use
+        self.lazywidgets = {}
 
     def register(self, classobj):
         """Register a class with the factory."""
         self.regwidgets[classobj.typename] = classobj
+        if classobj.typename in self.lazywidgets:
+            del self.lazywidgets[classobj.typename]
+
+    def registerLazy(self, typename, modulename):
+        """Register a widget type, importing the module with the full
+        name given when the widget type is first used.
+        The module should register the widget class."""
+        if typename not in self.regwidgets:
+            self.lazywidgets[typename] = modulename
+
+    def _importWidget(self, typename):
+        """Import the module for the lazily registered type name."""
+        modulename = self.lazywidgets.pop(typename)
+        __import__(modulename)
+        if typename not in self.regwidgets:
+            raise RuntimeError, 'Module %s did not register widget %s' % (
+                modulename, typename)
 
     def makeWidget(self, widgetname, parent, name=None, autoadd=True,
                    index=-1, **optargs):
@@ -38,7 +62,7 @@ class WidgetFactory(object):
         if name is not None and name.find('/') != -1:
             raise ValueError, 'name cannot contain "/"'
 
-        w = self.regwidgets[widgetname](parent, name=name)
+        w = self.getWidgetClass(widgetname)(parent, name=name)
 
         # set all the passed default settings
         for name, val in optargs.iteritems():
@@ -57,18 +81,35 @@ class WidgetFactory(object):
 
         return w
 
+    def hasWidget(self, name):
+        """Is the widget type name known (loaded or not)?"""
+        return name in self.regwidgets or name in self.lazywidgets
+
     def getWidgetClass(self, name):
         """Get the class for the widget."""
+        if name not in self.regwidgets and name in self.lazywidgets:
+            self._importWidget(name)
         return self.regwidgets[name]
 
     def listWidgets(self):
         """Return an array of the widgets the factory can make."""
+        names = self.regwidgets.keys() + self.lazywidgets.keys()
+        names.sort()
+        return names
+
+    def listLoadedWidgets(self):
+        """Return an array of the widgets which have been imported."""
         names = self.regwidgets.keys()
         names.sort()
         return names
 
     def listWidgetClasses(self):
-        """Return list of allowed classes."""
+        """Return list of allowed classes.
+        This imports any widgets not yet loaded."""
+        for name in self.lazywidgets.keys():
+            # importing a module can register several types
+            if name in self.lazywidgets:
+                self._importWidget(name)
         return self.regwidgets.values()
 
 # singleton
@@ -38,6 +38,9 @@ public:
 
   int drawItemCount() const { return _engine->drawItemCount(); }
 
+  // number of paint elements recorded
+  int elementCount() const { return _elements.size(); }
+
 public:
   friend class RecordPaintEngine;
 
@@ -20,6 +20,8 @@
 
 """Plugins for creating datasets."""
 
+import sys
+import traceback
 import numpy as N
 from itertools import izip
 import field
@@ -201,22 +203,33 @@ class DatasetPluginHelper(object):
     def __init__(self, doc):
         """Construct helper object to pass to DatasetPlugins."""
         self._doc = doc
+        self._resetUsed()
+
+    def _resetUsed(self):
+        """Reset record of names of datasets read by the plugin.
+        _usedall is set if the plugin used anything else in the document.
+        """
+        self._used = set()
+        self._usedall = False
 
     @property
     def datasets1d(self):
         """Return list of existing 1D numeric datasets"""
+        self._usedall = True
         return [name for name, ds in self._doc.data.iteritems() if
                 (ds.dimensions == 1 and ds.datatype == 'numeric')]
 
     @property
     def datasets2d(self):
         """Return list of existing 2D numeric datasets"""
+        self._usedall = True
         return [name for name, ds in self._doc.data.iteritems() if
                 (ds.dimensions == 2 and ds.datatype == 'numeric')]
 
     @property
     def datasetstext(self):
         """Return list of existing 1D text datasets"""
+        self._usedall = True
         return [name for name, ds in self._doc.data.iteritems() if
                 (ds.dimensions == 1 and ds.datatype == 'text')]
 
@@ -224,6 +237,7 @@ class DatasetPluginHelper(object):
     def datasetsdatetime(self):
         """Return list of existing date-time datesets"""
         import veusz.document as document
+        self._usedall = True
         return [name for name, ds in self._doc.data.iteritems() if
                 isinstance(ds, document.DatasetDateTime)]
 
@@ -232,19 +246,23 @@ class DatasetPluginHelper(object):
         part is 'data', 'serr', 'perr' or 'nerr' - these are the
         dataset parts which are evaluated by the expression
         """
+        self._usedall = True
         return self._doc.evalDatasetExpression(expr, part=part)
 
-    def getDataset(self, name, dimensions=1):
+    def getDataset(self, name, dimensions=1, copy=True):
         """Return numerical dataset object for name given.
         Please make sure that dataset data are not modified.
 
         name: name of dataset
         dimensions: number of dimensions dataset requires
+        copy: if False, the data are not copied (and may be memory
+              mapped arrays), so they must not be modified
 
         name not found: raise a DatasetPluginException
         dimensions not right: raise a DatasetPluginException
         """
         import veusz.document as document
+        self._used.add(name)
         try:
             ds = self._doc.data[name]
         except KeyError:
@@ -258,16 +276,23 @@ class DatasetPluginHelper(object):
                 "Dataset '%s' is not a numerical dataset" % name)
 
         if isinstance(ds, document.DatasetDateTime):
-            return DatasetDateTime(name, data=ds.data)
+            kls, parts = DatasetDateTime, {'data': ds.data}
         elif ds.dimensions == 1:
-            return Dataset1D(name, data=ds.data, serr=ds.serr, 
-                             perr=ds.perr, nerr=ds.nerr)
+            kls, parts = Dataset1D, {'data': ds.data, 'serr': ds.serr,
+                                     'perr': ds.perr, 'nerr': ds.nerr}
         elif ds.dimensions == 2:
-            return Dataset2D(name, ds.data,
-                             rangex=ds.xrange, rangey=ds.yrange)
+            kls, parts = Dataset2D, {'data': ds.data, 'rangex': ds.xrange,
+                                     'rangey': ds.yrange}
         else:
             raise RuntimeError("Invalid number of dimensions in dataset")
 
+        if copy:
+            return kls(name, **parts)
+        # avoid the copy made when constructing the dataset
+        retn = kls(name)
+        retn.__dict__.update(parts)
+        return retn
+
     def getDatasets(self, names, dimensions=1):
         """Get a list of numerical datasets (of the dimension given)."""
         return [ self.getDataset(n, dimensions=dimensions) for n in names ]
@@ -279,6 +304,7 @@ class DatasetPluginHelper(object):
         name not found: raise a DatasetPluginException
         """
 
+        self._used.add(name)
         try:
             ds = self._doc.data[name]
         except KeyError:
@@ -287,9 +313,38 @@ class DatasetPluginHelper(object):
             return DatasetText(name, ds.data)
         raise DatasetPluginException("Dataset '%s' is not a text datset" % name)
 
+class _PluginUpdateThread(qt4.QThread):
+    """Thread to run the update of a plugin in the background."""
+
+    def __init__(self, manager):
+        qt4.QThread.__init__(self)
+        self.manager = manager
+        self.error = None
+
+    def run(self):
+        """Update the plugin, keeping any error message."""
+        try:
+            self.manager.runPlugin()
+        except DatasetPluginException, ex:
+            self.error = unicode(ex)
+        except Exception:
+            sys.stderr.write(_("Error in dataset plugin thread\n"))
+            traceback.print_exc(file=sys.stderr)
+            self.error = _("Error in dataset plugin thread")
+
 # internal object to synchronise datasets created by a plugin
 class DatasetPluginManager(object):
-    """Manage datasets generated by plugin."""
+    """Manage datasets generated by plugin.
+
+    The plugin is only run again if the datasets it read last time
+    (or those named in its FieldDataset fields) have changed.
+
+    If the plugin has background_update set and background updates
+    are enabled for the session (transient setting
+    'plugin_background_updates'), updates after the first are done in
+    a thread. The previous outputs are returned until the thread has
+    finished, when the new outputs are swapped in together.
+    """
 
     def __init__(self, plugin, doc, fields):
         """Construct manager object.
@@ -305,6 +360,14 @@ class DatasetPluginManager(object):
         self.fields = dict(fields)
         self.changeset = -1
 
+        # names of datasets the plugin depends on and their versions
+        self.inputnames = set()
+        self.inputversion = None
+        # incremented whenever the outputs change
+        self.outputversion = 0
+        self.thread = None
+        self.updating = False
+
         self.fixMissingFields()
         self.setupDatasets()
 
@@ -326,12 +389,91 @@ class DatasetPluginManager(object):
             veuszds = ds._makeVeuszDataset(self)
             veuszds.document = self.document
             self.veuszdatasets.append(veuszds)
+        self.publishOutputs()
 
     def nullDatasets(self):
         """Clear out contents of datasets."""
         for ds in self.datasets:
             ds._null()
 
+    def publishOutputs(self):
+        """Make the current values of the plugin datasets visible.
+
+        The attributes of each dataset are copied, so that the plugin
+        can go on to update its datasets without changing the outputs.
+        """
+        self.outputs = dict( (id(ds), dict(ds.__dict__))
+                             for ds in self.datasets )
+        self.outputversion += 1
+
+    def getOutput(self, ds, attr):
+        """Get attribute of plugin dataset ds, updating if necessary."""
+        self.update()
+        return self.outputs[id(ds)][attr]
+
+    def declaredInputs(self):
+        """Return set of dataset names given in the dataset fields."""
+        names = set()
+        for pluginfield in self.plugin.fields:
+            val = self.fields.get(pluginfield.name)
+            if isinstance(pluginfield, field.FieldDataset):
+                names.add(val)
+            elif isinstance(pluginfield, field.FieldDatasetMulti):
+                names.update(val)
+        return names - set(self.datasetnames)
+
+    def inputVersion(self):
+        """Return (version, volatile) for the inputs of the plugin.
+
+        version changes if the inputs may have changed. volatile is
+        True if version changes whenever the document is modified.
+        """
+
+        import veusz.document as document
+        doc = self.document
+        if self.helper._usedall:
+            # plugin read something other than datasets
+            return doc.changeset, True
+
+        versions = []
+        volatile = False
+        for name in sorted(self.inputnames):
+            ds = doc.data.get(name)
+            if ds is None:
+                version = None
+            elif isinstance(ds, document.datasets._DatasetPlugin):
+                # output of another plugin
+                ds.pluginmanager.update()
+                version = ds.pluginmanager.outputversion
+            elif ds.isDerived():
+                # derived datasets can change without their version
+                version = doc.changeset
+                volatile = True
+            else:
+                version = doc.datachangesets.get(name)
+            versions.append( (name, id(ds), version) )
+        return tuple(versions), volatile
+
+    def runPlugin(self):
+        """Run the plugin with its parameters, recording its inputs."""
+        self.helper._resetUsed()
+        try:
+            self.plugin.updateDatasets(self.fields, self.helper)
+        finally:
+            self.inputnames = self.declaredInputs() | self.helper._used
+
+    def useBackground(self, volatile):
+        """Should the update be done in a background thread?
+
+        This is not done for the first update, or if the inputs are
+        volatile, as the update when the thread finishes would start
+        another one.
+        """
+        import veusz.setting as setting
+        return ( getattr(self.plugin, 'background_update', False) and
+                 setting.transient_settings.get('plugin_background_updates')
+                 and self.inputversion is not None and not volatile )
+
     def saveToFile(self, fileobj):
         """Save command to load in plugin and parameters."""
 
@@ -361,21 +503,73 @@ class DatasetPluginManager(object):
         when updating the dataset
         """
 
-        if self.document.changeset == self.changeset:
+        if self.document.changeset == self.changeset or self.updating:
             return
+        if self.thread is not None:
+            if not raiseerrors:
+                # use old outputs until the thread has finished
+                return
+            self.thread.wait()
+            self.slotThreadFinished()
+
         self.changeset = self.document.changeset
 
-        # run the plugin with its parameters
+        self.updating = True
         try:
-            self.plugin.updateDatasets(self.fields, self.helper)
-        except DatasetPluginException, ex:
-            # this is for immediate notification
-            if raiseerrors:
-                raise
+            # skip update if inputs have not changed
+            version, volatile = self.inputVersion()
+            if version == self.inputversion:
+                return
+
+            if self.useBackground(volatile) and not raiseerrors:
+                self.inputversion = version
+                self.thread = _PluginUpdateThread(self)
+                self.thread.inputnames = self.inputnames
+                self.thread.connect( self.thread, qt4.SIGNAL('finished()'),
+                                     self.slotThreadFinished )
+                self.thread.start()
+                return
+
+            # run the plugin with its parameters
+            try:
+                self.runPlugin()
+            except DatasetPluginException, ex:
+                # this is for immediate notification
+                if raiseerrors:
+                    raise
+
+                # otherwise if there's an error, then log and null outputs
+                self.document.log( unicode(ex) )
+                self.nullDatasets()
+
+            self.inputversion = self.inputVersion()[0]
+            self.publishOutputs()
+        finally:
+            self.updating = False
+
+    def slotThreadFinished(self):
+        """Swap in the outputs from a background update."""
+
+        thread = self.thread
+        if thread is None:
+            return
+        self.thread = None
 
-            # otherwise if there's an error, then log and null outputs
-            self.document.log( unicode(ex) )
+        if thread.error is not None:
+            self.document.log(thread.error)
             self.nullDatasets()
+        self.publishOutputs()
+
+        # inputversion is from when the thread started, so the plugin
+        # is run again if the inputs changed while it was running
+        if thread.inputnames != self.inputnames:
+            self.inputversion = None
+        self.changeset = -1
+
+        # redraw with the new outputs
+        for name in self.datasetnames:
+            self.document.changes.datasetChanged(name)
+        self.document.setModified(self.document.isModified())
 
 class DatasetPlugin(object):
     """Base class for defining dataset plugins."""
@@ -392,6 +586,11 @@ class DatasetPlugin(object):
     # if the plugin takes no parameters, set this to False
     has_parameters = True
 
+    # set this to True if updateDatasets only uses the helper and the
+    # plugin's own datasets, so that it can be run in a background
+    # thread when this is enabled
+    background_update = False
+
     def __init__(self):
         """Override this to declare a list of input fields if required."""
         self.fields = []
@@ -1426,6 +1625,8 @@ class MovingAveragePlugin(_OneOutputDatasetPlugin):
     description_full = _('Compute moving average for regularly spaced data.'
                          'Average is computed either\nside of each data point '
                          'by number of points given.')
+
+    background_update = True
     
     def __init__(self):
         """Define fields."""
@@ -1496,6 +1697,8 @@ class SortPlugin(_OneOutputDatasetPlugin):
     name = 'Sort'
     description_short = description_full = _('Sort a dataset')
 
+    background_update = True
+
     def __init__(self):
         """Define fields."""
         self.fields = [
@@ -1577,6 +1780,8 @@ class Histogram2D(DatasetPlugin):
     description_long = _('Given two 1D datasets, compute a 2D histogram. '
                          'Can optionally compute a probability distribution.')
 
+    background_update = True
+
     def __init__(self):
         """Input fields."""
         self.fields = [
@@ -1602,6 +1807,13 @@ class Histogram2D(DatasetPlugin):
             field.FieldDataset('ds_out', _('Output 2D dataset'), dims=2),
             ]
 
+        # number of threads to use when binning large datasets
+        try:
+            import multiprocessing
+            self.threads = multiprocessing.cpu_count()
+        except (ImportError, NotImplementedError):
+            self.threads = 1
+
     def probabilityCalculator(self, histo):
         """Convert an image of counts to a cumulative probability
         distribution.
@@ -1630,23 +1842,32 @@ class Histogram2D(DatasetPlugin):
     def updateDatasets(self, fields, helper):
         """Calculate values of output dataset."""
 
-        dsy = helper.getDataset(fields['ds_iny']).data
-        dsx = helper.getDataset(fields['ds_inx']).data
+        # datasets are not copied, as they may be very large
+        dsy = helper.getDataset(fields['ds_iny'], copy=False).data
+        dsx = helper.getDataset(fields['ds_inx'], copy=False).data
 
         # use range of data or specified parameters
-        miny = fields['miny']
-        if miny == 'Auto': miny = N.nanmin(dsy)
-        maxy = fields['maxy']
-        if maxy == 'Auto': maxy = N.nanmax(dsy)
-        minx = fields['minx']
-        if minx == 'Auto': minx = N.nanmin(dsx)
-        maxx = fields['maxx']
-        if maxx == 'Auto': maxx = N.nanmax(dsx)
-
-        # compute counts in each bin
-        histo, xedge, yedge = N.histogram2d(
-            dsy, dsx, bins=[fields['binsy'], fields['binsx']],
-            range=[[miny,maxy], [minx,maxx]], normed=False)
+        miny, maxy = fields['miny'], fields['maxy']
+        if miny == 'Auto' or maxy == 'Auto':
+            autominy, automaxy = utils.chunkedRange(dsy)
+            if miny == 'Auto': miny = autominy
+            if maxy == 'Auto': maxy = automaxy
+        minx, maxx = fields['minx'], fields['maxx']
+        if minx == 'Auto' or maxx == 'Auto':
+            autominx, automaxx = utils.chunkedRange(dsx)
+            if minx == 'Auto': minx = autominx
+            if maxx == 'Auto': maxx = automaxx
+
+        def edges(minval, maxval, bins):
+            if minval == maxval:
+                minval, maxval = minval-0.5, maxval+0.5
+            return N.linspace(minval, maxval, bins+1)
+
+        # compute counts in each bin, a chunk of the input at a time
+        histo = utils.chunkedHistogram2D(
+            dsy, dsx, edges(miny, maxy, fields['binsy']),
+            edges(minx, maxx, fields['binsx']),
+            threads=self.threads)
 
         m = fields['mode']
         if m == 'Count':
@@ -43,75 +43,202 @@ def datasetLinkFile(ds):
     else:
         return ds.linked.filename
 
-class DatasetNode(TMNode):
-    """Node for a dataset."""
+def previewImage(y, size):
+    """Return a QImage with size (width, height) plotting the values
+    y, or None if not possible.
 
-    def __init__(self, doc, dsname, cols, parent):
-        ds = doc.data[dsname]
-        data = []
-        assert cols[0] == "name"
-        for c in cols:
-            if c == "name":
-                data.append( dsname )
-            elif c == "size":
-                data.append( ds.userSize() )
-            elif c == "type":
-                data.append( ds.dstype )
-            elif c == "linkfile":
-                data.append( os.path.basename(datasetLinkFile(ds)) )
+    This does not use any GUI objects, so can be called outside the
+    main thread.
+    """
 
-        TMNode.__init__(self, tuple(data), parent)
+    img = qt4.QImage(size[0], size[1], qt4.QImage.Format_ARGB32_Premultiplied)
+    img.fill(0)
+    p = qt4.QPainter(img)
+    p.setRenderHint(qt4.QPainter.Antialiasing)
+
+    # calculate data points
+    try:
+        x = N.arange(len(y))
+
+        # plot data points on image
+        minval, maxval = N.nanmin(y), N.nanmax(y)
+        y = (y-minval) / (maxval-minval) * size[1]
+        finite = N.isfinite(y)
+        x, y = x[finite], y[finite]
+        x = x * (1./len(x)) * size[0]
+
+        poly = qt4.QPolygonF()
+        utils.addNumpyToPolygonF(poly, x, size[1]-y)
+        p.setPen( qt4.QPen(qt4.Qt.blue) )
+        p.drawPolyline(poly)
+
+        # draw x axis if span 0
+        p.setPen( qt4.QPen(qt4.Qt.black) )
+        if minval <= 0 and maxval > 0:
+            y0 = size[1] - (0-minval)/(maxval-minval)*size[1]
+            p.drawLine(x[0], y0, x[-1], y0)
+        else:
+            p.drawLine(x[0], size[1], x[-1], size[1])
+        p.drawLine(x[0], 0, x[0], size[1])
+
+    except (ValueError, ZeroDivisionError):
+        # zero sized array after filtering or min == max, so return None
+        p.end()
+        return None
+
+    p.end()
+    return img
+
+class _PreviewThread(qt4.QThread):
+    """Make a preview image of values in the background, converted
+    to html."""
+
+    def __init__(self, key, y, size):
+        qt4.QThread.__init__(self)
+        self.key = key
+        self.y = y
+        self.size = size
+        self.html = None
+
+    def run(self):
+        img = previewImage(self.y, self.size)
+        if img is not None:
+            self.html = utils.imageAsHtml(img)
+
+class DatasetInfoCache(qt4.QObject):
+    """Cache of the information about datasets shown in the browser.
+
+    Entries are keyed on the dataset identity and version (from
+    Document.datasetVersion), so datasets are only examined again,
+    which may mean evaluating them, when they have changed.
+
+    Preview images are made in a background thread when first
+    requested, so are shown once they are ready.
+    """
+
+    # size of preview images
+    previewsize = (140, 70)
+
+    def __init__(self, doc):
+        qt4.QObject.__init__(self)
         self.doc = doc
-        self.cols = cols
+        # dataset name -> (version, info dict)
+        self.info = {}
+        # (name, version) -> html of preview or None if there is none
+        self.previews = utils.LRUCache(256)
+        # current preview thread and (name, version) of next preview
+        self.thread = None
+        self.pending = None
+
+    def datasetInfo(self, name):
+        """Return dict of information for dataset name, or None if
+        the dataset does not exist."""
+
+        ds = self.doc.data.get(name)
+        if ds is None:
+            self.info.pop(name, None)
+            return None
 
-    def getPreviewPixmap(self, ds):
-        """Get a preview pixmap for a dataset."""
-        size = (140, 70)
-        if ds.dimensions != 1 or ds.datatype != "numeric":
+        version = self.doc.datasetVersion(name)
+        cached = self.info.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        info = {
+            'name': name,
+            'size': ds.userSize(),
+            'type': ds.dstype,
+            'linkfile': datasetLinkFile(ds),
+            'tags': tuple(sorted(ds.tags)),
+            'dimensions': ds.dimensions,
+            'datatype': ds.datatype,
+            }
+        self.info[name] = (version, info)
+        return info
+
+    def forget(self, names):
+        """Remove cached information for dataset names."""
+        for name in names:
+            self.info.pop(name, None)
+
+    def preview(self, name):
+        """Return html of preview image for dataset name, or None if
+        there is no preview or it is not available yet."""
+
+        ds = self.doc.data.get(name)
+        if ds is None or ds.dimensions != 1 or ds.datatype != "numeric":
             return None
 
-        pixmap = qt4.QPixmap(*size)
-        pixmap.fill(qt4.Qt.transparent)
-        p = qt4.QPainter(pixmap)
-        p.setRenderHint(qt4.QPainter.Antialiasing)
+        key = (name, self.doc.datasetVersion(name))
+        html = self.previews.get(key, False)
+        if html is not False:
+            return html
 
-        # calculate data points
-        try:
-            if len(ds.data) < size[1]:
-                y = ds.data
-            else:
-                intvl = len(ds.data)/size[1]+1
-                y = ds.data[::intvl]
-            x = N.arange(len(y))
-
-            # plot data points on image
-            minval, maxval = N.nanmin(y), N.nanmax(y)
-            y = (y-minval) / (maxval-minval) * size[1]
-            finite = N.isfinite(y)
-            x, y = x[finite], y[finite]
-            x = x * (1./len(x)) * size[0]
-
-            poly = qt4.QPolygonF()
-            utils.addNumpyToPolygonF(poly, x, size[1]-y)
-            p.setPen( qt4.QPen(qt4.Qt.blue) )
-            p.drawPolyline(poly)
-
-            # draw x axis if span 0
-            p.setPen( qt4.QPen(qt4.Qt.black) )
-            if minval <= 0 and maxval > 0:
-                y0 = size[1] - (0-minval)/(maxval-minval)*size[1]
-                p.drawLine(x[0], y0, x[-1], y0)
-            else:
-                p.drawLine(x[0], size[1], x[-1], size[1])
-            p.drawLine(x[0], 0, x[0], size[1])
+        if self.thread is None:
+            self._startPreview(key)
+        else:
+            self.pending = key
+        return None
 
-        except (ValueError, ZeroDivisionError):
-            # zero sized array after filtering or min == max, so return None
-            p.end()
-            return None
+    def _startPreview(self, key):
+        """Start making the preview for (name, version) key."""
 
-        p.end()
-        return pixmap
+        ds = self.doc.data.get(key[0])
+        if ds is None or self.doc.datasetVersion(key[0]) != key[1]:
+            return
+
+        # take a small copy of the values, so that the dataset can
+        # be changed while the preview is made
+        data = ds.data
+        intvl = len(data)//self.previewsize[1]+1
+        y = N.array(data[::intvl], dtype=N.float64)
+
+        self.thread = _PreviewThread(key, y, self.previewsize)
+        self.connect(self.thread, qt4.SIGNAL('finished()'),
+                     self.slotPreviewFinished)
+        self.thread.start()
+
+    def slotPreviewFinished(self):
+        """Store finished preview and start the next, if any."""
+
+        thread, self.thread = self.thread, None
+        if thread is None:
+            return
+        # the finished signal can arrive before run() has returned
+        thread.wait()
+        self.previews[thread.key] = thread.html
+
+        pending, self.pending = self.pending, None
+        if pending is not None and pending not in self.previews:
+            self._startPreview(pending)
+
+    def stop(self):
+        """Make no more previews, waiting for any being made to
+        finish, so that the thread is not destroyed while running."""
+        self.pending = None
+        thread, self.thread = self.thread, None
+        if thread is not None:
+            self.disconnect(thread, qt4.SIGNAL('finished()'),
+                            self.slotPreviewFinished)
+            thread.wait()
+
+class DatasetNode(TMNode):
+    """Node for a dataset."""
+
+    def __init__(self, cache, dsname, cols, parent):
+        info = cache.datasetInfo(dsname)
+        data = []
+        assert cols[0] == "name"
+        for c in cols:
+            if c == "linkfile":
+                data.append( os.path.basename(info["linkfile"]) )
+            else:
+                data.append( info[c] )
+
+        TMNode.__init__(self, tuple(data), parent)
+        self.cache = cache
+        self.doc = cache.doc
+        self.cols = cols
 
     def toolTip(self, column):
         """Return tooltip for column."""
@@ -132,11 +259,11 @@ class DatasetNode(TMNode):
             return qt4.QVariant(textwrap.fill(text, 40))
         elif c == "size" or (c == 'type' and 'size' not in self.cols):
             text = ds.userPreview()
-            # add preview of dataset if possible
-            pix = self.getPreviewPixmap(ds)
-            if pix:
+            # add preview of dataset if it has been made
+            html = self.cache.preview(self.data[0])
+            if html:
                 text = text.replace("\n", "<br>")
-                text = "<html>%s<br>%s</html>" % (text, utils.pixmapAsHtml(pix))
+                text = "<html>%s<br>%s</html>" % (text, html)
             return qt4.QVariant(text)
         elif c == "linkfile" or c == "type":
             return qt4.QVariant(textwrap.fill(ds.linkedInformation(), 40))
@@ -155,7 +282,7 @@ class DatasetNode(TMNode):
 
     def cloneTo(self, newroot):
         """Make a clone of self at the root given."""
-        return self.__class__(self.doc, self.data[0], self.cols, newroot)
+        return self.__class__(self.cache, self.data[0], self.cols, newroot)
 
 class FilenameNode(TMNode):
     """A special node for holding filenames of files."""
@@ -179,13 +306,6 @@ class FilenameNode(TMNode):
             return qt4.QVariant(self.data[0])
         return qt4.QVariant()
 
-def treeFromList(nodelist, rootdata):
-    """Construct a tree from a list of nodes."""
-    tree = TMNode( rootdata, None )
-    for node in nodelist:
-        tree.insertChildSorted(node)
-    return tree
-
 class DatasetRelationModel(TreeModel):
     """A model to show how the datasets are related to each file."""
     def __init__(self, doc, grouping="filename", readonly=False,
@@ -199,17 +319,23 @@ class DatasetRelationModel(TreeModel):
 
         TreeModel.__init__(self, (_("Dataset"), _("Size"), _("Type")))
         self.doc = doc
+        self.cache = DatasetInfoCache(doc)
         self.linkednodes = {}
         self.grouping = grouping
         self.filter = ""
         self.readonly = readonly
         self.filterdims = filterdims
         self.filterdtype = filterdtype
+
+        # group nodes in the tree by group, and nodes of each
+        # dataset by name and group (None if not grouped)
+        self.grpnodes = {}
+        self.dsnodes = {}
         self.refresh()
 
-        self.connect(doc, qt4.SIGNAL("sigModified"), self.refresh)
+        self.connect(doc, qt4.SIGNAL("sigChanged"), self.slotDocChanged)
 
-    def datasetFilterOut(self, ds, node):
+    def datasetFilterOut(self, info, node):
         """Should dataset be filtered out by filter options."""
         filterout = False
 
@@ -217,101 +343,98 @@ class DatasetRelationModel(TreeModel):
         keep = True
         if self.filter != "":
             keep = False
-            if any([t.find(self.filter) >= 0 for t in ds.tags]):
+            if any([t.find(self.filter) >= 0 for t in info["tags"]]):
                 keep = True
             if any([t.find(self.filter) >= 0 for t in node.data]):
                 keep = True
         # check dimensions haven't been filtered
         if ( self.filterdims is not None and
-             ds.dimensions not in self.filterdims ):
+             info["dimensions"] not in self.filterdims ):
             filterout = True
         # check type hasn't been filtered
         if ( self.filterdtype is not None and
-             ds.datatype not in self.filterdtype ):
+             info["datatype"] not in self.filterdtype ):
             filterout = True
 
         if filterout:
             return True
         return not keep
 
-    def makeGrpTreeNone(self):
-        """Make tree with no grouping."""
-        tree = TMNode( (_("Dataset"), _("Size"), _("Type"), _("File")), None )
-        for name, ds in self.doc.data.iteritems():
-            child = DatasetNode( self.doc, name,
-                                 ("name", "size", "type", "linkfile"),
-                                 None )
-
-            # add if not filtered for filtering
-            if not self.datasetFilterOut(ds, child):
-                tree.insertChildSorted(child)
-        return tree
-        
-    def makeGrpTree(self, coltitles, colitems, grouper, GrpNodeClass):
-        """Make a tree grouping with function:
+    def groupingInfo(self):
+        """Return (coltitles, colitems, grouper, GrpNodeClass) for
+        the current grouping:
         coltitles: tuple of titles of columns for user
         colitems: tuple of items to lookup in DatasetNode
-        grouper: function of dataset to return text for grouping
+        grouper: function of dataset information to return a list of
+                 groups, or None if datasets are not grouped
         GrpNodeClass: class for creating grouping nodes
         """
-        grpnodes = {}
-        for name, ds in self.doc.data.iteritems():
-            child = DatasetNode(self.doc, name, colitems, None)
-
-            # check whether filtered out
-            if not self.datasetFilterOut(ds, child):
-                # get group
-                grps = grouper(ds)
-                for grp in grps:
-                    if grp not in grpnodes:
-                        grpnodes[grp] = GrpNodeClass( (grp,), None )
-                    # add to group
-                    grpnodes[grp].insertChildSorted(child)
-
-        return treeFromList(grpnodes.values(), coltitles)
-
-    def makeGrpTreeFilename(self):
-        """Make a tree of datasets grouped by linked file."""
-        return self.makeGrpTree(
-            (_("Dataset"), _("Size"), _("Type")),
-            ("name", "size", "type"),
-            lambda ds: (datasetLinkFile(ds),),
-            FilenameNode
-            )
-
-    def makeGrpTreeSize(self):
-        """Make a tree of datasets grouped by dataset size."""
-        return self.makeGrpTree(
-            (_("Dataset"), _("Type"), _("Filename")),
-            ("name", "type", "linkfile"),
-            lambda ds: (ds.userSize(),),
-            TMNode
-            )
-
-    def makeGrpTreeType(self):
-        """Make a tree of datasets grouped by dataset type."""
-        return self.makeGrpTree(
-            (_("Dataset"), _("Size"), _("Filename")),
-            ("name", "size", "linkfile"),
-            lambda ds: (ds.dstype,),
-            TMNode
-            )
-
-    def makeGrpTreeTags(self):
-        """Make a tree of datasets grouped by tags."""
-
-        def getgrp(ds):
-            if ds.tags:
-                return list(sorted(ds.tags))
+
+        def tagsgrp(info):
+            if info["tags"]:
+                return list(info["tags"])
             else:
                 return [_("None")]
 
-        return self.makeGrpTree(
-            (_("Dataset"), _("Size"), _("Type"), _("Filename")),
-            ("name", "size", "type", "linkfile"),
-            getgrp,
-            TMNode
-            )
+        return {
+            "none": ( (_("Dataset"), _("Size"), _("Type"), _("File")),
+                      ("name", "size", "type", "linkfile"),
+                      None, None ),
+            "filename": ( (_("Dataset"), _("Size"), _("Type")),
+                          ("name", "size", "type"),
+                          lambda info: [info["linkfile"]],
+                          FilenameNode ),
+            "size": ( (_("Dataset"), _("Type"), _("Filename")),
+                      ("name", "type", "linkfile"),
+                      lambda info: [info["size"]],
+                      TMNode ),
+            "type": ( (_("Dataset"), _("Size"), _("Filename")),
+                      ("name", "size", "linkfile"),
+                      lambda info: [info["type"]],
+                      TMNode ),
+            "tags": ( (_("Dataset"), _("Size"), _("Type"), _("Filename")),
+                      ("name", "size", "type", "linkfile"),
+                      tagsgrp,
+                      TMNode ),
+            }[self.grouping]
+
+    def makeDatasetNodes(self, name, colitems, grouper):
+        """Return list of (group, node) for the nodes to show for
+        dataset name. group is None if datasets are not grouped."""
+
+        info = self.cache.datasetInfo(name)
+        if info is None:
+            return []
+        node = DatasetNode(self.cache, name, colitems, None)
+        if self.datasetFilterOut(info, node):
+            return []
+        if grouper is None:
+            return [(None, node)]
+        return [ (grp, node.cloneTo(None)) for grp in grouper(info) ]
+
+    def makeTree(self):
+        """Make a tree of the datasets with the current grouping."""
+
+        coltitles, colitems, grouper, GrpNodeClass = self.groupingInfo()
+        tree = TMNode(coltitles, None)
+        grpnodes = {}
+        for name in self.doc.data:
+            for grp, node in self.makeDatasetNodes(name, colitems, grouper):
+                if grp is None:
+                    parent = tree
+                elif grp in grpnodes:
+                    parent = grpnodes[grp]
+                else:
+                    parent = grpnodes[grp] = GrpNodeClass( (grp,), tree )
+                    tree.childnodes.append(parent)
+                node.parent = parent
+                parent.childnodes.append(node)
+
+        # sorting once is much faster than inserting each node sorted
+        tree.childnodes.sort(key=lambda n: n.data)
+        for grpnode in grpnodes.itervalues():
+            grpnode.childnodes.sort(key=lambda n: n.data)
+        return tree
 
     def flags(self, idx):
         """Return model flags for index."""
@@ -336,18 +459,73 @@ class DatasetRelationModel(TreeModel):
             idx, idx)
         return True
 
-    def refresh(self):
-        """Update tree of datasets when document changes."""
+    def slotDocChanged(self, changes):
+        """Update the datasets which have changed (changing settings
+        does not alter the tree)."""
+        if changes.unknown:
+            self.refresh()
+        elif changes.datasets:
+            # derived datasets can change when other datasets do
+            names = set(changes.datasets)
+            for name, ds in self.doc.data.iteritems():
+                if ds.isDerived():
+                    names.add(name)
+            self.updateDatasets(names)
 
-        tree = {
-            "none": self.makeGrpTreeNone,
-            "filename": self.makeGrpTreeFilename,
-            "size": self.makeGrpTreeSize,
-            "type": self.makeGrpTreeType,
-            "tags": self.makeGrpTreeTags,
-            }[self.grouping]()
+    def refresh(self):
+        """Remake tree of datasets."""
+        self.syncTree(self.makeTree())
 
-        self.syncTree(tree)
+        # keep track of the nodes in the tree
+        self.grpnodes = {}
+        self.dsnodes = {}
+        for node in self.root.childnodes:
+            if isinstance(node, DatasetNode):
+                self.dsnodes[node.datasetName()] = {None: node}
+            else:
+                self.grpnodes[node.data[0]] = node
+                for child in node.childnodes:
+                    self.dsnodes.setdefault(
+                        child.datasetName(), {})[node.data[0]] = child
+
+    def updateDatasets(self, names):
+        """Update the nodes for the datasets with names given, which
+        may have been added, removed or changed, leaving the rest of
+        the tree alone."""
+
+        coltitles, colitems, grouper, GrpNodeClass = self.groupingInfo()
+        for name in names:
+            oldnodes = self.dsnodes.pop(name, {})
+            newnodes = dict(self.makeDatasetNodes(name, colitems, grouper))
+
+            # remove nodes from groups dataset is no longer in
+            for grp, node in oldnodes.iteritems():
+                if grp not in newnodes:
+                    self.removeNode(node)
+                    if grp is not None and not self.grpnodes[grp].childnodes:
+                        self.removeNode(self.grpnodes.pop(grp))
+
+            for grp, node in newnodes.iteritems():
+                if grp in oldnodes:
+                    # update existing node, if required
+                    oldnode = oldnodes[grp]
+                    if oldnode.data != node.data:
+                        self.setNodeData(oldnode, node.data)
+                    newnodes[grp] = oldnode
+                else:
+                    # add to group, making it if necessary
+                    if grp is None:
+                        parent = self.root
+                    elif grp in self.grpnodes:
+                        parent = self.grpnodes[grp]
+                    else:
+                        parent = self.grpnodes[grp] = GrpNodeClass(
+                            (grp,), None)
+                        self.insertNodeSorted(self.root, parent)
+                    self.insertNodeSorted(parent, node)
+
+            if newnodes:
+                self.dsnodes[name] = newnodes
 
 class DatasetsNavigatorTree(qt4.QTreeView):
     """Tree view for dataset names."""
@@ -371,6 +549,12 @@ class DatasetsNavigatorTree(qt4.QTreeView):
                                           filterdtype=filterdtype)
 
         self.setModel(self.model)
+
+        # stop making previews before the model goes away
+        self.connect(self, qt4.SIGNAL('destroyed()'), self.model.cache.stop)
+        self.connect(qt4.qApp, qt4.SIGNAL('aboutToQuit()'),
+                     self.model.cache.stop)
+
         self.setSelectionMode(qt4.QTreeView.ExtendedSelection)
         self.setSelectionBehavior(qt4.QTreeView.SelectRows)
         self.setUniformRowHeights(True)
@@ -775,6 +959,7 @@ class DatasetBrowserPopup(DatasetBrowser):
 
     def closeEvent(self, event):
         """Tell the calling widget that we are closing."""
+        self.navtree.model.cache.stop()
         self.emit(qt4.SIGNAL("closing"))
         event.accept()
 
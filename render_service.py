@@ -0,0 +1,643 @@
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""A headless service for rendering documents.
+
+Run as "veusz --render-service [options]". The service listens on a
+local socket and passes requests to a pool of worker processes. Each
+worker has Veusz imported and a Qt application running, and keeps the
+documents it has loaded most recently, so requests do not pay for
+starting up or reloading unchanged documents. As with --export, the
+workers need a display to draw on (e.g. Xvfb). The service needs
+Python 2.6 or later, for the json module.
+
+A worker which does not reply to a request within the timeout is
+killed and another is started.
+
+By default the socket is a unix domain socket which only the user
+running the service can use. A TCP port (host:port) can be given
+instead, but there is no authentication, so anyone who can connect
+to it can render documents.
+
+Only documents under the root directory (the current directory by
+default) can be rendered. Unless --unsafe-mode is given, documents
+which contain code failing the security check are refused, as are
+commands which write files (e.g. Export).
+
+Messages in both directions are a 4 byte little-endian length
+followed by that many bytes. A request is a JSON object, e.g.
+
+  {"command": "render", "document": "/path/doc.vsz", "page": 0,
+   "format": "png", "dpi": 100, "antialias": true,
+   "datasets": {"x": [1, 2, 3], "y": {"data": [4, 5, 6],
+                                      "serr": [1, 1, 1]}}}
+
+"command" is "render" (the default), "metrics" or "ping". The
+document filename may be relative to the root directory. Dataset
+overrides are lists of numbers or text, or objects of data, serr,
+perr and nerr values. They replace datasets in the document for the
+request only.
+
+Each reply is a JSON object, with "status" of "ok", "error" or
+"busy", followed by a message holding the exported file (empty if
+there is none). Replies to render requests include timings in
+seconds under "metrics".
+"""
+
+import os
+import os.path
+import sys
+import time
+import struct
+import socket
+import cPickle
+import tempfile
+import threading
+import subprocess
+import SocketServer
+import optparse
+
+# length of lengths of messages
+_lenformat = '<I'
+_lenlen = struct.calcsize(_lenformat)
+
+# export parameters which can be given in requests
+_exportparams = ('color', 'dpi', 'antialias', 'quality', 'backcolor',
+                 'pdfdpi', 'svgtextastext')
+
+class ServiceError(Exception):
+    """Raised for requests which cannot be done."""
+    pass
+
+def resolveDocument(root, filename):
+    """Return the real path of document filename, which may be
+    relative to the root directory. Raises ServiceError if the
+    document is not under root."""
+
+    if not isinstance(filename, basestring):
+        raise ServiceError, "Invalid document filename"
+    path = os.path.realpath(os.path.join(root, filename))
+    if not path.startswith(os.path.join(root, '')):
+        raise ServiceError, "Document is outside the root directory"
+    return path
+
+def _refuseCommand(name):
+    """Return function to use in place of unsafe command name."""
+    def refuse(*args, **argsk):
+        raise ServiceError, "Unsafe command %s not allowed" % name
+    return refuse
+
+def readLen(fileobj, length):
+    """Read length bytes from file object, raising EOFError if closed."""
+    s = ''
+    while len(s) < length:
+        d = fileobj.read(length-len(s))
+        if not d:
+            raise EOFError, "Connection closed"
+        s += d
+    return s
+
+def readMessage(fileobj):
+    """Read a message from file object."""
+    length = struct.unpack(_lenformat, readLen(fileobj, _lenlen))[0]
+    return readLen(fileobj, length)
+
+def writeMessage(fileobj, data):
+    """Write a message to file object."""
+    fileobj.write(struct.pack(_lenformat, len(data)))
+    fileobj.write(data)
+    fileobj.flush()
+
+class DocumentRenderer(object):
+    """Loads documents and exports pages from them, in a worker.
+
+    The most recently used documents are kept, unless the file has
+    changed since it was loaded. If unsafe is not set, documents with
+    unsafe code or commands are refused.
+    """
+
+    def __init__(self, maxdocs, unsafe=False):
+        import veusz.utils as utils
+        self.documents = utils.LRUCache(maxdocs)
+        self.unsafe = unsafe
+
+    def loadDocument(self, filename):
+        """Load document from filename, as the main window does, but
+        refusing unsafe code rather than asking."""
+
+        import veusz.document as document
+        import veusz.utils as utils
+
+        f = open(filename, 'rU')
+        try:
+            script = f.read()
+        finally:
+            f.close()
+
+        # saved documents can be loaded without executing them,
+        # otherwise the code has to pass the security check
+        commands = document.parseSavedDocument(script)
+        if ( not self.unsafe and commands is None and
+             utils.checkCode(script, securityonly=True) ):
+            raise ServiceError, "Document contains unsafe code"
+
+        doc = document.Document()
+        interface = document.CommandInterface(doc)
+        env = doc.eval_context.copy()
+        for cmd in interface.safe_commands:
+            env[cmd] = getattr(interface, cmd)
+        env['Root'] = interface.Root
+        for cmd in interface.unsafe_commands:
+            if self.unsafe:
+                env[cmd] = getattr(interface, cmd)
+            else:
+                env[cmd] = _refuseCommand(cmd)
+        env['__file__'] = filename
+
+        # allow import to happen relative to loaded file
+        interface.AddImportPath( os.path.dirname(filename) )
+
+        doc.suspendUpdates()
+        try:
+            if commands is None:
+                exec script in env
+            else:
+                document.runSavedCommands(commands, interface, env)
+        finally:
+            doc.enableUpdates()
+        doc.setModified(False)
+        doc.clearHistory()
+        return doc
+
+    def getDocument(self, filename):
+        """Return (document, whether cached)."""
+
+        filename = os.path.abspath(filename)
+        st = os.stat(filename)
+        stamp = (st.st_mtime, st.st_size)
+
+        cached = self.documents.get(filename)
+        if cached is not None and cached[0] == stamp:
+            return cached[1], True
+
+        doc = self.loadDocument(filename)
+        self.documents[filename] = (stamp, doc)
+        return doc, False
+
+    def makeDataset(self, val):
+        """Make a dataset for an override given in a request."""
+
+        import veusz.document as document
+
+        if isinstance(val, dict):
+            cols = dict( [(str(k), v) for k, v in val.iteritems()
+                          if k in ('data', 'serr', 'perr', 'nerr')] )
+            return document.Dataset(**cols)
+        elif val and isinstance(val[0], basestring):
+            return document.DatasetText(val)
+        else:
+            return document.Dataset(data=val)
+
+    def exportPage(self, doc, page, fmt, params):
+        """Export page of document in format given, returning the data."""
+
+        import veusz.document as document
+
+        args = {}
+        for name in _exportparams:
+            if name in params:
+                args[ {'dpi': 'bitmapdpi'}.get(name, name) ] = params[name]
+
+        fd, filename = tempfile.mkstemp(suffix='.'+fmt)
+        os.close(fd)
+        try:
+            document.Export(doc, filename, page, **args).export()
+            f = open(filename, 'rb')
+            data = f.read()
+            f.close()
+        finally:
+            os.unlink(filename)
+        return data
+
+    def render(self, request):
+        """Handle render request, returning (reply, data)."""
+
+        metrics = {}
+        start = time.time()
+        doc, metrics['cached'] = self.getDocument(request['document'])
+        metrics['load'] = time.time() - start
+
+        old = {}
+        try:
+            # replace datasets given, keeping the old ones to put back
+            start = time.time()
+            for name, val in request.get('datasets', {}).iteritems():
+                ds = self.makeDataset(val)
+                old[name] = doc.data.get(name)
+                doc.setData(name, ds)
+            metrics['datasets'] = time.time() - start
+
+            fmt = request.get('format', 'png').lower()
+            page = request.get('page', 0)
+            if page < 0 or page >= doc.getNumberPages():
+                raise ServiceError, "Page %i does not exist" % page
+
+            start = time.time()
+            data = self.exportPage(doc, page, fmt, request)
+            metrics['render'] = time.time() - start
+        finally:
+            for name, ds in old.iteritems():
+                if ds is None:
+                    doc.deleteData(name)
+                else:
+                    doc.setData(name, ds)
+
+        return {'status': 'ok', 'format': fmt, 'metrics': metrics}, data
+
+def runworker(args):
+    """Run a worker process, reading requests from stdin and
+    writing replies to stdout. args are the number of documents to
+    keep and optionally --unsafe-mode."""
+
+    maxdocs = int(args[0])
+    unsafe = '--unsafe-mode' in args[1:]
+
+    # replies go to the real stdout, and anything printed to stderr
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    requests = sys.stdin
+
+    # import everything up front
+    import veusz.qtall as qt4
+    app = qt4.QApplication([])
+    import veusz.setting as setting
+    import veusz.widgets
+    import veusz.document as document
+    document.Document.loadPendingPlugins()
+    setting.transient_settings['unsafe_mode'] = unsafe
+
+    renderer = DocumentRenderer(maxdocs, unsafe=unsafe)
+    while True:
+        try:
+            request = cPickle.loads(readMessage(requests))
+        except EOFError:
+            break
+
+        try:
+            reply = renderer.render(request)
+        except Exception, e:
+            reply = {'status': 'error', 'error': unicode(e)}, ''
+        writeMessage(replies, cPickle.dumps(reply, -1))
+
+class Worker(object):
+    """Worker process, run from the service.
+
+    If timeout is set, the process is killed if it does not reply to
+    a request within timeout seconds.
+    """
+
+    def __init__(self, maxdocs, unsafe, timeout=None):
+        self.maxdocs = maxdocs
+        self.unsafe = unsafe
+        self.timeout = timeout
+        self.timedout = False
+
+        # documents this worker has loaded recently
+        self.documents = []
+        self.requests = 0
+        self.start()
+
+    def start(self):
+        """Start worker process."""
+        thisdir = os.path.dirname(os.path.abspath(__file__))
+        cmd = [sys.executable, os.path.join(thisdir, 'veusz_main.py'),
+               '--render-worker', str(self.maxdocs)]
+        if self.unsafe:
+            cmd.append('--unsafe-mode')
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE)
+        self.documents = []
+
+    def kill(self):
+        """Kill worker process, as it has not replied in time."""
+        self.timedout = True
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+
+    def render(self, request):
+        """Render request in worker, returning (reply, data)."""
+
+        self.timedout = False
+        timer = None
+        if self.timeout:
+            timer = threading.Timer(self.timeout, self.kill)
+            timer.start()
+
+        reply = None
+        try:
+            try:
+                writeMessage(self.process.stdin, cPickle.dumps(request, -1))
+                reply = cPickle.loads(readMessage(self.process.stdout))
+            except (EOFError, EnvironmentError):
+                pass
+        finally:
+            if timer is not None:
+                timer.cancel()
+                timer.join()
+
+        if reply is None or self.timedout:
+            # worker has died or been killed, so start another
+            self.process.wait()
+            self.start()
+        if reply is None:
+            if self.timedout:
+                error = 'Worker process timed out'
+            else:
+                error = 'Worker process failed'
+            return {'status': 'error', 'error': error}, ''
+
+        self.requests += 1
+        filename = request['document']
+        if filename in self.documents:
+            self.documents.remove(filename)
+        self.documents.append(filename)
+        del self.documents[:-self.maxdocs]
+        return reply
+
+    def stop(self):
+        """Stop worker process."""
+        self.process.stdin.close()
+        self.process.wait()
+
+class WorkerPool(object):
+    """A pool of workers, handling one request each at a time.
+
+    At most maxqueue requests wait for a worker, after which requests
+    are refused as the service is busy. Only documents under the root
+    directory are rendered. Workers taking longer than timeout seconds
+    for a request are restarted.
+    """
+
+    def __init__(self, numworkers, maxqueue, maxdocs, root, unsafe=False,
+                 timeout=None):
+        self.root = os.path.realpath(root)
+        self.workers = [Worker(maxdocs, unsafe, timeout=timeout)
+                        for i in xrange(numworkers)]
+        self.idle = list(self.workers)
+        self.maxqueue = maxqueue
+        self.waiting = 0
+        self.cond = threading.Condition()
+
+        # totals for metrics
+        self.starttime = time.time()
+        self.counts = {'ok': 0, 'error': 0, 'busy': 0}
+        self.totals = {}
+
+    def acquire(self, filename):
+        """Get an idle worker, preferring one which has loaded
+        filename recently."""
+
+        self.cond.acquire()
+        try:
+            if not self.idle and self.waiting >= self.maxqueue:
+                raise ServiceError, "Too many requests waiting"
+
+            self.waiting += 1
+            try:
+                while not self.idle:
+                    self.cond.wait()
+            finally:
+                self.waiting -= 1
+
+            worker = self.idle[0]
+            for w in self.idle:
+                if filename in w.documents:
+                    worker = w
+                    break
+            self.idle.remove(worker)
+            return worker
+        finally:
+            self.cond.release()
+
+    def release(self, worker):
+        """Return worker to the pool."""
+        self.cond.acquire()
+        try:
+            self.idle.append(worker)
+            self.cond.notify()
+        finally:
+            self.cond.release()
+
+    def render(self, request):
+        """Render request using a worker, returning (reply, data)."""
+
+        start = time.time()
+        try:
+            request['document'] = resolveDocument(self.root,
+                                                  request['document'])
+        except ServiceError, e:
+            reply, data = {'status': 'error', 'error': unicode(e)}, ''
+            self.addMetrics(reply)
+            return reply, data
+
+        try:
+            worker = self.acquire(request['document'])
+        except ServiceError, e:
+            reply, data = {'status': 'busy', 'error': unicode(e)}, ''
+        else:
+            queued = time.time()
+            try:
+                reply, data = worker.render(request)
+            finally:
+                self.release(worker)
+            if 'metrics' in reply:
+                reply['metrics']['queue'] = queued - start
+                reply['metrics']['total'] = time.time() - start
+
+        self.addMetrics(reply)
+        return reply, data
+
+    def addMetrics(self, reply):
+        """Add reply to the metrics for the service."""
+        self.cond.acquire()
+        try:
+            self.counts[reply['status']] += 1
+            for name, val in reply.get('metrics', {}).iteritems():
+                self.totals[name] = self.totals.get(name, 0) + val
+        finally:
+            self.cond.release()
+
+    def metrics(self):
+        """Return metrics for the service."""
+        self.cond.acquire()
+        try:
+            ok = self.counts['ok']
+            means = dict( [(name, float(val)/ok)
+                           for name, val in self.totals.iteritems()] )
+            return {
+                'status': 'ok',
+                'uptime': time.time() - self.starttime,
+                'requests': dict(self.counts),
+                'mean': means,
+                'workers': [w.requests for w in self.workers],
+                'idle': len(self.idle),
+                'waiting': self.waiting,
+                }
+        finally:
+            self.cond.release()
+
+    def stop(self):
+        """Stop the workers."""
+        for w in self.workers:
+            w.stop()
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    """Read requests from a connection until it is closed."""
+
+    def handle(self):
+        import json
+
+        pool = self.server.pool
+        while True:
+            try:
+                request = json.loads(readMessage(self.rfile))
+            except EOFError:
+                break
+            except ValueError:
+                reply, data = {'status': 'error', 'error': 'Invalid request'}, ''
+            else:
+                cmd = request.get('command', 'render')
+                if cmd == 'render' and 'document' in request:
+                    reply, data = pool.render(request)
+                elif cmd == 'metrics':
+                    reply, data = pool.metrics(), ''
+                elif cmd == 'ping':
+                    reply, data = {'status': 'ok'}, ''
+                else:
+                    reply, data = {'status': 'error',
+                                   'error': 'Invalid command'}, ''
+
+            writeMessage(self.wfile, json.dumps(reply))
+            writeMessage(self.wfile, data)
+
+if hasattr(socket, 'AF_UNIX'):
+    class UnixServer(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+        daemon_threads = True
+
+        def server_bind(self):
+            """Create socket only usable by this user."""
+            oldmask = os.umask(0177)
+            try:
+                SocketServer.UnixStreamServer.server_bind(self)
+            finally:
+                os.umask(oldmask)
+            os.chmod(self.server_address, 0600)
+
+class TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def defaultAddress():
+    """Return address to listen on if none is given: a unix socket
+    in the temporary directory if possible, else a port on localhost."""
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.join(tempfile.gettempdir(),
+                            'veusz-render-%i' % os.getuid())
+    return 'localhost:8765'
+
+def makeServer(address):
+    """Make server for address, which is host:port or a unix socket
+    filename."""
+    if ':' in address or not hasattr(socket, 'AF_UNIX'):
+        host, port = address.rsplit(':', 1)
+        return TCPServer( (host or 'localhost', int(port)), RequestHandler )
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        return UnixServer(address, RequestHandler)
+
+def runservice(args):
+    """Run the render service, with the command line arguments given."""
+
+    parser = optparse.OptionParser(
+        usage='%prog --render-service [options]')
+    parser.add_option('--address', default=defaultAddress(),
+                      help='unix socket filename or host:port to listen '
+                      'on (a port is usable by anyone who can connect) '
+                      '[default %default]')
+    parser.add_option('--root', default=os.getcwd(),
+                      help='directory containing the documents which '
+                      'can be rendered [default %default]')
+    parser.add_option('--unsafe-mode', action='store_true',
+                      help='allow documents with unsafe code or commands')
+    parser.add_option('--workers', type='int', default=2,
+                      help='number of worker processes [default %default]')
+    parser.add_option('--max-queue', type='int', default=16,
+                      help='maximum number of requests waiting for a '
+                      'worker [default %default]')
+    parser.add_option('--cache-docs', type='int', default=8,
+                      help='number of documents each worker keeps '
+                      'loaded [default %default]')
+    parser.add_option('--timeout', type='float', default=60.,
+                      help='seconds after which a worker not replying '
+                      'to a request is restarted (0 for no limit) '
+                      '[default %default]')
+    options, args = parser.parse_args(args)
+
+    server = makeServer(options.address)
+    server.pool = WorkerPool(options.workers, options.max_queue,
+                             options.cache_docs, options.root,
+                             unsafe=options.unsafe_mode,
+                             timeout=options.timeout)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.pool.stop()
+
+def request(address, req, timeout=None):
+    """Send request (a dict) to the service at address, returning
+    (reply, data). Provided for clients written in Python 2.6 or later.
+
+    If timeout is set, socket.timeout is raised if the service does
+    not reply within timeout seconds.
+    """
+
+    import json
+
+    if ':' in address or not hasattr(socket, 'AF_UNIX'):
+        host, port = address.rsplit(':', 1)
+        sock = socket.create_connection( (host or 'localhost', int(port)),
+                                         timeout )
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(address)
+
+    f = sock.makefile('rwb')
+    try:
+        writeMessage(f, json.dumps(req))
+        reply = json.loads(readMessage(f))
+        data = readMessage(f)
+    finally:
+        f.close()
+        sock.close()
+    return reply, data
@@ -42,6 +42,10 @@ defaultValues = {
     'plot_updatepolicy': -1, # update on document changed
     'plot_antialias': True,
     'plot_numthreads': 2,
+    'plot_rendercache': False, # keep drawn pages on disk
+    'plot_rendercache_size': 256, # megabytes
+    'plot_rendercache_dir': '', # default cache location if empty
+    'plot_imagecache_size': 256, # megabytes of decoded images
 
     # recent files list
     'main_recentfiles': [],
@@ -29,10 +29,39 @@ def _(text, disambiguation=None, context="Setting"):
     return unicode(
         qt4.QCoreApplication.translate(context, text, disambiguation))
 
+class _LazySettingsDict(dict):
+    """Dictionary of settings which calls a function to add a missing
+    entry when it is first looked up."""
+
+    def __init__(self, lookup):
+        dict.__init__(self)
+        self.lookup = lookup
+
+    def _check(self, name):
+        if not dict.__contains__(self, name):
+            self.lookup(name)
+
+    def __contains__(self, name):
+        self._check(name)
+        return dict.__contains__(self, name)
+
+    def __getitem__(self, name):
+        self._check(name)
+        return dict.__getitem__(self, name)
+
+    def get(self, name, default=None):
+        self._check(name)
+        return dict.get(self, name, default)
+
 class StyleSheet(Settings):
     """A class for handling default values of settings.
     
-    Settings are registered to be added to the stylesheet."""
+    Settings are registered to be added to the stylesheet.
+
+    If lazyfill is given, it is called with the name of a missing
+    subsetting when it is looked up, so that it can be added on
+    demand. It is called with None if all the settings should be added.
+    """
 
     registeredsettings = []
 
@@ -46,14 +75,22 @@ class StyleSheet(Settings):
         else:
             kls.registeredsettings.insert(posn, settingskls)
 
-    def __init__(self, **args):
+    def __init__(self, lazyfill=None, **args):
         """Create the default settings."""
         Settings.__init__(self, 'StyleSheet', setnsmode='stylesheet', **args)
         self.pixmap = 'settings_stylesheet'
+        self.lazyfill = lazyfill
+        if lazyfill is not None:
+            self.__dict__['setdict'] = _LazySettingsDict(lazyfill)
 
         for subset in self.registeredsettings:
             self.add( subset() )
 
+    def fillAll(self):
+        """Make sure any settings added on demand are present."""
+        if self.lazyfill is not None:
+            self.lazyfill(None)
+
 class StylesheetLine(Settings):
     """Hold the properties of the default line."""
     def __init__(self):
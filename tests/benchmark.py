@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Measure the speed of Veusz on large synthetic documents.
+
+Data files are generated for several scenarios (a large scatter plot,
+a dense 2D image, a page of many graphs and a long date series). For
+each, the time taken by each phase is measured separately:
+
+ import         reading the data files
+ eval           creating and evaluating dataset expressions
+ autorange      finding the ranges of the axes from the data
+ draw           drawing the page, also split into draw:<widget type>
+                for the time spent in the widgets of each type,
+                excluding their children
+ save           saving the document
+ load           loading the saved document
+ export:<fmt>   exporting the page to each format
+
+Each scenario is run several times with a new document, and the median
+times are reported. The results can be written to a JSON file. If a
+baseline file written previously is given, the times are compared to
+it, and the program returns 1 if any phase is slower by more than the
+threshold.
+
+Usage: benchmark.py [options]
+
+This program requires the veusz module to be on the PYTHONPATH.
+
+On Unix/Linux, Qt requires the DISPLAY environment to be set to an X11
+server for the benchmark to run. In a non graphical environment Xvfb
+can be used to create a hidden X11 server.
+"""
+
+import os
+import os.path
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+import platform
+import datetime
+import json
+
+import numpy as N
+
+import veusz.qtall as qt4
+import veusz.utils as utils
+import veusz.document as document
+import veusz.setting as setting
+import veusz.widgets
+from veusz.widgets.page import _AxisDependHelper
+
+# differences smaller than this (in seconds) are never regressions
+mintimediff = 0.01
+
+def writeColumns(filename, cols, fmt):
+    """Write columns of values to a text file, a row per line."""
+    f = open(filename, 'w')
+    for row in N.column_stack(cols):
+        f.write(fmt % tuple(row))
+    f.close()
+
+class Scatter(object):
+    """A scatter plot of many points with error bars."""
+
+    name = 'scatter'
+
+    def __init__(self, scale):
+        self.npts = int(200000*scale)
+
+    def makeFiles(self, dirname, rand):
+        x = rand.uniform(0., 100., self.npts)
+        y = N.sin(x*0.1)*10. + rand.normal(0., 1., self.npts)
+        yerr = N.abs(rand.normal(0., 0.5, self.npts))
+        writeColumns(os.path.join(dirname, 'scatter.dat'),
+                     (x, y, yerr), '%g %g %g\n')
+
+    def importData(self, ci, dirname):
+        ci.ImportFile(os.path.join(dirname, 'scatter.dat'), 'x y,+-')
+
+    def evalData(self, ci):
+        ci.SetDataExpression('z', 'x*2+sin(y)', symerr='y*0.1', linked=True)
+        return ['z']
+
+    def makeWidgets(self, ci):
+        ci.To(ci.Add('page'))
+        ci.To(ci.Add('graph'))
+        ci.Add('xy', xData='x', yData='y', marker='circle',
+               markerSize='1pt')
+        ci.Add('xy', xData='x', yData='z', PlotLine__hide=True,
+               marker='square', markerSize='1pt')
+
+class Image(object):
+    """A dense 2D image with a colour bar."""
+
+    name = 'image'
+
+    def __init__(self, scale):
+        self.size = int(1000*N.sqrt(scale))
+
+    def makeFiles(self, dirname, rand):
+        x, y = N.indices( (self.size, self.size) ) * (10./self.size)
+        img = N.sin(x)*N.cos(y) + rand.normal(0., 0.1, x.shape)
+        N.savetxt(os.path.join(dirname, 'image.dat'), img, fmt='%g')
+
+    def importData(self, ci, dirname):
+        ci.ImportFile2D(os.path.join(dirname, 'image.dat'), 'img',
+                        xrange=(0., 10.), yrange=(0., 10.))
+
+    def evalData(self, ci):
+        ci.SetData2DExpression('img2', 'img*2+1', linked=True)
+        return ['img2']
+
+    def makeWidgets(self, ci):
+        ci.To(ci.Add('page'))
+        ci.To(ci.Add('graph'))
+        ci.Add('image', name='image1', data='img2', colorMap='heat')
+        ci.Add('colorbar', widgetName='image1', direction='vertical')
+
+class ManyWidgets(object):
+    """A page with a grid of many graphs."""
+
+    name = 'manywidgets'
+
+    def __init__(self, scale):
+        self.ngraphs = max(int(100*scale), 1)
+        self.npts = 1000
+
+    def makeFiles(self, dirname, rand):
+        f = open(os.path.join(dirname, 'many.csv'), 'w')
+        f.write(','.join(['x%i,y%i' % (i, i) for i in xrange(self.ngraphs)]))
+        f.write('\n')
+        cols = []
+        for i in xrange(self.ngraphs):
+            x = N.arange(self.npts)*0.1
+            cols += [x, N.cumsum(rand.normal(0., 1., self.npts))]
+        for row in N.column_stack(cols):
+            f.write(','.join(['%g' % v for v in row]))
+            f.write('\n')
+        f.close()
+
+    def importData(self, ci, dirname):
+        ci.ImportFileCSV(os.path.join(dirname, 'many.csv'))
+
+    def evalData(self, ci):
+        names = []
+        for i in xrange(self.ngraphs):
+            ci.SetDataExpression('z%i' % i, 'y%i*0.5' % i, linked=True)
+            names.append('z%i' % i)
+        return names
+
+    def makeWidgets(self, ci):
+        ci.To(ci.Add('page'))
+        columns = int(N.ceil(N.sqrt(self.ngraphs)))
+        ci.To(ci.Add('grid', columns=columns,
+                     rows=(self.ngraphs+columns-1) // columns))
+        for i in xrange(self.ngraphs):
+            ci.To(ci.Add('graph'))
+            ci.Add('xy', xData='x%i' % i, yData='y%i' % i, marker='none')
+            ci.Add('xy', xData='x%i' % i, yData='z%i' % i, marker='none')
+            ci.To('..')
+
+class Dates(object):
+    """A long series of values against dates."""
+
+    name = 'dates'
+
+    def __init__(self, scale):
+        self.npts = int(100000*scale)
+
+    def makeFiles(self, dirname, rand):
+        start = datetime.datetime(2000, 1, 1)
+        f = open(os.path.join(dirname, 'dates.csv'), 'w')
+        f.write('t,v\n')
+        vals = N.cumsum(rand.normal(0., 1., self.npts))
+        for i, v in enumerate(vals):
+            t = start + datetime.timedelta(hours=i)
+            f.write('%s,%g\n' % (t.strftime('%Y-%m-%dT%H:%M:%S'), v))
+        f.close()
+
+    def importData(self, ci, dirname):
+        ci.ImportFileCSV(os.path.join(dirname, 'dates.csv'))
+
+    def evalData(self, ci):
+        ci.SetDataExpression('v2', 'v*2+1', linked=True)
+        return ['v2']
+
+    def makeWidgets(self, ci):
+        ci.To(ci.Add('page'))
+        ci.To(ci.Add('graph'))
+        ci.Set('x/mode', 'datetime')
+        ci.Add('xy', xData='t', yData='v', marker='none')
+        ci.Add('xy', xData='t', yData='v2', marker='none')
+
+scenarioclasses = (Scatter, Image, ManyWidgets, Dates)
+
+def timeit(results, phase, func, *args):
+    """Call func with args, storing time taken in results."""
+    start = time.time()
+    retn = func(*args)
+    results[phase] = time.time() - start
+    return retn
+
+def autorange(doc):
+    """Compute the ranges of all the axes in the document."""
+    for pagenum in xrange(doc.getNumberPages()):
+        helper = _AxisDependHelper(doc.getPage(pagenum))
+        helper.findPlotters()
+        helper.findAxisRanges()
+        for axis in helper.axes:
+            axis.getPlottedRange()
+
+def draw(doc, widgettimes):
+    """Draw each page of document, adding the time spent drawing
+    widgets, excluding their children, to widgettimes by type."""
+    for pagenum in xrange(doc.getNumberPages()):
+        helper = document.PaintHelper(
+            doc.pageSize(pagenum, dpi=(100, 100)), dpi=(100, 100),
+            profile=True)
+        doc.paintTo(helper, pagenum)
+        for p in helper.profiles:
+            widgettimes[p.typename] = ( widgettimes.get(p.typename, 0.) +
+                                        p.selftime )
+
+def evaluate(doc, scenario, ci):
+    """Create expression datasets and get their values."""
+    for name in scenario.evalData(ci):
+        doc.data[name].data
+
+def runScenario(scenario, dirname, formats):
+    """Run each phase of scenario once, returning dict of times."""
+
+    results = {}
+    doc = document.Document()
+    ci = document.CommandInterface(doc)
+
+    timeit(results, 'import', scenario.importData, ci, dirname)
+    timeit(results, 'eval', evaluate, doc, scenario, ci)
+    scenario.makeWidgets(ci)
+    timeit(results, 'autorange', autorange, doc)
+
+    widgettimes = {}
+    timeit(results, 'draw', draw, doc, widgettimes)
+    for wtype, t in widgettimes.iteritems():
+        results['draw:%s' % wtype] = t
+
+    vsz = os.path.join(dirname, 'out.vsz')
+    timeit(results, 'save', ci.Save, vsz)
+    loaddoc = document.Document()
+    loadci = document.CommandInterpreter(loaddoc)
+    timeit(results, 'load', loadci.Load, vsz)
+
+    for fmt in formats:
+        out = os.path.join(dirname, 'out.%s' % fmt)
+        timeit(results, 'export:%s' % fmt, ci.Export, out)
+        os.unlink(out)
+
+    return results
+
+def median(vals):
+    vals = sorted(vals)
+    return vals[len(vals)//2]
+
+def runBenchmarks(scenarios, runs, formats):
+    """Run scenarios, returning dict of scenario to median phase times."""
+
+    out = {}
+    dirname = tempfile.mkdtemp(prefix='veuszbench')
+    try:
+        for scenario in scenarios:
+            scenario.makeFiles(dirname, N.random.RandomState(42))
+            runresults = [runScenario(scenario, dirname, formats)
+                          for i in xrange(runs)]
+            phases = set()
+            for r in runresults:
+                phases.update(r.keys())
+            out[scenario.name] = dict(
+                [ (phase, median([r.get(phase, 0.) for r in runresults]))
+                  for phase in phases ] )
+    finally:
+        shutil.rmtree(dirname)
+    return out
+
+def compareBaseline(results, baseline, threshold):
+    """Print results compared to the baseline.
+    Returns list of (scenario, phase) which are slower than the
+    baseline by more than threshold percent."""
+
+    regressions = []
+    print '%-12s %-20s %10s %10s %9s' % ('scenario', 'phase', 'time/s',
+                                          'baseline/s', 'change')
+    for scenario in sorted(results):
+        for phase in sorted(results[scenario]):
+            t = results[scenario][phase]
+            base = baseline.get(scenario, {}).get(phase)
+            if base is None:
+                print '%-12s %-20s %10.3f %10s %9s' % (scenario, phase, t,
+                                                        '-', '-')
+                continue
+
+            change = 100.*(t-base)/base if base > 0 else 0.
+            flag = ''
+            if change > threshold and t-base > mintimediff:
+                regressions.append( (scenario, phase) )
+                flag = ' *'
+            print '%-12s %-20s %10.3f %10.3f %+8.1f%%%s' % (
+                scenario, phase, t, base, change, flag)
+    return regressions
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--runs', type='int', default=3,
+                      help='number of runs for each scenario [default 3]')
+    parser.add_option('--scale', type='float', default=1.,
+                      help='scale factor for size of datasets [default 1]')
+    parser.add_option('--scenarios',
+                      default=','.join([s.name for s in scenarioclasses]),
+                      help='comma separated scenarios to run [default %s]' %
+                      ','.join([s.name for s in scenarioclasses]))
+    parser.add_option('--formats', default='png,svg,pdf,eps',
+                      help='comma separated formats to export to '
+                      '[default png,svg,pdf,eps]')
+    parser.add_option('--output', metavar='FILE',
+                      help='write results to FILE in JSON format')
+    parser.add_option('--baseline', metavar='FILE',
+                      help='compare results to FILE written by --output')
+    parser.add_option('--threshold', type='float', default=20.,
+                      help='percentage slower than baseline which is a '
+                      'regression [default 20]')
+    options, args = parser.parse_args()
+
+    app = qt4.QApplication(sys.argv)
+    setting.transient_settings['unsafe_mode'] = False
+
+    # do not measure the caches of drawn pages
+    setting.settingdb['plot_rendercache'] = False
+
+    names = options.scenarios.split(',')
+    scenarios = [s(options.scale) for s in scenarioclasses if s.name in names]
+    if len(scenarios) != len(names):
+        parser.error('unknown scenario in %s' % options.scenarios)
+    formats = [f for f in options.formats.split(',') if f]
+
+    results = runBenchmarks(scenarios, options.runs, formats)
+
+    if options.output:
+        f = open(options.output, 'w')
+        json.dump( {
+                'version': utils.version(),
+                'python': platform.python_version(),
+                'qt': str(qt4.qVersion()),
+                'platform': platform.platform(),
+                'runs': options.runs,
+                'scale': options.scale,
+                'results': results,
+                }, f, indent=1, sort_keys=True )
+        f.close()
+
+    baseline = {}
+    if options.baseline:
+        f = open(options.baseline)
+        baseline = json.load(f)['results']
+        f.close()
+
+    regressions = compareBaseline(results, baseline, options.threshold)
+    if regressions:
+        print '%i phases slower than baseline by more than %g%%' % (
+            len(regressions), options.threshold)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+#    Copyright (C) 2011 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Measure the startup time of the command line export path.
+
+Each run is made in a fresh interpreter, which imports Veusz, loads a
+document and exports it, as "veusz --export" does. The same runs are
+made with every widget module imported up front, as Veusz did before
+widgets were loaded on first use, so the two can be compared.
+
+Usage: benchstartup.py [--runs=N] [document.vsz]
+
+This program requires the veusz module to be on the PYTHONPATH.
+"""
+
+import os
+import os.path
+import sys
+import subprocess
+import tempfile
+import optparse
+
+# code run in the child interpreter
+# prints time to import, time to load and export, and number of
+# widget modules imported
+childcode = r'''
+import sys, time
+start = time.time()
+import veusz.qtall as qt4
+app = qt4.QApplication([])
+import veusz.document as document
+import veusz.widgets
+import veusz.setting as setting
+if %(eager)s:
+    document.thefactory.listWidgetClasses()
+imported = time.time()
+setting.transient_settings['unsafe_mode'] = True
+doc = document.Document()
+ci = document.CommandInterpreter(doc)
+ci.Load(%(vsz)r)
+ci.run('Export(%%s)' %% repr(%(out)r))
+done = time.time()
+nwidgets = len([m for m in sys.modules
+                if m.startswith('veusz.widgets.') and sys.modules[m]])
+print imported-start, done-imported, done-start, nwidgets
+'''
+
+def runChild(vsz, out, eager):
+    """Run export in a new interpreter, returning timings."""
+    code = childcode % {'vsz': vsz, 'out': out, 'eager': eager}
+    p = subprocess.Popen([sys.executable, '-c', code],
+                         stdout=subprocess.PIPE)
+    stdout = p.communicate()[0]
+    if p.returncode != 0:
+        raise RuntimeError('Export failed for %s' % vsz)
+    vals = stdout.strip().split('\n')[-1].split()
+    return [float(v) for v in vals[:3]] + [int(vals[3])]
+
+def median(vals):
+    vals = sorted(vals)
+    return vals[len(vals)//2]
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [document.vsz]')
+    parser.add_option('--runs', type='int', default=5,
+                      help='number of runs for each mode [default 5]')
+    options, args = parser.parse_args()
+
+    if args:
+        vsz = os.path.abspath(args[0])
+    else:
+        thisdir = os.path.dirname(os.path.abspath(__file__))
+        vsz = os.path.join(thisdir, '..', 'examples', 'sin.vsz')
+
+    fd, out = tempfile.mkstemp(suffix='.png')
+    os.close(fd)
+
+    # change to document directory so that linked files are found
+    os.chdir(os.path.dirname(vsz))
+
+    try:
+        print 'Exporting %s, %i runs each' % (vsz, options.runs)
+        print '%-8s %10s %10s %10s %8s' % ('mode', 'import/s', 'export/s',
+                                           'total/s', 'widgets')
+        results = {}
+        for mode, eager in (('eager', True), ('lazy', False)):
+            runs = [runChild(vsz, out, eager) for i in xrange(options.runs)]
+            res = [median([r[i] for r in runs]) for i in xrange(4)]
+            results[mode] = res
+            print '%-8s %10.3f %10.3f %10.3f %8i' % tuple([mode] + res)
+
+        saving = results['eager'][2] - results['lazy'][2]
+        print 'Median saving of lazy loading: %.3f s (%.1f%%)' % (
+            saving, 100.*saving/results['eager'][2])
+    finally:
+        os.unlink(out)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+##############################################################################
+
+"""Test reloading data appended to linked text and CSV files.
+
+Each test writes a data file, imports it linked, appends to the file
+and reloads with ReloadData(tailfollow=True). The datasets are checked
+against the values in the file, and whether the existing datasets were
+extended (appended data read) or replaced (full reload).
+
+This program requires the veusz module to be on the PYTHONPATH.
+"""
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import veusz.qtall as qt4
+import veusz.document as document
+import veusz.document.linked as linked
+
+class TailFollowTest(unittest.TestCase):
+    """Check reading of appended data."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.doc = document.Document()
+        self.ifc = document.CommandInterface(self.doc)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def writeFile(self, name, text, mode='wb'):
+        filename = os.path.join(self.tempdir, name)
+        f = open(filename, mode)
+        f.write(text)
+        f.close()
+        return filename
+
+    def values(self, name):
+        return list(self.doc.data[name].data)
+
+    def reload(self):
+        """Reload, returning whether the existing datasets were
+        extended."""
+        old = dict(self.doc.data)
+        self.ifc.ReloadData(tailfollow=True)
+        return all([self.doc.data.get(n) is ds for n, ds in old.iteritems()])
+
+    def testTextAppend(self):
+        fn = self.writeFile('a.dat', '1 2\n3 4\n')
+        self.ifc.ImportFile(fn, 'x y', linked=True)
+        self.writeFile('a.dat', '5 6\n', mode='ab')
+        self.assert_(self.reload())
+        self.assertEqual(self.values('x'), [1, 3, 5])
+        self.assertEqual(self.values('y'), [2, 4, 6])
+
+        # no change to the file
+        self.assert_(self.reload())
+        self.assertEqual(self.values('x'), [1, 3, 5])
+
+    def testCSVAppend(self):
+        fn = self.writeFile('a.csv', 'x,y\r\n1,2\r\n')
+        self.ifc.ImportFileCSV(fn, linked=True)
+        self.writeFile('a.csv', '3,4\r\n5,6\r\n', mode='ab')
+        self.assert_(self.reload())
+        self.assertEqual(self.values('x'), [1, 3, 5])
+        self.assertEqual(self.values('y'), [2, 4, 6])
+
+    def testPartialLineEnded(self):
+        # partial line read in the first import is later ended
+        fn = self.writeFile('a.dat', '1 2\n3 4')
+        self.ifc.ImportFile(fn, 'x y', linked=True)
+        self.assertEqual(self.values('x'), [1, 3])
+        self.writeFile('a.dat', '\n5 6\n', mode='ab')
+        self.assert_(self.reload())
+        self.assertEqual(self.values('x'), [1, 3, 5])
+
+    def testPartialLineContinued(self):
+        # partial line read in the first import is continued, so the
+        # value read from it was wrong
+        fn = self.writeFile('a.csv', 'x,y\n1,2\n3,4')
+        self.ifc.ImportFileCSV(fn, linked=True)
+        self.writeFile('a.csv', '5\n6,7\n', mode='ab')
+        self.failIf(self.reload())
+        self.assertEqual(self.values('x'), [1, 3, 6])
+        self.assertEqual(self.values('y'), [2, 45, 7])
+
+    def testPartialLineAppended(self):
+        # partial lines appended are read once they are complete
+        fn = self.writeFile('a.dat', '1 2\n')
+        self.ifc.ImportFile(fn, 'x y', linked=True)
+        self.writeFile('a.dat', '3 4\n5', mode='ab')
+        self.assert_(self.reload())
+        self.assertEqual(self.values('x'), [1, 3])
+        self.writeFile('a.dat', ' 6\n', mode='ab')
+        self.assert_(self.reload())
+        self.assertEqual(self.values('x'), [1, 3, 5])
+        self.assertEqual(self.values('y'), [2, 4, 6])
+
+    def testRewritten(self):
+        fn = self.writeFile('a.dat', '1 2\n3 4\n')
+        self.ifc.ImportFile(fn, 'x y', linked=True)
+        self.writeFile('a.dat', '7 8\n3 4\n5 6\n')
+        self.failIf(self.reload())
+        self.assertEqual(self.values('x'), [7, 3, 5])
+
+    def testShrunk(self):
+        fn = self.writeFile('a.dat', '1 2\n3 4\n')
+        self.ifc.ImportFile(fn, 'x y', linked=True)
+        self.writeFile('a.dat', '1 2\n')
+        self.failIf(self.reload())
+        self.assertEqual(self.values('x'), [1])
+
+    def testSplitLines(self):
+        self.assertEqual(
+            linked.splitLines(u'a\x0cb\x85\r\nc\rd\ne'),
+            [u'a\x0cb\x85\r\n', u'c\r', u'd\n', u'e'])
+
+if __name__ == '__main__':
+    app = qt4.QApplication([])
+    unittest.main()
@@ -22,6 +22,9 @@ from version import version
 from textrender import Renderer, FontMetrics
 from safe_eval import checkCode
 from fitlm import fitLM
+from histogram import chunkedRange, chunkedHistogram, chunkedHistogram2D
+from expression import CompiledExpression, compileExpression
+from imagecache import ImageCache, getImageCache, fileImageKey, dataImageKey
 
 from utilfuncs import *
 from points import *
@@ -1,4 +1,5 @@
 import math
+import itertools
 import datetime
 import re
 
@@ -268,3 +269,267 @@ def dateREMatchToDate(match):
 
     # return to veusz float time
     return datetimeToFloat(d)
+
+##############################################################################
+# conversion of arrays of dates
+
+def _civilToDays(year, month, day):
+    """Convert arrays of year, month and day to days since 1970-01-01
+    (proleptic Gregorian calendar)."""
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era*400
+    doy = (153*((month + 9) % 12) + 2)//5 + day - 1
+    doe = yoe*365 + yoe//4 - yoe//100 + doy
+    return era*146097 + doe - 719468
+
+def _daysToCivil(days):
+    """Convert array of days since 1970-01-01 to (year, month, day)."""
+    z = days + 719468
+    era = z // 146097
+    doe = z - era*146097
+    yoe = (doe - doe//1460 + doe//36524 - doe//146096) // 365
+    doy = doe - (365*yoe + yoe//4 - yoe//100)
+    mp = (5*doy + 2)//153
+    day = doy - (153*mp + 2)//5 + 1
+    month = N.where(mp < 10, mp+3, mp-9)
+    year = yoe + era*400 + (month <= 2)
+    return year, month, day
+
+# days from 1970-01-01 to offsetdate
+_offsetdays = int( _civilToDays(N.array([offsetdate.year]),
+                                N.array([offsetdate.month]),
+                                N.array([offsetdate.day]))[0] )
+
+def _fieldsToFloats(year, month, day, hour, minute, sec):
+    """Convert arrays of date and time fields to Veusz dates.
+    Returns (values, valid), where valid is False for fields which do
+    not make a valid date."""
+
+    year, month, day, hour, minute = [
+        N.asarray(x, dtype=N.int64)
+        for x in (year, month, day, hour, minute) ]
+    days = _civilToDays(year, month, day)
+
+    # reject dates like Feb 30th and out of range times
+    cy, cm, cd = _daysToCivil(days)
+    valid = ( (cy == year) & (cm == month) & (cd == day) &
+              (month >= 1) & (month <= 12) & (year >= 1) & (year <= 9999) &
+              (hour >= 0) & (hour < 24) & (minute >= 0) & (minute < 60) &
+              (sec >= 0) & (sec < 60) )
+
+    # seconds are kept to a microsecond, like datetime
+    sec = N.floor(sec*1e6 + 0.5)*1e-6
+    vals = ( (days - _offsetdays)*(24*60*60.) + hour*(60*60.) +
+             minute*60. + sec )
+    return vals, valid
+
+def _isoStringsToFloats(strings):
+    """Convert strings with exactly the layout YYYY-MM-DD, optionally
+    followed by a separator and hh:mm:ss[.sss], to Veusz dates.
+
+    Returns (values, valid), where valid is False for strings with
+    another layout or invalid dates."""
+
+    num = len(strings)
+    arr = N.array(strings, dtype=N.unicode_)
+    width = arr.dtype.itemsize // 4
+    if width < 10:
+        return N.zeros(num)+N.nan, N.zeros(num, dtype=N.bool_)
+
+    # unicode characters are stored as 32 bit integers (0 is padding)
+    codes = arr.view(N.uint32).reshape(num, width).astype(N.int64)
+    # pad so there is room for a time and fraction of second
+    if width < 21:
+        codes = N.hstack( (codes, N.zeros((num, 21-width), dtype=N.int64)) )
+    digits = codes - 48
+    isdigit = (digits >= 0) & (digits <= 9)
+
+    def number(start, stop):
+        """Integer in columns start to stop."""
+        val = N.zeros(num, dtype=N.int64)
+        for col in xrange(start, stop):
+            val = val*10 + digits[:,col]
+        return val
+
+    def alldigits(*cols):
+        return N.logical_and.reduce([isdigit[:,c] for c in cols])
+
+    valid = ( alldigits(0, 1, 2, 3, 5, 6, 8, 9) &
+              (codes[:,4] == 45) & (codes[:,7] == 45) )
+    enddate = ~N.any(codes[:,10:] != 0, axis=1)
+
+    # optional time part after a separator
+    sep = codes[:,10]
+    hastime = ( ( (sep == 32) | (sep == 44) | ((sep >= 65) & (sep <= 90)) |
+                  ((sep >= 97) & (sep <= 122)) ) &
+                alldigits(11, 12, 14, 15, 17, 18) &
+                (codes[:,13] == 58) & (codes[:,16] == 58) )
+
+    # optional fraction of second: a point followed by digits
+    rest = codes[:,19:]
+    nonzero = rest != 0
+    nopadding = N.all(N.diff(nonzero.astype(N.int8), axis=1) <= 0, axis=1)
+    fracok = ( (rest[:,0] == 46) & isdigit[:,20] &
+               N.all(isdigit[:,20:] | ~nonzero[:,1:], axis=1) )
+    endtime = nopadding & (~nonzero[:,0] | fracok)
+    scale = 10.**-N.arange(1, rest.shape[1])
+    fracval = N.where(isdigit[:,20:], digits[:,20:], 0).dot(scale)
+
+    hastime &= endtime
+    valid &= enddate | hastime
+
+    zero = N.zeros(num, dtype=N.int64)
+    hour = N.where(hastime, number(11, 13), zero)
+    minute = N.where(hastime, number(14, 16), zero)
+    sec = N.where(hastime, number(17, 19) + fracval, 0.)
+
+    vals, ok = _fieldsToFloats(number(0, 4), number(5, 7), number(8, 10),
+                               hour, minute, sec)
+    valid &= ok
+    vals[~valid] = N.nan
+    return vals, valid
+
+def _reMatchesToFloats(strings, datere):
+    """Convert strings matching regular expression datere (from
+    dateStrToRegularExpression) to Veusz dates."""
+
+    num = len(strings)
+    fields = N.zeros( (6, num) )
+    fields[:] = N.array( [offsetdate.year, offsetdate.month, offsetdate.day,
+                          offsetdate.hour, offsetdate.minute,
+                          offsetdate.second] )[:,N.newaxis]
+    valid = N.zeros(num, dtype=N.bool_)
+
+    for i, s in enumerate(strings):
+        m = datere.match(s)
+        if m is None:
+            continue
+        grps = m.groupdict()
+        row = fields[:,i]
+        if grps.get('YYYY') is not None:
+            row[0] = int(grps['YYYY'])
+        if grps.get('YY') is not None:
+            y = int(grps['YY'])
+            row[0] = y + (2000, 1900)[y >= 70]
+        if grps.get('MM') is not None:
+            row[1] = int(grps['MM'])
+        if grps.get('DD') is not None:
+            row[2] = int(grps['DD'])
+        if grps.get('hh') is not None:
+            row[3] = int(grps['hh'])
+        if grps.get('mm') is not None:
+            row[4] = int(grps['mm'])
+        if grps.get('ss') is not None:
+            row[5] = float(grps['ss'])
+        # need at least one group to match
+        valid[i] = any([v is not None for v in grps.itervalues()])
+
+    vals, ok = _fieldsToFloats(*fields)
+    vals[~(valid & ok)] = N.nan
+    return vals
+
+def dateStringsToFloats(strings, datere=None):
+    """Convert a sequence of date strings to an array of Veusz dates.
+
+    If datere is None, strings are interpreted as by dateStringToDate.
+    Strings in the common ISO layouts are converted in a single pass
+    and the others are converted one at a time.
+
+    Otherwise datere is a compiled regular expression from
+    dateStrToRegularExpression, used to read each string.
+
+    Values which cannot be converted are returned as nan.
+    """
+
+    strings = list(strings)
+    if len(strings) == 0:
+        return N.array([], dtype=N.float64)
+
+    if datere is not None:
+        return _reMatchesToFloats(strings, datere)
+
+    try:
+        vals, valid = _isoStringsToFloats(strings)
+    except UnicodeError:
+        vals, valid = N.zeros(len(strings)), N.zeros(len(strings), N.bool_)
+
+    # fall back to slower conversion for other formats
+    for i in N.nonzero(~valid)[0]:
+        vals[i] = dateStringToDate(strings[i])
+    return vals
+
+def dateFloatsToFields(vals):
+    """Split array of finite Veusz dates into arrays of
+    (year, month, day, hour, minute, second, microsecond)."""
+
+    # split off days and seconds first to keep precision, rounding
+    # as floatToDateTime does
+    vals = N.asarray(vals, dtype=N.float64)
+    days = N.trunc(vals / (24*60*60))
+    rem = vals - days*(24*60*60)
+    secs = N.trunc(rem)
+    frac = (rem - secs)*1e6
+    micro = ( secs.astype(N.int64)*1000000 +
+              (N.sign(frac)*N.floor(N.abs(frac)+0.5)).astype(N.int64) )
+    days = days.astype(N.int64) + _offsetdays
+
+    # rounding can take the time to the next day
+    dayus = 24*60*60*1000000
+    days += micro // dayus
+    micro %= dayus
+
+    year, month, day = _daysToCivil(days)
+    sec, usec = micro // 1000000, micro % 1000000
+    return ( year, month, day, sec // 3600, (sec // 60) % 60, sec % 60,
+             usec )
+
+def _putDigits(out, col, vals, ndigits):
+    """Write ndigits digits of vals as characters in out, starting at
+    column col."""
+    for i in xrange(ndigits-1, -1, -1):
+        out[:, col+i] = 48 + vals % 10
+        vals = vals // 10
+
+# range of dates which datetime can represent
+_mindatefloat = datetimeToFloat(datetime.datetime.min)
+_maxdatefloat = datetimeToFloat(datetime.datetime.max)
+
+def dateFloatsToStrings(vals):
+    """Convert array of Veusz dates to a list of strings, as given by
+    dateFloatToString."""
+
+    vals = N.asarray(vals, dtype=N.float64).ravel()
+    out = [None]*len(vals)
+
+    # the dates which can be written quickly
+    olderr = N.seterr(invalid='ignore')
+    try:
+        fast = (vals >= _mindatefloat) & (vals < _maxdatefloat)
+    finally:
+        N.seterr(**olderr)
+    idx = N.nonzero(fast)[0]
+    if len(idx) != 0:
+        year, month, day, hour, minute, sec, usec = dateFloatsToFields(
+            vals[idx])
+
+        # build characters of YYYY-MM-DDTHH:MM:SS.ffffff
+        chars = N.zeros( (len(idx), 26), dtype=N.uint8 )
+        for col, v, n in ( (0, year, 4), (5, month, 2), (8, day, 2),
+                           (11, hour, 2), (14, minute, 2), (17, sec, 2),
+                           (20, usec, 6) ):
+            _putDigits(chars, col, v, n)
+        chars[:,4] = chars[:,7] = 45      # -
+        chars[:,10] = 84                  # T
+        chars[:,13] = chars[:,16] = 58    # :
+        chars[:,19] = 46                  # .
+        # like isoformat, leave off zero microseconds
+        chars[usec == 0, 19:] = 0
+
+        strs = chars.view('S26').ravel().tolist()
+        for i, s in itertools.izip(idx, strs):
+            out[i] = s
+
+    for i in N.nonzero(~fast)[0]:
+        out[i] = dateFloatToString(vals[i])
+    return out
@@ -0,0 +1,91 @@
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+
+"""
+Compiled expressions, which are cached by their text.
+
+Expressions are evaluated with the document evaluation context as
+their globals and any extra variables in a separate dict, so that the
+context does not have to be copied for each evaluation.
+"""
+
+import types
+
+from safe_eval import checkCode
+from utilfuncs import LRUCache
+
+def _hasNestedCode(code):
+    """Does code contain functions (lambdas, generator expressions)?"""
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            return True
+    return False
+
+class CompiledExpression(object):
+    """An expression which has been checked and compiled."""
+
+    def __init__(self, text, securityonly=True):
+        self.text = text
+
+        # problems found by checkCode, or None
+        self.problems = checkCode(text, securityonly=securityonly)
+
+        self.code = self.error = None
+        try:
+            self.code = compile(text, '<string>', 'eval')
+        except Exception, e:
+            self.error = e
+
+        # functions defined in the expression look up variables in
+        # the globals only
+        self.nested = self.code is not None and _hasNestedCode(self.code)
+
+    def evaluate(self, context, names=None):
+        """Evaluate expression, returning the result.
+
+        context is the dict of globals, which is not modified
+        names is an optional dict of extra variables
+        """
+
+        if self.error is not None:
+            raise self.error
+        if self.nested:
+            env = context.copy()
+            if names:
+                env.update(names)
+            return eval(self.code, env)
+        else:
+            # a new dict of locals, so that variables set by the
+            # expression (e.g. in list comprehensions) are not kept
+            return eval(self.code, context, dict(names or {}))
+
+_compiled = LRUCache(2048)
+
+def compileExpression(text, securityonly=True):
+    """Return a CompiledExpression for the text, reusing a previous
+    one for the same text if possible.
+
+    securityonly is passed to checkCode.
+    """
+
+    key = (text, securityonly)
+    expr = _compiled.get(key)
+    if expr is None:
+        expr = _compiled[key] = CompiledExpression(text,
+                                                   securityonly=securityonly)
+    return expr
@@ -21,6 +21,7 @@ Numerical fitting of functions to data.
 """
 
 import sys
+import time
 
 import numpy as N
 try:
@@ -28,9 +29,34 @@ try:
 except:
     import scipy.linalg as NLA
 
+# maximum number of function values to evaluate in one batched call
+batchsize = 4000000
+
+def _solveSymmetric(alpha, beta):
+    """Solve alpha.x = beta for x, where alpha is symmetric and should
+    be positive definite."""
+    try:
+        l = NLA.cholesky(alpha)
+        return NLA.solve(l.T, NLA.solve(l, beta))
+    except NLA.LinAlgError:
+        # not positive definite, so fall back to least squares
+        return NLA.lstsq(alpha, beta, rcond=-1)[0]
+
+def _valuesAgree(a, b):
+    """Return whether arrays of function values a and b are close,
+    with nans in the same places."""
+    a = N.asarray(a, dtype=N.float64)
+    b = N.asarray(b, dtype=N.float64)
+    if a.shape != b.shape:
+        return False
+    nana, nanb = N.isnan(a), N.isnan(b)
+    return ( N.all(nana == nanb) and
+             N.allclose(a[~nana], b[~nanb]) )
+
 def fitLM(func, params, xvals, yvals, errors,
           stopdeltalambda = 1e-5,
-          deltaderiv = 1e-5, maxiters = 20, Lambda = 1e-4):
+          deltaderiv = 1e-5, maxiters = 20, Lambda = 1e-4,
+          batchfunc = None, stats = None):
 
     """
     Use Marquardt method as described in Bevington & Robinson to fit data
@@ -50,8 +76,21 @@ def fitLM(func, params, xvals, yvals, errors,
     deltaderiv: change to make in parameters to calculate derivative
     maxiters: maximum number of better fitting solutions before stopping
     Lambda: starting lambda value (as described in Bevington)
+    batchfunc: optional function like func, but taking a 2D numpy of
+      parameter sets (one per row) and returning a 2D numpy with the
+      function values for each set in rows. This is used to calculate
+      derivatives in one call. func is used instead if batchfunc
+      returns None or values which do not agree with func.
+    stats: if set to a dict, fitting statistics are written into it
+      (time, iterations, evaluations, batched)
     """
 
+    starttime = time.time()
+    # number of function evaluations, and whether batchfunc is
+    # unused ('off'), untested ('untested') or agrees with func ('ok')
+    counts = {'evaluations': 0,
+              'batch': ('off', 'untested')[batchfunc is not None]}
+
     # only use finite values for fitting
     finite = N.logical_and(
         N.logical_and( N.isfinite(xvals), N.isfinite(yvals)),
@@ -63,55 +102,85 @@ def fitLM(func, params, xvals, yvals, errors,
     # optimisation to avoid computing this all the time
     inve2 = 1. / errors**2
 
+    def evalFunc(params):
+        counts['evaluations'] += 1
+        return func(params, xvals)
+
+    def evalBatch(paramsets):
+        """Evaluate function for each row of paramsets using batchfunc.
+        Returns None if this fails."""
+        out = N.empty( (len(paramsets), len(xvals)), dtype='float64' )
+        chunk = max(1, batchsize // max(len(xvals), 1))
+        for i in xrange(0, len(paramsets), chunk):
+            sets = paramsets[i:i+chunk]
+            try:
+                vals = batchfunc(sets, xvals)
+            except Exception:
+                return None
+            if vals is None or N.shape(vals) != (len(sets), len(xvals)):
+                return None
+            out[i:i+chunk] = vals
+            counts['evaluations'] += len(sets)
+        return out
+
+    def evalDerivs(params, funcvals):
+        """Evaluate function with each parameter increased by
+        deltaderiv in turn, returning a row for each parameter.
+        funcvals are the function values for params."""
+        paramsets = ( N.tile(params, (len(params), 1)) +
+                      N.identity(len(params))*deltaderiv )
+
+        if counts['batch'] == 'untested':
+            # check the batched function gives the same answers as
+            # func, for params and with a parameter changed
+            out = evalBatch( N.vstack((paramsets, params)) )
+            if ( out is not None and
+                 _valuesAgree(out[-1], funcvals + N.zeros(len(xvals))) and
+                 _valuesAgree(out[0], evalFunc(paramsets[0]) +
+                              N.zeros(len(xvals))) ):
+                counts['batch'] = 'ok'
+                return out[:-1]
+            counts['batch'] = 'off'
+        elif counts['batch'] == 'ok':
+            out = evalBatch(paramsets)
+            if out is not None:
+                return out
+            counts['batch'] = 'off'
+
+        return N.array( [evalFunc(p) + N.zeros(len(xvals))
+                         for p in paramsets] )
+
     # work out fit using current parameters
-    oldfunc = func(params, xvals)
+    params = N.array(params, dtype='float64')
+    oldfunc = evalFunc(params)
     chi2 = ( (oldfunc - yvals)**2 * inve2 ).sum()
 
-    # initialise temporary space
-    beta = N.zeros( len(params), dtype='float64' )
-    alpha = N.zeros( (len(params), len(params)), dtype='float64' )
-    derivs = N.zeros( (len(params), len(xvals)), dtype='float64' )
-
     done = False
     iters = 0
     while iters < maxiters and not done:
-        # iterate over each of the parameters and calculate the derivatives
-        # of chi2 to populate the beta vector
-
-        # also calculate the derivative of the function at each of the points
-        # wrt the parameters
+        # evaluate the function with each of the parameters changed
+        # to calculate the derivatives of chi2 to populate the beta
+        # vector, and the derivative of the function at each of the
+        # points wrt the parameters
+        new_funcs = evalDerivs(params, oldfunc)
+        chi2_new = ( (new_funcs - yvals)**2 * inve2 ).sum(axis=1)
 
-        for i in range( len(params) ):
-            params[i] += deltaderiv
-            new_func = func(params, xvals)
-            chi2_new = ((new_func - yvals)**2 * inve2).sum()
-            params[i] -= deltaderiv
-
-            beta[i] = chi2_new - chi2
-            derivs[i] = new_func - oldfunc
-
-        # beta is now dchi2 / dparam
-        beta *= (-0.5 / deltaderiv)
-        derivs *= (1. / deltaderiv)
+        # beta is dchi2 / dparam
+        beta = (chi2_new - chi2) * (-0.5 / deltaderiv)
+        derivs = (new_funcs - oldfunc) * (1. / deltaderiv)
 
         # calculate alpha matrix
-        # FIXME: stupid - must be a better way to avoid this iteration
-        for j in range( len(params) ):
-            for k in range(j+1):
-                v = (derivs[j]*derivs[k] * inve2).sum()
-                alpha[j][k] = v
-                alpha[k][j] = v
+        alpha = N.dot(derivs * inve2, derivs.T)
 
         # twiddle alpha using lambda
         alpha *= 1. + N.identity(len(params), dtype='float64')*Lambda
 
         # now work out deltas on parameters to get better fit
-        epsilon = NLA.inv( alpha )
-        deltas = N.dot(beta, epsilon)
+        deltas = _solveSymmetric(alpha, beta)
 
         # new solution
         new_params = params+deltas
-        new_func = func(new_params, xvals)
+        new_func = evalFunc(new_params)
         new_chi2 = ( (new_func - yvals)**2 * inve2 ).sum()
 
         if N.isnan(new_chi2):
@@ -146,5 +215,14 @@ def fitLM(func, params, xvals, yvals, errors,
     redchi2 = chi2 / dof
     print "chi^2 = %g, dof = %i, reduced-chi^2 = %g" % (chi2, dof, redchi2)
 
-    return (params, chi2, dof)
+    fittime = time.time() - starttime
+    batched = counts['batch'] == 'ok'
+    print "Fit took %.3g s, %i iterations, %i evaluations%s" % (
+        fittime, iters, counts['evaluations'],
+        ('', ' (batched)')[batched])
+    if stats is not None:
+        stats.update( {'time': fittime, 'iterations': iters,
+                       'evaluations': counts['evaluations'],
+                       'batched': batched} )
 
+    return (params, chi2, dof)
@@ -19,6 +19,8 @@
 import re
 import math
 
+import numpy as N
+
 import dates
 import veusz.qtall as qt4
 
@@ -222,3 +224,66 @@ def formatNumber(num, format, locale=None):
         format = format[:m.start()] + out + format[m.end():]
 
     return format
+
+# date codes which can be written directly from the fields of dates
+# code: (index of field from dates.dateFloatsToFields, format)
+_datefields = {
+    'VDY': (0, '%04i'),
+    'VDm': (1, '%02i'),
+    'VDd': (2, '%02i'),
+    'VDH': (3, '%02i'),
+    'VDM': (4, '%02i'),
+    'VDS': (5, '%02i'),
+    }
+
+# range of dates which strftime can format
+_mindatefloat = dates.datetimeToFloat(dates.datetime.datetime(1900, 1, 1))
+
+def formatNumbers(nums, format, locale=None):
+    """Format a sequence of numbers, returning a list of strings.
+
+    This is the same as calling formatNumber for each number, but
+    dates in formats only containing the common date codes are
+    converted all at once."""
+
+    matches = list(_formatRE.finditer(format))
+    parts = []
+    last = 0
+    for m in matches:
+        if m.group(2) not in _datefields:
+            break
+        parts.append( format[last:m.start()] )
+        parts.append( _datefields[m.group(2)] )
+        last = m.end()
+    else:
+        parts.append( format[last:] )
+
+    # only the simple case is handled here
+    if ( len(matches) == 0 or len(parts) != 2*len(matches)+1 or
+         '%' in ''.join(parts[::2]) ):
+        return [formatNumber(n, format, locale=locale) for n in nums]
+
+    nums = N.asarray(nums, dtype=N.float64)
+    olderr = N.seterr(invalid='ignore')
+    try:
+        fast = (nums >= _mindatefloat) & (nums < dates._maxdatefloat)
+    finally:
+        N.seterr(**olderr)
+    idx = N.nonzero(fast)[0]
+    fields = dates.dateFloatsToFields(nums[idx])
+
+    # make list of text for each part of format
+    columns = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            columns.append( [part]*len(idx) )
+        else:
+            field, fmt = part
+            columns.append( [fmt % v for v in fields[field].tolist()] )
+
+    out = [None]*len(nums)
+    for i, text in zip(idx, zip(*columns)):
+        out[i] = u''.join(text)
+    for i in N.nonzero(~fast)[0]:
+        out[i] = formatNumber(nums[i], format, locale=locale)
+    return out
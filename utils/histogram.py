@@ -0,0 +1,146 @@
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+
+"""
+Histograms of large datasets, computed a chunk at a time.
+
+The input arrays are only read a chunk at a time, so they can be
+memory mapped arrays which do not fit in memory. The counts in each
+chunk are added, optionally using several threads.
+"""
+
+import numpy as N
+
+# number of values read at a time
+chunksize = 4194304
+
+def chunkSlices(length, chunk=None):
+    """Return list of slices to split length values into chunks."""
+    chunk = chunk or chunksize
+    return [ slice(i, min(i+chunk, length))
+             for i in xrange(0, length, chunk) ]
+
+def _mapChunks(func, slices, threads):
+    """Apply func to each slice, optionally using a pool of threads,
+    yielding the results as they are finished (in any order).
+    numpy releases the interpreter lock while binning, so threads
+    can run in parallel."""
+    try:
+        from multiprocessing.pool import ThreadPool
+    except ImportError:
+        # Python < 2.6
+        threads = None
+
+    if not threads or threads <= 1 or len(slices) <= 1:
+        for s in slices:
+            yield func(s)
+        return
+
+    pool = ThreadPool( min(threads, len(slices)) )
+    try:
+        for result in pool.imap_unordered(func, slices):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def chunkedRange(data, chunk=None):
+    """Return (minimum, maximum) of the finite values in data.
+    (nan, nan) is returned if there are no finite values."""
+
+    minval = maxval = N.nan
+    for s in chunkSlices(len(data), chunk):
+        vals = N.asarray(data[s])
+        vals = vals[N.isfinite(vals)]
+        if len(vals) != 0:
+            minval = N.fmin(minval, vals.min())
+            maxval = N.fmax(maxval, vals.max())
+    return minval, maxval
+
+def _uniformCounts(vals, edges, spacing):
+    """Count vals in bins with edges which are uniformly spaced
+    (linearly or logarithmically), computing the bin of each value
+    directly rather than searching the edges."""
+
+    numbins = len(edges)-1
+    vals = N.asarray(vals, dtype=N.float64)
+    olderr = N.seterr(invalid='ignore')
+    try:
+        vals = vals[ (vals >= edges[0]) & (vals <= edges[-1]) ]
+    finally:
+        N.seterr(**olderr)
+
+    lo, hi, pos = edges[0], edges[-1], vals
+    if spacing == 'log':
+        lo, hi, pos = N.log(lo), N.log(hi), N.log(vals)
+    idx = ( (pos-lo) * (numbins/(hi-lo)) ).astype(N.intp)
+    N.clip(idx, 0, numbins-1, idx)
+
+    # correct for rounding, so values are counted as if compared
+    # with the edges (the last bin includes its upper edge)
+    idx[vals < edges[idx]] -= 1
+    idx[ (vals >= edges[idx+1]) & (idx != numbins-1) ] += 1
+
+    try:
+        return N.bincount(idx, minlength=numbins)
+    except TypeError:
+        # minlength needs numpy 1.6, so pad counts to number of bins
+        counts = N.zeros(numbins, dtype=N.intp)
+        if len(idx) != 0:
+            c = N.bincount(idx)
+            counts[:len(c)] = c
+        return counts
+
+def chunkedHistogram(data, edges, chunk=None, threads=None, spacing=None):
+    """Return counts of data in the bins with the edges given.
+
+    Values outside the edges or which are not finite are ignored.
+    If spacing is 'linear' or 'log' the edges must be uniformly
+    spaced in linear or log space, and the counts are computed faster.
+    """
+
+    edges = N.asarray(edges, dtype=N.float64)
+    if ( spacing in ('linear', 'log') and len(edges) > 1 and
+         edges[0] < edges[-1] and (spacing == 'linear' or edges[0] > 0) ):
+        def count(s):
+            return _uniformCounts(data[s], edges, spacing)
+    else:
+        def count(s):
+            return N.histogram(data[s], bins=edges)[0]
+
+    counts = N.zeros(len(edges)-1, dtype=N.int64)
+    for c in _mapChunks(count, chunkSlices(len(data), chunk), threads):
+        counts += c
+    return counts
+
+def chunkedHistogram2D(xdata, ydata, xedges, yedges, chunk=None,
+                       threads=None):
+    """Return 2D array of counts of points in the bins with the x and
+    y edges given. The array is indexed by x bin, then y bin.
+
+    Points outside the edges or which are not finite are ignored.
+    """
+
+    def count(s):
+        return N.histogram2d(xdata[s], ydata[s], bins=[xedges, yedges])[0]
+
+    length = min(len(xdata), len(ydata))
+    counts = N.zeros( (len(xedges)-1, len(yedges)-1), dtype=N.float64 )
+    for c in _mapChunks(count, chunkSlices(length, chunk), threads):
+        counts += c
+    return counts
@@ -0,0 +1,129 @@
+#    Copyright (C) 2012 Jeremy S. Sanders
+#    Email: Jeremy Sanders <jeremy@jeremysanders.net>
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+###############################################################################
+
+"""A cache of decoded images, shared by the whole program.
+
+Images are keyed on where they come from, so that the same file or
+embedded data used many times is only decoded and held in memory
+once. Copies scaled to the size they are drawn at are also kept, so
+that large images are not scaled every time they are drawn.
+"""
+
+import os
+import os.path
+import hashlib
+
+import veusz.qtall as qt4
+from utilfuncs import LRUCache
+
+# default maximum size of decoded images held
+defaultmaxbytes = 256*1024*1024
+
+def fileImageKey(filename, st=None):
+    """Return key for image in filename, which changes if the file is
+    modified. st is the result of os.stat on the file, if known.
+    Raises EnvironmentError if the file cannot be read."""
+    if st is None:
+        st = os.stat(filename)
+    return ('file', os.path.abspath(filename), st.st_mtime, st.st_size)
+
+def dataImageKey(data):
+    """Return key for image from (e.g. base64-encoded) data string."""
+    return ('data', hashlib.sha1(data).hexdigest())
+
+def _imageBytes(image):
+    """Return size of image data."""
+    return image.byteCount()
+
+class ImageCache(object):
+    """A cache of QImages holding at most maxbytes bytes of image
+    data, where the least recently used images are thrown away first.
+
+    This is safe to use from several threads.
+    """
+
+    def __init__(self, maxbytes):
+        self.images = LRUCache(maxbytes, sizefunc=_imageBytes)
+
+        # sizes of images, kept after the images are thrown away
+        self.sizes = LRUCache(4096)
+
+    def _getMaxBytes(self):
+        return self.images.maxsize
+    maxbytes = property(_getMaxBytes)
+
+    def setMaxBytes(self, maxbytes):
+        """Change the maximum size of the cache."""
+        self.images.setMaxSize(maxbytes)
+
+    def image(self, key, loader):
+        """Return image with key.
+
+        If the image is not cached, loader is called to return the
+        image, which is added to the cache.
+        """
+
+        image = self.images.get(key)
+        if image is None:
+            image = loader()
+            self.sizes[key] = (image.width(), image.height())
+            self.images[key] = image
+        return image
+
+    def imageSize(self, key, loader):
+        """Return (width, height) of image with key, loading the
+        image if its size is not known."""
+        size = self.sizes.get(key)
+        if size is None:
+            image = self.image(key, loader)
+            size = (image.width(), image.height())
+        return size
+
+    def scaledImage(self, key, loader, width, height):
+        """Return image with key scaled to width x height pixels.
+
+        The scaled image is cached separately from the image, so the
+        full size image does not need to be kept or scaled when drawn
+        again at the same size.
+        """
+
+        scaledkey = key + ('scaled', width, height)
+        scaled = self.images.get(scaledkey)
+        if scaled is None:
+            scaled = self.image(key, loader).scaled(
+                width, height, qt4.Qt.IgnoreAspectRatio,
+                qt4.Qt.SmoothTransformation)
+            self.images[scaledkey] = scaled
+        return scaled
+
+    def __len__(self):
+        return len(self.images)
+
+    def clear(self):
+        """Remove all images."""
+        self.images.clear()
+        self.sizes.clear()
+
+_cache = ImageCache(defaultmaxbytes)
+
+def getImageCache(maxbytes=None):
+    """Return the ImageCache shared by the program, optionally
+    changing its maximum size in bytes."""
+    if maxbytes is not None and maxbytes != _cache.maxbytes:
+        _cache.setMaxBytes(maxbytes)
+    return _cache
@@ -22,9 +22,11 @@ import veusz.qtall as qt4
 import numpy as N
 
 try:
-    from veusz.helpers.qtloops import plotPathsToPainter
+    from veusz.helpers.qtloops import plotPathsToPainter, \
+        plotLinesToPainter, addNumpyPolygonToPath
 except ImportError:
-    from slowfuncs import plotPathsToPainter
+    from slowfuncs import plotPathsToPainter, \
+        plotLinesToPainter, addNumpyPolygonToPath
 
 import colormap
 
@@ -503,3 +505,104 @@ def plotLineArrow(painter, xpos, ypos, length, angle,
                arrow_translate[arrowleft], arrowsize)
 
     painter.restore()
+
+# corners of path symbols used for arrows, so they can be drawn as polygons
+arrow_polygons = {
+    'square': ( (-1, -1), (1, -1), (1, 1), (-1, 1) ),
+}
+
+def _arrowEndPoints(xpos, ypos, cosa, sina, sizes, mirror, vx, vy):
+    """Rotate and scale marker point vx, vy about positions xpos, ypos.
+    Returns (x, y) arrays."""
+    px = (vx*mirror)*sizes
+    py = vy*sizes
+    return xpos + cosa*px - sina*py, ypos + sina*px + cosa*py
+
+def _plotArrowEnds(painter, xpos, ypos, cosa, sina, sizes, arrow, mirror,
+                   clip):
+    """Plot arrow end markers at the positions, rotated by the angles
+    with the cosines and sines given and scaled by sizes.
+    If mirror is -1, the markers are reversed (for the start of a line)."""
+
+    name = arrow_translate[arrow]
+    if name == 'none' or len(xpos) == 0:
+        return
+
+    if name in linesymbols:
+        # break lines into segments, with each array having a segment
+        # for every arrow
+        segs = []
+        for line in linesymbols[name]:
+            for (ax, ay), (bx, by) in zip(line[:-1], line[1:]):
+                segs.append(
+                    _arrowEndPoints(xpos, ypos, cosa, sina, sizes, mirror,
+                                    ax, ay) +
+                    _arrowEndPoints(xpos, ypos, cosa, sina, sizes, mirror,
+                                    bx, by) )
+        pts = [ N.concatenate([s[i] for s in segs]) for i in xrange(4) ]
+        painter.save()
+        painter.setBrush( qt4.QBrush() )
+        plotLinesToPainter(painter, pts[0], pts[1], pts[2], pts[3], clip)
+        painter.restore()
+
+    elif name == 'circle':
+        # circles do not need rotating
+        # (winding fill so that overlapping markers are filled)
+        path = qt4.QPainterPath()
+        path.setFillRule(qt4.Qt.WindingFill)
+        for x, y, size in zip(xpos, ypos, sizes):
+            path.addEllipse( qt4.QRectF(x-size, y-size, size*2, size*2) )
+        painter.drawPath(path)
+
+    else:
+        corners = arrow_polygons.get(name, None) or polygons[name]
+        pts = []
+        for vx, vy in corners:
+            pts += _arrowEndPoints(xpos, ypos, cosa, sina, sizes, mirror,
+                                   vx, vy)
+        path = qt4.QPainterPath()
+        path.setFillRule(qt4.Qt.WindingFill)
+        addNumpyPolygonToPath(path, clip, *pts)
+        painter.drawPath(path)
+
+def plotLineArrows(painter, xpos, ypos, lengths, angles, arrowsizes,
+                   arrowleft='none', arrowright='none', clip=None):
+    """Plot a set of lines or arrows, as plotLineArrow.
+
+    xpos, ypos are arrays of the starting points of the lines
+    lengths, angles (degrees) and arrowsizes are arrays for each line
+    arrowleft and arrowright are arrow codes
+    clip is an optional clipping rectangle
+
+    The geometry of the arrows is calculated for all the lines at
+    once, rather than transforming the painter for each line.
+    """
+
+    xpos, ypos, lengths, angles, arrowsizes = [
+        N.asarray(v, dtype=N.float64).ravel()
+        for v in (xpos, ypos, lengths, angles, arrowsizes) ]
+
+    # ignore lines without length
+    ok = lengths != 0.
+    if not ok.all():
+        xpos, ypos, lengths, angles, arrowsizes = [
+            v[ok] for v in (xpos, ypos, lengths, angles, arrowsizes) ]
+
+    rad = angles * (N.pi/180.)
+    cosa, sina = N.cos(rad), N.sin(rad)
+    xend = xpos + cosa*lengths
+    yend = ypos + sina*lengths
+
+    painter.save()
+    plotLinesToPainter(painter, xpos, ypos, xend, yend, clip)
+
+    # get sharper angles and more exact positions
+    pen = painter.pen()
+    pen.setJoinStyle( qt4.Qt.MiterJoin )
+    painter.setPen(pen)
+
+    _plotArrowEnds(painter, xend, yend, cosa, sina, arrowsizes,
+                   arrowright, 1., clip)
+    _plotArrowEnds(painter, xpos, ypos, cosa, sina, arrowsizes,
+                   arrowleft, -1., clip)
+    painter.restore()
@@ -28,6 +28,7 @@ import numpy as N
 import veusz.qtall as qt4
 
 import points
+import utilfuncs
 
 mmlsupport = True
 try:
@@ -748,6 +749,19 @@ def makePartTree(partlist):
     else:
         return PartLines(lines)
 
+# Cache of laid out text, to avoid parsing and measuring the same
+# text again, e.g. for axis tick labels when redrawing a plot.
+# Maps (text, font, resolution) to (parttree, width, maxlines).
+# Part trees are not shared between fonts or resolutions, as PartLines
+# remembers the widths of the lines measured.
+layoutcache = utilfuncs.LRUCache(2048)
+
+def _layoutCacheKey(painter, font, text):
+    """Key in layout cache for text drawn on painter with font."""
+    dev = painter.device()
+    return ( text, unicode(font.key()), dev.logicalDpiX(), dev.logicalDpiY(),
+             getattr(painter, 'scaling', 1.) )
+
 class _Renderer:
     """Different renderer types based on this."""
 
@@ -885,9 +899,16 @@ class _StdRenderer(_Renderer):
     """Standard rendering class."""
 
     def _initText(self, text):
-        # make internal tree
-        partlist = makePartList(text)
-        self.parttree = makePartTree(partlist)
+        # use the tree and its size if this text has been laid out before
+        self.cachekey = _layoutCacheKey(self.painter, self.font, text)
+        cached = layoutcache.get(self.cachekey)
+        if cached is not None:
+            self.parttree, self.measured = cached[0], cached[1:]
+        else:
+            # make internal tree
+            partlist = makePartList(text)
+            self.parttree = makePartTree(partlist)
+            self.measured = None
 
     def _getWidthHeight(self):
         """Get size of box around text."""
@@ -918,10 +939,13 @@ class _StdRenderer(_Renderer):
             dy = 0
 
         # work out width
-        self.parttree.render(state)
-        totalwidth = state.x
+        if self.measured is None:
+            self.parttree.render(state)
+            self.measured = (state.x, state.maxlines)
+            layoutcache[self.cachekey] = (self.parttree,) + self.measured
+        totalwidth, maxlines = self.measured
         # add number of lines for height
-        totalheight += fm.height()*(state.maxlines-1)
+        totalheight += fm.height()*(maxlines-1)
 
         return totalwidth, totalheight, dy
 
@@ -242,6 +242,12 @@ class TreeModel(qt4.QAbstractItemModel):
                     clone._idx = idx
                     self.nodes[idx] = clone
 
+                    # put clone in the tree, keeping the children
+                    clone.childnodes = c[i].childnodes
+                    for child in clone.childnodes:
+                        child.parent = clone
+                    c[i] = clone
+
                     self.emit(qt4.SIGNAL('dataChanged(const QModelIndex &, '
                                          'const QModelIndex &)'),
                               self.index(i, 0, parentidx),
@@ -254,6 +260,55 @@ class TreeModel(qt4.QAbstractItemModel):
 
             i += 1
 
+    def nodeIndex(self, node, column=0):
+        """Return index of node in the tree."""
+        if node is self.root:
+            return qt4.QModelIndex()
+        row = node.parent.childnodes.index(node)
+        return self.createIndex(row, column, node._idx)
+
+    def _registerNode(self, node):
+        """Assign indices to node and its children."""
+        node._idx = self.nodeindex
+        self.nodeindex += 1
+        self.nodes[node._idx] = node
+        for c in node.childnodes:
+            self._registerNode(c)
+
+    def _unregisterNode(self, node):
+        """Remove indices of node and its children."""
+        self.nodes.pop(node._idx, None)
+        for c in node.childnodes:
+            self._unregisterNode(c)
+
+    def insertNodeSorted(self, parent, node):
+        """Insert node into the children of parent in the tree,
+        keeping them sorted by their data."""
+        cdata = [c.data for c in parent.childnodes]
+        row = bisect.bisect_left(cdata, node.data)
+        self.beginInsertRows(self.nodeIndex(parent), row, row)
+        node.parent = parent
+        parent.childnodes.insert(row, node)
+        self._registerNode(node)
+        self.endInsertRows()
+
+    def removeNode(self, node):
+        """Remove node from the tree."""
+        parent = node.parent
+        row = parent.childnodes.index(node)
+        self.beginRemoveRows(self.nodeIndex(parent), row, row)
+        del parent.childnodes[row]
+        self._unregisterNode(node)
+        self.endRemoveRows()
+
+    def setNodeData(self, node, data):
+        """Change the data of node in the tree.
+        This should not change the position of the node in sorted order."""
+        node.data = data
+        self.emit(qt4.SIGNAL('dataChanged(const QModelIndex &, '
+                             'const QModelIndex &)'),
+                  self.nodeIndex(node), self.nodeIndex(node, len(data)-1))
+
     def syncTree(self, newroot):
         """Syncronise the displayed tree with the given tree new."""
 
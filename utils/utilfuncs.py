@@ -141,15 +141,19 @@ def extendedColorFromQColor(col):
         return '#%02x%02x%02x%02x' % (col.red(), col.green(), col.blue(),
                                       col.alpha())
 
-def pixmapAsHtml(pix):
-    """Get QPixmap as html image text."""
+def imageAsHtml(img):
+    """Get QImage as html image text."""
     ba = qt4.QByteArray()
     buf = qt4.QBuffer(ba)
     buf.open(qt4.QIODevice.WriteOnly)
-    pix.toImage().save(buf, "PNG")
+    img.save(buf, "PNG")
     b64 = str(buf.data().toBase64())
     return '<img src="data:image/png;base64,%s">' % b64
 
+def pixmapAsHtml(pix):
+    """Get QPixmap as html image text."""
+    return imageAsHtml(pix.toImage())
+
 def BoundCaller(function, *params):
     """Wrap a function with its initial arguments."""
     def wrapped(*args):
@@ -352,11 +356,16 @@ class UnicodeCSVReader:
     """
     A CSV reader which will iterate over lines in the CSV file "f",
     which is encoded in the given encoding.
+
+    filename can also be an open file object to read from.
     """
 
     def __init__(self, filename, dialect=csv.excel, encoding='utf-8', **kwds):
 
-        if filename != '{clipboard}':
+        if hasattr(filename, 'read'):
+            # already opened file
+            f = UTF8Recoder(filename, encoding)
+        elif filename != '{clipboard}':
             # recode the opened file as utf-8
             f = UTF8Recoder(open(filename), encoding)
         else:
@@ -454,3 +463,138 @@ def decodeDefault(s):
     """Decode the string using current locale.
     Used for decoding exceptions."""
     return s.decode(locale.getdefaultlocale()[1])
+
+class LRUCache(object):
+    """A dict-like cache holding at most maxsize items, where the
+    least recently used items are thrown away first.
+
+    If sizefunc is given, it is called with each value to return its
+    size (e.g. in bytes), and the total size of the values is limited
+    to maxsize instead. Values larger than maxsize are not stored.
+
+    This is safe to use from several threads.
+    """
+
+    def __init__(self, maxsize, sizefunc=None):
+        self.maxsize = maxsize
+        self.sizefunc = sizefunc
+        self.lock = threading.Lock()
+
+        # items are links [prev, next, key, val, size] in a circular
+        # list, ordered from least to most recently used, looked up by key
+        self.links = {}
+        self.root = []
+        self.root[:] = [self.root, self.root, None, None, 0]
+        self.totalsize = 0
+
+    def _unlink(self, link):
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+
+    def _append(self, link):
+        """Add link at the most recently used end."""
+        root = self.root
+        last = root[0]
+        link[0] = last
+        link[1] = root
+        last[1] = root[0] = link
+
+    def _remove(self, link):
+        """Remove link from the cache."""
+        self._unlink(link)
+        del self.links[link[2]]
+        self.totalsize -= link[4]
+
+    def _trim(self):
+        """Throw away oldest items until below the maximum size."""
+        while self.links and self.totalsize > self.maxsize:
+            self._remove(self.root[1])
+
+    def get(self, key, default=None):
+        """Get item with key, marking it as recently used."""
+        self.lock.acquire()
+        try:
+            link = self.links.get(key)
+            if link is None:
+                return default
+            self._unlink(link)
+            self._append(link)
+            return link[3]
+        finally:
+            self.lock.release()
+
+    def __contains__(self, key):
+        self.lock.acquire()
+        try:
+            return key in self.links
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        self.lock.acquire()
+        try:
+            return len(self.links)
+        finally:
+            self.lock.release()
+
+    def keys(self):
+        """Return keys, oldest first."""
+        self.lock.acquire()
+        try:
+            keys = []
+            link = self.root[1]
+            while link is not self.root:
+                keys.append(link[2])
+                link = link[1]
+            return keys
+        finally:
+            self.lock.release()
+
+    def __setitem__(self, key, val):
+        if self.sizefunc is None:
+            size = 1
+        else:
+            size = self.sizefunc(val)
+
+        self.lock.acquire()
+        try:
+            link = self.links.get(key)
+            if link is not None:
+                self._remove(link)
+            if size > self.maxsize:
+                return
+
+            link = [None, None, key, val, size]
+            self._append(link)
+            self.links[key] = link
+            self.totalsize += size
+            self._trim()
+        finally:
+            self.lock.release()
+
+    def __delitem__(self, key):
+        self.lock.acquire()
+        try:
+            self._remove(self.links[key])
+        finally:
+            self.lock.release()
+
+    def setMaxSize(self, maxsize):
+        """Change the maximum size, throwing away items if needed."""
+        self.lock.acquire()
+        try:
+            self.maxsize = maxsize
+            self._trim()
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """Remove all items."""
+        self.lock.acquire()
+        try:
+            self.links.clear()
+            self.root[:] = [self.root, self.root, None, None, 0]
+            self.totalsize = 0
+        finally:
+            self.lock.release()
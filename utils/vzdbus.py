@@ -25,6 +25,7 @@ try:
     import dbus
     from dbus.service import method, Object
     from dbus.mainloop.qt import DBusQtMainLoop
+    from dbus import ByteArray
     import os
 
     def setup():
@@ -53,3 +54,5 @@ except ImportError:
     class Object(object):
         def __init__(self, *args):
             pass
+
+    ByteArray = str
@@ -134,12 +134,18 @@ class ImportThread(qt4.QThread):
     '''Do import of main code within another thread.
     Main application runs when this is done
     '''
+    def __init__(self, usedbus=True):
+        qt4.QThread.__init__(self)
+        self.usedbus = usedbus
+
     def run(self):
         import veusz.setting
         import veusz.widgets
-        import veusz.utils.vzdbus as vzdbus
 
-        vzdbus.setup()
+        # the D-Bus interface is not needed when exporting
+        if self.usedbus:
+            import veusz.utils.vzdbus as vzdbus
+            vzdbus.setup()
 
 class AppRunner(qt4.QObject):
     '''Object to run application. We have to do this to get an
@@ -164,7 +170,7 @@ class AppRunner(qt4.QObject):
             trans.load(options.translation)
             qt4.qApp.installTranslator(trans)
 
-        self.thread = ImportThread()
+        self.thread = ImportThread(usedbus=not options.export)
         self.connect( self.thread, qt4.SIGNAL('finished()'),
                       self.slotStartApplication )
         self.thread.start()
@@ -203,6 +209,8 @@ class AppRunner(qt4.QObject):
             qt4.qApp.quit()
         else:
             # standard start main window
+            # heavy dataset plugins can update in the background
+            veusz.setting.transient_settings['plugin_background_updates'] = True
             mainwindow(args)
 
         # clear splash when startup done
@@ -218,6 +226,22 @@ def run():
         runremote()
         return
 
+    # jump to the render service entry points if required
+    if len(sys.argv) >= 2 and sys.argv[1] == '--render-service':
+        from veusz.render_service import runservice
+        runservice(sys.argv[2:])
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == '--render-worker':
+        from veusz.render_service import runworker
+        runworker(sys.argv[2:])
+        return
+
+    # jump to the fitting worker entry point if required
+    if len(sys.argv) == 2 and sys.argv[1] == '--fit-worker':
+        from veusz.widgets.fit import runFitWorker
+        runFitWorker()
+        return
+
     # this function is spaghetti-like and has nasty code paths.
     # the idea is to postpone the imports until the splash screen
     # is shown
@@ -247,6 +271,15 @@ def run():
                       ' output image file, exiting when finished')
     parser.add_option('--embed-remote', action='store_true',
                       help=optparse.SUPPRESS_HELP)
+    parser.add_option('--render-service', action='store_true',
+                      help='run a headless service rendering documents for '
+                      'requests on a local socket (must be the first '
+                      'option; needs Python 2.6; see --render-service '
+                      '--help)')
+    parser.add_option('--render-worker', action='store_true',
+                      help=optparse.SUPPRESS_HELP)
+    parser.add_option('--fit-worker', action='store_true',
+                      help=optparse.SUPPRESS_HELP)
     parser.add_option('--plugin', action='append', metavar='FILE',
                       help='load the plugin from the file given for '
                       'the session')
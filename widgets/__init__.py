@@ -16,7 +16,14 @@
 #    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 ##############################################################################
 
-"""Widgets are defined in this module."""
+"""Widgets are defined in this module.
+
+Widgets not needed by every document are registered with the widget
+factory by type name, and their modules are only imported when the
+widget type is first used.
+"""
+
+import veusz.document as document
 
 from widget import Widget, Action
 from axis import Axis
@@ -24,23 +31,32 @@ from graph import Graph
 from grid import Grid
 from plotters import GenericPlotter, FreePlotter
 from pickable import PickInfo
-from point import PointPlotter
-from function import FunctionPlotter
-from textlabel import TextLabel
 from page import Page
 from root import Root
-from key import Key
-from fit import Fit
-from image import Image
-from contour import Contour
-from colorbar import ColorBar
-from shape import Shape, BoxShape, Rectangle, Ellipse, ImageFile
-from line import Line
-from bar import BarPlotter
-from polygon import Polygon
-from vectorfield import VectorField
-from boxplot import BoxPlot
-from polar import Polar
-from ternary import Ternary
-from nonorthpoint import NonOrthPoint
-from nonorthfunction import NonOrthFunction
+
+# widget type names and the modules defining them, imported on first use
+_lazywidgets = (
+    ('bar', 'bar'),
+    ('boxplot', 'boxplot'),
+    ('colorbar', 'colorbar'),
+    ('contour', 'contour'),
+    ('ellipse', 'shape'),
+    ('fit', 'fit'),
+    ('function', 'function'),
+    ('image', 'image'),
+    ('imagefile', 'shape'),
+    ('key', 'key'),
+    ('label', 'textlabel'),
+    ('line', 'line'),
+    ('nonorthfunc', 'nonorthfunction'),
+    ('nonorthpoint', 'nonorthpoint'),
+    ('polar', 'polar'),
+    ('polygon', 'polygon'),
+    ('rect', 'shape'),
+    ('ternary', 'ternary'),
+    ('vectorfield', 'vectorfield'),
+    ('xy', 'point'),
+    )
+
+for _typename, _module in _lazywidgets:
+    document.thefactory.registerLazy(_typename, 'veusz.widgets.' + _module)
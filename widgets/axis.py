@@ -199,6 +199,11 @@ class Axis(widget.Widget):
         # document updates change set variable when things need recalculating
         self.docchangeset = -1
 
+        # recently converted coordinates (see dataToPlotterCoords),
+        # valid for the document and axis state coordcachestate
+        self.coordcache = utils.LRUCache(8)
+        self.coordcachestate = None
+
     @classmethod
     def addSettings(klass, s):
         """Construct list of settings."""
@@ -521,31 +526,100 @@ class Axis(widget.Widget):
 
         return self._graphToPlotter(vals)
 
-    def _graphToPlotter(self, vals):
+    def _graphToPlotter(self, vals, out=None, dtype=N.float64):
         """Convert the coordinates assuming the machinery is in place."""
-        
-        # work out fractional posistions, then convert to pixels
-        if self.settings.log:
-            fracposns = self.logConvertToPlotter(vals)
-        else:
-            fracposns = self.linearConvertToPlotter(vals)
+        return self._fusedToPlotter(vals, 1., out=out, dtype=dtype)
 
-        return self.coordParr1 + fracposns*(self.coordParr2-self.coordParr1)
+    def _fusedToPlotter(self, vals, scale, out=None, dtype=N.float64):
+        """Convert scale*vals to plotter coordinates in a single pass.
 
-    def dataToPlotterCoords(self, posn, data):
-        """Convert data values to plotter coordinates, scaling if necessary."""
+        The scaling, conversion to fractional position and conversion
+        to pixels are done in place in the output array, so no
+        temporary arrays are made. out is used if given (it must have
+        the same shape as vals).
+        """
+
+        vals = N.asarray(vals)
+        if out is None:
+            out = N.empty(vals.shape, dtype=dtype)
+
+        # if the output is narrower than double precision, work in a
+        # temporary array until the start of the range is subtracted
+        if out.dtype == N.float64:
+            work = out
+        else:
+            work = N.empty(vals.shape, dtype=N.float64)
+
+        p1, p2 = self.coordParr1, self.coordParr2
+        r0, r1 = N.array(self.plottedrange, dtype=N.float64)
+        if self.settings.log:
+            # keep clipping limits representable in output type
+            info = N.finfo(out.dtype)
+            N.multiply(vals, scale, work)
+            N.clip(work, max(1e-99, info.tiny), min(1e99, info.max), work)
+            N.log(work, work)
+            r0, r1 = N.log(r0), N.log(r1)
+        elif scale != 1:
+            N.multiply(vals, scale, work)
+        else:
+            work[...] = vals
+
+        # subtract before multiplying to keep precision for large values
+        work -= r0
+        if work is not out:
+            out[...] = work
+        out *= (p2-p1) / (r1-r0)
+        out += p1
+
+        if out.ndim == 0:
+            # return scalars for scalar input
+            return out[()]
+        return out
+
+    def dataToPlotterCoords(self, posn, data, out=None, dtype=N.float64,
+                            cache=False):
+        """Convert data values to plotter coordinates, scaling if necessary.
+
+        out is an optional array to write the coordinates into
+        dtype is the type of the returned array if out is not given
+        if cache is True, the result is kept and returned again if the
+         same data array is converted before the document or axis
+         changes, so callers must not modify it
+        """
         # if the doc was modified, recompute the range
         if self.docchangeset != self.document.changeset:
             self._computePlottedRange()
 
         self._updatePlotRange(posn)
-        return self._graphToPlotter(data*self.settings.datascale)
-    
-    def plotterToGraphCoords(self, bounds, vals):
+        scale = self.settings.datascale
+
+        if not cache or out is not None:
+            return self._fusedToPlotter(data, scale, out=out, dtype=dtype)
+
+        # throw away results if anything changed since they were made
+        state = ( self.document.changeset, self.settings.log,
+                  tuple(self.plottedrange), self.coordParr1,
+                  self.coordParr2, scale )
+        if state != self.coordcachestate:
+            self.coordcache.clear()
+            self.coordcachestate = state
+
+        key = ( id(data), N.shape(data), N.dtype(dtype).str )
+        entry = self.coordcache.get(key)
+        if entry is not None and entry[0] is data:
+            return entry[1]
+
+        result = self._fusedToPlotter(data, scale, dtype=dtype)
+        # keep data so that its id is not reused
+        self.coordcache[key] = (data, result)
+        return result
+
+    def plotterToGraphCoords(self, bounds, vals, out=None):
         """Convert plotter coordinates on this axis to graph coordinates.
         
         bounds specifies the plot bounds
         vals is a numpy of coordinates
+        out is an optional float array to write the values into
         returns a numpy of floats
         """
 
@@ -555,15 +629,26 @@ class Axis(widget.Widget):
 
         self._updatePlotRange( bounds )
 
+        vals = N.asarray(vals)
+        if out is None:
+            out = N.empty(vals.shape, dtype=N.float64)
+
         # work out fractional positions of the plotter coords
-        frac = ( (vals.astype(N.float64) - self.coordParr1) /
-                 (self.coordParr2 - self.coordParr1) )
+        N.subtract(vals, self.coordParr1, out)
+        out /= self.coordParr2 - self.coordParr1
 
         # convert from fractional to graph
+        r0, r1 = N.array(self.plottedrange, dtype=N.float64)
         if self.settings.log:
-            return self.logConvertFromPlotter(frac)
+            N.power(r1/r0, out, out)
+            out *= r0
         else:
-            return self.linearConvertFromPlotter(frac)
+            out *= r1-r0
+            out += r0
+
+        if out.ndim == 0:
+            return out[()]
+        return out
         
     def plotterToDataCoords(self, bounds, vals):
         """Convert plotter coordinates to data, removing scaling."""
@@ -781,9 +866,9 @@ class Axis(widget.Widget):
                 format = self.autoformat
 
             # generate positions and labels
-            for posn, tickval in izip(coordticks, self.majortickscalc):
-                text = utils.formatNumber(tickval*scale, format,
-                                          locale=self.document.locale)
+            labels = utils.formatNumbers(self.majortickscalc*scale, format,
+                                         locale=self.document.locale)
+            for posn, text in izip(coordticks, labels):
                 yield posn, text
 
         # position of label perpendicular to axis
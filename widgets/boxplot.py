@@ -36,6 +36,8 @@ def _(text, disambiguation=None, context='BoxPlot'):
 
 def percentile(sortedds, perc):
     """Given a sorted dataset, get the percentile perc.
+    The dataset only has to be partitioned at the indices given by
+    _percentileIndices.
 
     Interpolates between data points."""
 
@@ -62,48 +64,84 @@ def swapbox(painter, x1, y1, x2, y2, swap):
     else:
         return qt4.QRectF(qt4.QPointF(x1, y1), qt4.QPointF(x2, y2))
 
+def _percentileIndices(length, percs):
+    """Indices of values in a sorted array of length needed to
+    compute percentiles percs."""
+    indices = set()
+    for perc in percs:
+        index = int(perc * 0.01 * (length-1))
+        indices.add(index)
+        indices.add( min(index+1, length-1) )
+    return sorted(indices)
+
 class _Stats(object):
     """Store statistics about box."""
 
+    # percentiles needed by each whisker mode
+    whiskerpercs = {
+        '9/91 percentile': (9, 91),
+        '2/98 percentile': (2, 98),
+        }
+
     def calculate(self, data, whiskermode):
-        """Calculate statistics for data."""
+        """Calculate statistics for data.
+
+        Rather than sorting the data, the values needed for the
+        percentiles are found by partitioning them, which is faster.
+        """
+        if whiskermode not in ('min/max', '1.5IQR', '1 stddev',
+                               '9/91 percentile', '2/98 percentile'):
+            raise RuntimeError, "Invalid whisker mode"
+
         cleaned = data[ N.isfinite(data) ]
-        cleaned.sort()
 
         if len(cleaned) == 0:
             self.median = self.botquart = self.topquart = self.mean = \
                 self.botwhisker = self.topwhisker = N.nan
             return
 
+        self.mean = N.mean(cleaned)
+
+        # put values at the percentile positions in their sorted places
+        percs = (25, 50, 75) + self.whiskerpercs.get(whiskermode, ())
+        indices = _percentileIndices(len(cleaned), percs)
+        try:
+            cleaned.partition(indices)
+        except AttributeError:
+            # numpy before 1.8
+            cleaned.sort()
+
         self.median = percentile(cleaned, 50)
         self.botquart = percentile(cleaned, 25)
         self.topquart = percentile(cleaned, 75)
-        self.mean = N.mean(cleaned)
-        
+
         if whiskermode == 'min/max':
             self.botwhisker = cleaned.min()
             self.topwhisker = cleaned.max()
         elif whiskermode == '1.5IQR':
+            # largest values below the limits (or the extreme values)
             iqr = self.topquart - self.botquart
-            eltop = N.searchsorted(cleaned, self.topquart+1.5*iqr)-1
-            self.topwhisker = cleaned[eltop]
-            elbot = max(N.searchsorted(cleaned, self.botquart-1.5*iqr)-1, 0)
-            self.botwhisker = cleaned[elbot]
+            below = cleaned[ cleaned < self.topquart+1.5*iqr ]
+            if len(below) == 0:
+                self.topwhisker = cleaned.max()
+            else:
+                self.topwhisker = below.max()
+            below = cleaned[ cleaned < self.botquart-1.5*iqr ]
+            if len(below) == 0:
+                self.botwhisker = cleaned.min()
+            else:
+                self.botwhisker = below.max()
         elif whiskermode == '1 stddev':
             stddev = N.std(cleaned)
             self.topwhisker = self.mean+stddev
             self.botwhisker = self.mean-stddev
-        elif whiskermode == '9/91 percentile':
-            self.topwhisker = percentile(cleaned, 91)
-            self.botwhisker = percentile(cleaned, 9)
-        elif whiskermode == '2/98 percentile':
-            self.topwhisker = percentile(cleaned, 98)
-            self.botwhisker = percentile(cleaned, 2)
         else:
-            raise RuntimeError, "Invalid whisker mode"
+            botperc, topperc = self.whiskerpercs[whiskermode]
+            self.topwhisker = percentile(cleaned, topperc)
+            self.botwhisker = percentile(cleaned, botperc)
 
-        self.outliers = cleaned[ (cleaned < self.botwhisker) |
-                                 (cleaned > self.topwhisker) ]
+        self.outliers = N.sort( cleaned[ (cleaned < self.botwhisker) |
+                                         (cleaned > self.topwhisker) ] )
 
 class BoxPlot(GenericPlotter):
     """Plot bar charts."""
@@ -118,6 +156,9 @@ class BoxPlot(GenericPlotter):
         if type(self) == BoxPlot:
             self.readDefaults()
 
+        # statistics for each dataset, see calcStats
+        self.statscache = {}
+
     @classmethod
     def addSettings(klass, s):
         """Construct list of settings."""
@@ -251,6 +292,35 @@ class BoxPlot(GenericPlotter):
             r[1] = N.nanmax(concat)
         return r
 
+    def calcStats(self):
+        """Return statistics for each values dataset.
+
+        These are cached until the datasets or whisker mode change,
+        so that formatting changes do not recalculate them.
+        """
+
+        s = self.settings
+        doc = self.document
+        cache = {}
+        stats = []
+        for name in s.values:
+            ds = doc.data.get(name)
+            if ( ds is None or ds.datatype != 'numeric' or
+                 ds.dimensions != 1 ):
+                continue
+
+            key = (name, doc.datasetVersion(name), s.whiskermode)
+            st = self.statscache.get(key)
+            if st is None:
+                st = _Stats()
+                st.calculate(ds.data, s.whiskermode)
+            cache[key] = st
+            stats.append(st)
+
+        # only keep statistics for current datasets
+        self.statscache = cache
+        return stats
+
     def getPosns(self):
         """Get values of positions of bars."""
 
@@ -449,9 +519,7 @@ class BoxPlot(GenericPlotter):
 
         if s.calculate:
             # calculated boxes
-            for vals, plotpos in izip(values, plotposns):
-                stats = _Stats()
-                stats.calculate(vals.data, s.whiskermode)
+            for stats, plotpos in izip(self.calcStats(), plotposns):
                 self.plotBox(painter, axes, plotpos, widgetposn, width,
                              clip, stats)
         else:
@@ -20,7 +20,13 @@
 ###############################################################################
 
 import re
+import os
+import os.path
 import sys
+import cPickle
+import StringIO
+import subprocess
+from itertools import izip
 
 import numpy as N
 
@@ -29,7 +35,7 @@ import veusz.setting as setting
 import veusz.utils as utils
 import veusz.qtall as qt4
 
-from function import FunctionPlotter
+from function import FunctionPlotter, FunctionChecker
 import widget
 
 try:
@@ -107,6 +113,233 @@ def minuitFit(evalfunc, params, names, values, xvals, yvals, yserr):
     vals = m.values
     return vals, retchi2, dof
 
+# evaluation contexts made for fit problems in this process, keyed on
+# the custom definitions and the imports allowed
+_contexts = utils.LRUCache(16)
+
+def _fitEvalContext(customs, imports):
+    """Return evaluation context for the custom definitions, allowing
+    the imports in dict imports (module: symbols) without asking."""
+
+    key = repr( (customs, sorted(imports.items())) )
+    context = _contexts.get(key)
+    if context is None:
+        def safeimports(module, symbols):
+            allowed = imports.get(module, ())
+            return [s for s in symbols if s in allowed]
+        context = document.makeEvalContext(customs, safeimports=safeimports)
+        _contexts[key] = context
+    return context
+
+class FitProblem(object):
+    """The function and data for a fit, which can be solved in this
+    or another process."""
+
+    def __init__(self, document, function, variable, values,
+                 xvals, yvals, yserr):
+        """Fit function of variable, with parameters and initial
+        values in dict values, to the data given."""
+
+        self.function = function
+        self.variable = variable
+        self.values = dict(values)
+        self.names = sorted(values.keys())
+        self.params = N.array( [values[i] for i in self.names] )
+        self.xvals = xvals
+        self.yvals = yvals
+        self.yserr = yserr
+
+        # used to rebuild the evaluation context in other processes,
+        # which cannot ask the user which imports are allowed
+        self.customs = list(document.customs)
+        self.imports = document.allowedImports()
+        self.context = document.eval_context
+        self.checker = FunctionChecker()
+        self.checker.check(function, variable)
+
+    def __getstate__(self):
+        """Context and compiled code cannot be pickled."""
+        state = dict(self.__dict__)
+        del state['context'], state['checker']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.checker = FunctionChecker()
+        self.checker.check(self.function, self.variable)
+
+        self.context = _fitEvalContext(self.customs, self.imports)
+
+    def initEnviron(self):
+        """Make variables to evaluate the function with, in addition
+        to the evaluation context."""
+        return dict(self.values)
+
+    def evalfunc(self, params, xvals):
+
+        # make an environment
+        env = self.initEnviron()
+        env[self.variable] = xvals
+
+        # set values for real function
+        for name, val in zip(self.names, params):
+            env[name] = val
+
+        try:
+            return self.checker.compiled.evaluate(self.context, env) + xvals*0.
+        except:
+            return N.nan
+
+    def evalfuncbatch(self, paramsets, xvals):
+        """Evaluate function for each row of parameters in paramsets,
+        by evaluating the expression using 2D arrays.
+
+        Returns None if this is not possible (e.g. if the function
+        does not work element by element)."""
+
+        env = self.initEnviron()
+        env[self.variable] = xvals[N.newaxis, :]
+        for name, vals in zip(self.names, paramsets.T):
+            env[name] = vals[:, N.newaxis]
+
+        try:
+            return ( self.checker.compiled.evaluate(self.context, env) +
+                     N.zeros( (len(paramsets), len(xvals)) ) )
+        except:
+            return None
+
+    def solve(self):
+        """Do the fit, either via Minuit or our own LM fitter.
+        Returns (dict of values, chi2, dof)."""
+
+        if minuit is not None:
+            vals, chi2, dof = minuitFit(self.evalfunc, self.params,
+                                        self.names, self.values,
+                                        self.xvals, self.yvals, self.yserr)
+        else:
+            print _('Minuit not available, falling back to simple L-M fitting:')
+            retn, chi2, dof = utils.fitLM(self.evalfunc, self.params,
+                                          self.xvals,
+                                          self.yvals, self.yserr,
+                                          batchfunc=self.evalfuncbatch)
+            vals = {}
+            for i, v in zip(self.names, retn):
+                vals[i] = float(v)
+
+        return vals, chi2, dof
+
+def _solveFitProblem(problem):
+    """Solve the fit problem, returning (results, output text).
+    results is None if the fit failed."""
+
+    # keep the output, as other processes cannot write to the console
+    out = StringIO.StringIO()
+    oldout, olderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = out
+    try:
+        try:
+            results = problem.solve()
+        except Exception, e:
+            results = None
+            print _('Fit failed: %s') % unicode(e)
+    finally:
+        sys.stdout, sys.stderr = oldout, olderr
+
+    return results, out.getvalue()
+
+def runFitWorker():
+    """Solve the list of fit problems pickled to stdin, writing the
+    pickled list of results to stdout. Run by batchFit."""
+
+    # results go to the real stdout, and anything printed to stderr
+    out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    if sys.platform == 'win32':
+        import msvcrt
+        msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
+        msvcrt.setmode(out.fileno(), os.O_BINARY)
+
+    problems = cPickle.load(sys.stdin)
+    results = [_solveFitProblem(p) for p in problems]
+    cPickle.dump(results, out, -1)
+    out.close()
+
+def _solveInWorkers(problems, numworkers):
+    """Solve fit problems in numworkers new processes, returning the
+    list of results.
+
+    New processes are started rather than forking this one, which
+    may be running the Qt user interface.
+    """
+
+    veuszdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmd = [sys.executable, os.path.join(veuszdir, 'veusz_main.py'),
+           '--fit-worker']
+
+    workers = []
+    try:
+        for i in xrange(numworkers):
+            workers.append( subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                             stdout=subprocess.PIPE) )
+
+        # each worker solves every numworkers-th problem
+        for i, w in enumerate(workers):
+            cPickle.dump(problems[i::numworkers], w.stdin, -1)
+            w.stdin.close()
+
+        results = [None]*len(problems)
+        for i, w in enumerate(workers):
+            results[i::numworkers] = cPickle.load(w.stdout)
+    finally:
+        for w in workers:
+            w.stdin.close()
+            w.stdout.close()
+            w.wait()
+
+    return results
+
+def batchFit(doc, fitwidgets, processes=None):
+    """Fit each of the fit widgets given, solving the fits in parallel
+    in worker processes.
+
+    processes is the number of processes to use (default is the
+    number of CPUs). The results are applied as a single operation.
+    """
+
+    problems = []
+    for w in fitwidgets:
+        problem = w.makeFitProblem()
+        if problem is not None:
+            problems.append( (w, problem) )
+
+    results = None
+    if processes is None:
+        try:
+            import multiprocessing
+            processes = multiprocessing.cpu_count()
+        except (ImportError, NotImplementedError):
+            processes = 1
+    if processes > 1 and len(problems) > 1:
+        try:
+            results = _solveInWorkers( [p for w, p in problems],
+                                       min(processes, len(problems)) )
+        except Exception, e:
+            # fall back to fitting in this process
+            print _('Could not fit in worker processes: %s') % unicode(e)
+    if results is None:
+        results = [_solveFitProblem(p) for w, p in problems]
+
+    operations = []
+    for (w, problem), (fitresults, output) in izip(problems, results):
+        print _('Fitting %s:') % w.path
+        sys.stdout.write(output)
+        if fitresults is not None:
+            operations += w.fitOperations(*fitresults)
+
+    if operations:
+        doc.applyOperation(
+            document.OperationMultiple(operations, descr=_('fit widgets')) )
+
 class Fit(FunctionPlotter):
     """A plotter to fit a function to data."""
 
@@ -193,10 +426,9 @@ class Fit(FunctionPlotter):
                 axrange[1] = max(axrange[1], drange[1])
 
     def initEnviron(self):
-        """Copy data into environment."""
-        env = self.document.eval_context.copy()
-        env.update( self.settings.values )
-        return env
+        """Variables to evaluate the function with, in addition to the
+        document evaluation context."""
+        return dict(self.settings.values)
 
     def updateOutputLabel(self, ops, vals, chi2, dof):
         """Use best fit parameters to update text label."""
@@ -221,8 +453,9 @@ class Fit(FunctionPlotter):
             ops.append( document.OperationSettingSet(
                     labelwidget.settings.get('label') , text ) )
 
-    def actionFit(self):
-        """Fit the data."""
+    def makeFitProblem(self):
+        """Collect the function and data to fit.
+        Returns a FitProblem or None if there is a problem."""
 
         s = self.settings
 
@@ -231,12 +464,7 @@ class Fit(FunctionPlotter):
             self.checker.check(s.function, s.variable)
         except RuntimeError, e:
             self.logEvalError(e)
-            return
-
-        # populate the input parameters
-        names = s.values.keys()
-        names.sort()
-        params = N.array( [s.values[i] for i in names] )
+            return None
 
         # FIXME: loads of error handling!!
         d = self.document
@@ -299,32 +527,25 @@ class Fit(FunctionPlotter):
         # various error checks
         if len(xvals) == 0:
             sys.stderr.write(_('No data values. Not fitting.\n'))
-            return
+            return None
         if len(xvals) != len(yvals) or len(xvals) != len(yserr):
             sys.stderr.write(_('Fit data not equal in length. Not fitting.\n'))
-            return
-        if len(params) > len(xvals):
+            return None
+        if len(s.values) > len(xvals):
             sys.stderr.write(_('No degrees of freedom for fit. Not fitting\n'))
-            return
+            return None
 
-        # actually do the fit, either via Minuit or our own LM fitter
-        chi2 = 1
-        dof = 1
+        return FitProblem(d, s.function, s.variable, s.values,
+                          xvals, yvals, yserr)
 
-        if minuit is not None:
-            vals, chi2, dof = minuitFit(self.evalfunc, params, names, s.values, xvals, yvals, yserr)
-        else:
-            print _('Minuit not available, falling back to simple L-M fitting:')
-            retn, chi2, dof = utils.fitLM(self.evalfunc, params,
-                                          xvals,
-                                          yvals, yserr)
-            vals = {}
-            for i, v in zip(names, retn):
-                vals[i] = float(v)
+    def fitOperations(self, vals, chi2, dof):
+        """Return operations to set the results of a fit."""
+
+        s = self.settings
 
         # list of operations do we can undo the changes
         operations = []
-                                      
+
         # populate the return parameters
         operations.append( document.OperationSettingSet(s.get('values'), vals) )
 
@@ -344,27 +565,21 @@ class Fit(FunctionPlotter):
 
         self.updateOutputLabel(operations, vals, chi2, dof)
 
-        # actually change all the settings
-        d.applyOperation(
-            document.OperationMultiple(operations, descr=_('fit')) )
-    
-    def evalfunc(self, params, xvals):
+        return operations
 
-        # make an environment
-        env = self.initEnviron()
-        s = self.settings
-        env[s.variable] = xvals
+    def actionFit(self):
+        """Fit the data."""
 
-        # set values for real function
-        names = s.values.keys()
-        names.sort()
-        for name, val in zip(names, params):
-            env[name] = val
+        problem = self.makeFitProblem()
+        if problem is None:
+            return
 
-        try:
-            return eval(self.checker.compiled, env) + xvals*0.
-        except:
-            return N.nan
+        vals, chi2, dof = problem.solve()
+        operations = self.fitOperations(vals, chi2, dof)
+
+        # actually change all the settings
+        self.document.applyOperation(
+            document.OperationMultiple(operations, descr=_('fit')) )
 
     def generateOutputExpr(self, vals):
         """Try to generate text form of output expression.
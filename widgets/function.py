@@ -50,22 +50,21 @@ class FunctionChecker(object):
         """
         fn = fn.strip()
         if self.cachedfunc != fn or self.cachedvar != var:
-            checked = utils.checkCode(fn)
+            # compiled code is shared between functions with the same text
+            compiled = utils.compileExpression(fn, securityonly=False)
+            checked = compiled.problems
             if checked is not None:
                 try:
                     msg = checked[0][0]
                 except Exception:
                     msg = ''
                 raise RuntimeError(msg)
+            if compiled.error is not None:
+                raise RuntimeError(compiled.error)
 
             self.cachedfunc = fn
             self.cachedvar = var
-
-            try:
-                # compile code
-                self.compiled = compile(fn, '<string>', 'eval')
-            except Exception, e:
-                raise RuntimeError(e)
+            self.compiled = compiled
 
 class FunctionPlotter(GenericPlotter):
     """Function plotting class."""
@@ -200,7 +199,7 @@ class FunctionPlotter(GenericPlotter):
         env = self.initEnviron()
         env[s.variable] = points
         try:
-            vals = eval(self.checker.compiled, env) + points*0.
+            vals = self.evalFunction(env) + points*0.
         except:
             # something wrong in the evaluation
             return
@@ -301,8 +300,13 @@ class FunctionPlotter(GenericPlotter):
             painter.drawLine( qt4.QPointF(x, yp), qt4.QPointF(x+width, yp) )
 
     def initEnviron(self):
-        """Set up function environment."""
-        return self.document.eval_context.copy()
+        """Set up variables to evaluate function with, in addition to
+        the document evaluation context."""
+        return {}
+
+    def evalFunction(self, env):
+        """Evaluate the function with the variables in env."""
+        return self.checker.compiled.evaluate(self.document.eval_context, env)
 
     def getIndependentPoints(self, axes, posn):
         """Calculate the real and screen points to plot for the independent axis"""
@@ -363,7 +367,7 @@ class FunctionPlotter(GenericPlotter):
         env = self.initEnviron()
         env[s.variable] = axispts
         try:
-            results = eval(self.checker.compiled, env) + N.zeros(axispts.shape)
+            results = self.evalFunction(env) + N.zeros(axispts.shape)
             resultpts = axis2.dataToPlotterCoords(posn, results)
         except Exception, e:
             self.logEvalError(e)
@@ -146,7 +146,7 @@ class Graph(widget.Widget):
         # do normal drawing of children
         # iterate over children in reverse order
         for c in reversed(self.children):
-            c.draw(bounds, painthelper, outerbounds=outerbounds)
+            painthelper.drawWidget(c, bounds, outerbounds=outerbounds)
 
         # now need to find axes which aren't children, and draw those again
         axestodraw = set()
@@ -165,7 +165,8 @@ class Graph(widget.Widget):
             axeswidgets = self.getAxes(axestodraw)
             for w in axeswidgets:
                 if w is not None:
-                    w.draw(bounds, painthelper, outerbounds=outerbounds)
+                    painthelper.drawWidget(w, bounds,
+                                           outerbounds=outerbounds)
 
         return bounds
 
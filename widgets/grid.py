@@ -323,7 +323,7 @@ class Grid(widget.Widget):
                 coutbound[3] = parentposn[3]
 
         # draw widget
-        child.draw(bounds, phelper, outerbounds=coutbound)
+        phelper.drawWidget(child, bounds, outerbounds=coutbound)
 
         # restore position
         child.position = oldposn
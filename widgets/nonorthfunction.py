@@ -91,8 +91,9 @@ class NonOrthFunction(Widget):
                            usertext=_('Steps'), formatting=True), 0 )
 
     def initEnviron(self):
-        '''Set up function environment.'''
-        return self.document.eval_context.copy()
+        '''Set up variables to evaluate function with, in addition to
+        the document evaluation context.'''
+        return {}
        
     def logEvalError(self, ex):
         '''Write error message to document log for exception ex.'''
@@ -121,7 +122,8 @@ class NonOrthFunction(Widget):
         env = self.initEnviron()
         env[s.variable] = invals
         try:
-            vals = eval(self.checker.compiled, env) + invals*0.
+            vals = ( self.checker.compiled.evaluate(
+                    self.document.eval_context, env) + invals*0. )
         except Exception, e:
             self.logEvalError(e)
             vals = invals = N.array([])
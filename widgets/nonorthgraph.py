@@ -142,7 +142,7 @@ class NonOrthGraph(Widget):
 
         # paint children
         for c in reversed(self.children):
-            c.draw(bounds, phelper, outerbounds=outerbounds)
+            phelper.drawWidget(c, bounds, outerbounds=outerbounds)
 
         return bounds
 
@@ -773,8 +773,10 @@ class PointPlotter(GenericPlotter):
 
             #print "Calculating coordinates"
             # calc plotter coords of x and y points
-            xplotter = axes[0].dataToPlotterCoords(posn, xvals.data)
-            yplotter = axes[1].dataToPlotterCoords(posn, yvals.data)
+            xplotter = axes[0].dataToPlotterCoords(posn, xvals.data,
+                                                   cache=True)
+            yplotter = axes[1].dataToPlotterCoords(posn, yvals.data,
+                                                   cache=True)
 
             #print "Painting plot line"
             # plot data line (and/or filling above or below)
@@ -789,6 +791,8 @@ class PointPlotter(GenericPlotter):
             # shift points if in certain step modes
             if s.PlotLine.steps != 'off':
                 steps = s.PlotLine.steps
+                # cached coordinates are read only
+                xplotter = xplotter.copy()
                 if s.PlotLine.steps == 'right-shift-points':
                     xplotter[1:] = 0.5*(xplotter[:-1] + xplotter[1:])
                 elif s.PlotLine.steps == 'left-shift-points':
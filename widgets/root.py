@@ -46,9 +46,13 @@ class Root(widget.Widget):
         s = self.settings
         self.document = document
 
+        # widget types with settings in the stylesheet
+        self.stylesheetwidgets = set()
+
         # don't want user to be able to hide entire document
         stylesheet = setting.StyleSheet(descr=_('Master settings for document'),
-                                        usertext=_('Style sheet'))
+                                        usertext=_('Style sheet'),
+                                        lazyfill=self.lazyFillStylesheet)
         s.add(stylesheet)
         self.fillStylesheet(stylesheet)
 
@@ -101,7 +105,7 @@ class Root(widget.Widget):
         posn = [0, 0, xw, yw]
         painter = painthelper.painter(self, posn)
         page = self.children[pagenum]
-        page.draw( posn, painthelper )
+        painthelper.drawWidget(page, posn)
 
         # w and h are non integer
         w = self.settings.get('width').convert(painter)
@@ -118,31 +122,70 @@ class Root(widget.Widget):
         """Call helper to set page size."""
         cgi.setPageSize()
 
+    def _addStylesheetWidget(self, stylesheet, widgetname):
+        """Add settings for widget type to stylesheet."""
+
+        self.stylesheetwidgets.add(widgetname)
+
+        klass = document.thefactory.getWidgetClass(widgetname)
+        if not (klass.allowusercreation or klass == Root):
+            return None
+
+        newsett = setting.Settings(name=klass.typename,
+                                   usertext = klass.typename,
+                                   pixmap="button_%s" % klass.typename)
+        classset = setting.Settings('temp')
+        klass.addSettings(classset)
+
+        # copy formatting settings to stylesheet
+        for name in classset.setnames:
+            # might become recursive
+            if name == 'StyleSheet':
+                continue
+
+            sett = classset.setdict[name]
+            # skip non formatting settings
+            #if hasattr(sett, 'formatting') and not sett.formatting:
+            #    continue
+            newsett.add( sett.copy() )
+
+        # keep widget settings in name order
+        posn = -1
+        for i, name in enumerate(stylesheet.setnames):
+            if name in self.stylesheetwidgets and name > widgetname:
+                posn = i
+                break
+        stylesheet.add(newsett, posn=posn)
+        return newsett
+
     def fillStylesheet(self, stylesheet):
-        """Register widgets with stylesheet."""
-
-        for widgetname in document.thefactory.listWidgets():
-            klass = document.thefactory.getWidgetClass(widgetname)
-            if klass.allowusercreation or klass == Root:
-                newsett = setting.Settings(name=klass.typename,
-                                           usertext = klass.typename,
-                                           pixmap="button_%s" % klass.typename)
-                classset = setting.Settings('temp')
-                klass.addSettings(classset)
-
-                # copy formatting settings to stylesheet
-                for name in classset.setnames:
-                    # might become recursive
-                    if name == 'StyleSheet':
-                        continue
-
-                    sett = classset.setdict[name]
-                    # skip non formatting settings
-                    #if hasattr(sett, 'formatting') and not sett.formatting:
-                    #    continue
-                    newsett.add( sett.copy() )
-            
-                stylesheet.add(newsett)
+        """Register widgets with stylesheet.
+        Only widgets already imported are added. Others are added
+        when they are looked up (see lazyFillStylesheet)."""
+
+        for widgetname in document.thefactory.listLoadedWidgets():
+            if widgetname not in self.stylesheetwidgets:
+                self._addStylesheetWidget(stylesheet, widgetname)
+
+    def lazyFillStylesheet(self, widgetname):
+        """Add stylesheet settings for widget type when first looked up.
+        If widgetname is None, add all widget types."""
+
+        if widgetname is None:
+            names = document.thefactory.listWidgets()
+        else:
+            names = [widgetname]
+
+        for name in names:
+            if ( name in self.stylesheetwidgets or
+                 not document.thefactory.hasWidget(name) ):
+                continue
+            stylesheet = self.settings.get('StyleSheet')
+            newsett = self._addStylesheetWidget(stylesheet, name)
+            if newsett is not None:
+                # pick up user defaults for the new settings
+                newsett.readDefaults('/%s/StyleSheet' % self.settings.name,
+                                     self.name)
 
 # allow the factory to instantiate this
 document.thefactory.register( Root )
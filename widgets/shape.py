@@ -19,6 +19,7 @@
 """For plotting shapes."""
 
 import itertools
+import math
 import os
 
 import veusz.qtall as qt4
@@ -249,7 +250,7 @@ class ImageFile(BoxShape):
         if type(self) == ImageFile:
             self.readDefaults()
 
-        self.cacheimage = None
+        self.cachekey = None
         self.cachefilename = None
         self.cachestat = None
         self.cacheembeddata = None
@@ -317,21 +318,29 @@ class ImageFile(BoxShape):
         """Update cache."""
         s = self.settings
         self.cachestat = os.stat(s.filename)
-        self.cacheimage = qt4.QImage(s.filename)
+        self.cachekey = utils.fileImageKey(s.filename, st=self.cachestat)
         self.cachefilename = s.filename
+        self.cacheembeddata = None
 
     def updateCachedEmbedded(self):
         """Update cached image from embedded data."""
         s = self.settings
-        self.cacheimage = qt4.QImage()
-
-        # convert the embedded data from base64 and load into the image
-        decoded = qt4.QByteArray.fromBase64(s.embeddedImageData)
-        self.cacheimage.loadFromData(decoded)
 
-        # we cache the data we have decoded
+        # images are cached by a hash of the data, so the hash is
+        # only computed again if the data change
+        self.cachekey = utils.dataImageKey(s.embeddedImageData)
         self.cacheembeddata = s.embeddedImageData
 
+    def loadCachedImage(self):
+        """Decode the image with the cached key."""
+        if self.cachekey[0] == 'file':
+            return qt4.QImage(self.cachefilename)
+
+        # convert the embedded data from base64 and load into the image
+        image = qt4.QImage()
+        image.loadFromData( qt4.QByteArray.fromBase64(self.cacheembeddata) )
+        return image
+
     def drawShape(self, painter, rect):
         """Draw image."""
         s = self.settings
@@ -340,7 +349,7 @@ class ImageFile(BoxShape):
         painter.drawRect(rect)
 
         # check to see whether image needs reloading
-        image = None
+        key = None
         if s.filename != '' and os.path.isfile(s.filename):
             if (self.cachefilename != s.filename or
                 os.stat(s.filename) != self.cachestat):
@@ -348,17 +357,23 @@ class ImageFile(BoxShape):
                 self.updateCachedImage()
                 # clear any embedded image data
                 self.settings.get('embeddedImageData').set('')
-            image = self.cacheimage
+            key = self.cachekey
 
         # or needs recreating from embedded data
         if s.filename == '{embedded}':
             if s.embeddedImageData is not self.cacheembeddata:
                 self.updateCachedEmbedded()
-            image = self.cacheimage
+            key = self.cachekey
+
+        # decoded images are shared by all widgets
+        cache = utils.getImageCache(
+            setting.settingdb['plot_imagecache_size']*1024*1024)
+        size = (0, 0)
+        if key is not None:
+            size = cache.imageSize(key, self.loadCachedImage)
 
         # if no image, then use default image
-        if ( not image or image.isNull() or
-             image.width() == 0 or image.height() == 0 ):
+        if size[0] == 0 or size[1] == 0:
             # load replacement image
             fname = os.path.join(utils.imagedir, 'button_imagefile.svg')
             r = qt4.QSvgRenderer(fname)
@@ -366,7 +381,7 @@ class ImageFile(BoxShape):
 
         else:
             # image rectangle
-            irect = qt4.QRectF(image.rect())
+            irect = qt4.QRectF(0, 0, size[0], size[1])
 
             # preserve aspect ratio
             if s.aspect:
@@ -383,6 +398,18 @@ class ImageFile(BoxShape):
                         rect.top()+(rect.height()-irect.height()*xr)*0.5,
                         rect.width(), irect.height()*xr)
 
+            # if the image is larger than it is drawn on the output
+            # device, use a copy scaled to that size
+            devrect = painter.combinedTransform().mapRect(rect)
+            width = int(math.ceil(devrect.width()))
+            height = int(math.ceil(devrect.height()))
+            if 0 < width < size[0] and 0 < height < size[1]:
+                image = cache.scaledImage(key, self.loadCachedImage,
+                                          width, height)
+            else:
+                image = cache.image(key, self.loadCachedImage)
+            irect = qt4.QRectF(image.rect())
+
             # finally draw image
             painter.drawImage(rect, image, irect)
 
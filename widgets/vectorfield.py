@@ -18,7 +18,7 @@
 #    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 ###############################################################################
 
-import itertools
+import math
 import numpy as N
 
 import veusz.setting as setting
@@ -70,6 +70,20 @@ class VectorField(plotters.GenericPlotter):
                               descr = _('Cartesian (dx,dy) or polar (r,theta)'),
                               usertext = _('Mode')),
                2 )
+        s.add( setting.Choice('decimate',
+                              ['none', 'stride', 'average'],
+                              'none',
+                              descr = _('Reduce number of vectors plotted '
+                                        'to match resolution, by plotting '
+                                        'every nth vector (stride) or '
+                                        'averaging blocks of vectors'),
+                              usertext = _('Decimate')),
+               3 )
+        s.add( setting.DistancePt('decimatespacing', '4pt',
+                                  descr = _('Minimum spacing between vectors '
+                                            'if decimating'),
+                                  usertext = _('Decimate spacing')),
+               4 )
 
         # formatting
         s.add( setting.DistancePt('baselength', '10pt',
@@ -188,28 +202,47 @@ class VectorField(plotters.GenericPlotter):
         xw = min(data1st.shape[1], data2nd.shape[1])
         yw = min(data1st.shape[0], data2nd.shape[0])
 
-        # construct indices into datasets
-        yvals, xvals = N.mgrid[0:yw, 0:xw]
-        # convert using 1st dataset to axes values
-        xdsvals, ydsvals = data1.indexToPoint(xvals.ravel(), yvals.ravel())
-
-        # convert using axes to plotter values
+        # positions of columns and rows in plotter coordinates
+        xdsvals = data1.indexToPoint(N.arange(xw), 0)[0]
+        ydsvals = data1.indexToPoint(0, N.arange(yw))[1]
         xplotter = axes[0].dataToPlotterCoords(posn, xdsvals)
         yplotter = axes[1].dataToPlotterCoords(posn, ydsvals)
 
+        # number of rows and columns to step over when decimating
+        xstep = ystep = 1
+        if s.decimate != 'none':
+            spacing = max(s.get('decimatespacing').convert(painter), 1.)
+            xstep = _decimateStep(xplotter, spacing)
+            ystep = _decimateStep(yplotter, spacing)
+
+        if s.decimate == 'stride' and (xstep > 1 or ystep > 1):
+            # take vectors from middle of each block
+            xsl = slice((xstep-1)//2, xw, xstep)
+            ysl = slice((ystep-1)//2, yw, ystep)
+            xplotter, yplotter = xplotter[xsl], yplotter[ysl]
+            dx, dy = self._vectorComponents(data1st[ysl, xsl],
+                                            data2nd[ysl, xsl])
+        else:
+            dx, dy = self._vectorComponents(data1st[:yw, :xw],
+                                            data2nd[:yw, :xw])
+            if xstep > 1 or ystep > 1:
+                # average vectors (as cartesian components) in blocks
+                dx = _blockMean(dx, ystep, xstep)
+                dy = _blockMean(dy, ystep, xstep)
+                xdsvals = data1.indexToPoint(_blockCentres(xw, xstep), 0)[0]
+                ydsvals = data1.indexToPoint(0, _blockCentres(yw, ystep))[1]
+                xplotter = axes[0].dataToPlotterCoords(posn, xdsvals)
+                yplotter = axes[1].dataToPlotterCoords(posn, ydsvals)
+
+        # expand positions to grid (x varies fastest, as in data)
+        xplotter = N.tile(xplotter, len(yplotter))
+        yplotter = N.repeat(yplotter, dx.shape[1])
+        dx = dx.ravel() * baselength
+        dy = dy.ravel() * baselength
+
         pen = s.Line.makeQPenWHide(painter)
         painter.setPen(pen)
 
-        if s.mode == 'cartesian':
-            dx = (data1st[:yw, :xw] * baselength).ravel()
-            dy = (data2nd[:yw, :xw] * baselength).ravel()
-
-        elif s.mode == 'polar':
-            r = data1st[:yw, :xw].ravel() * baselength
-            theta = data2nd[:yw, :xw].ravel()
-            dx = r * N.cos(theta)
-            dy = r * N.sin(theta)
-
         x1, x2 = xplotter-dx, xplotter+dx
         y1, y2 = yplotter+dy, yplotter-dy
 
@@ -230,13 +263,54 @@ class VectorField(plotters.GenericPlotter):
             else:
                 arrowsizes = N.zeros(lengths.shape) + arrowsize
 
-            for x, y, l, a, asize in itertools.izip(x2, y2, lengths, angles,
-                                                    arrowsizes):
-                if l != 0.:
-                    utils.plotLineArrow(painter, x, y, l, a, asize,
-                                        arrowleft=s.arrowfront,
-                                        arrowright=s.arrowback)
-                
+            utils.plotLineArrows(painter, x2, y2, lengths, angles,
+                                 arrowsizes,
+                                 arrowleft=s.arrowfront,
+                                 arrowright=s.arrowback,
+                                 clip=cliprect)
+
+    def _vectorComponents(self, vals1, vals2):
+        """Convert data values to 2D arrays of x and y components."""
+        if self.settings.mode == 'polar':
+            return vals1 * N.cos(vals2), vals1 * N.sin(vals2)
+        else:
+            return vals1, vals2
+
+def _decimateStep(plotter, spacing):
+    """Return step in index so that points in plotter coordinates
+    are at least spacing apart."""
+    if len(plotter) < 2:
+        return 1
+    cellsize = N.abs(N.diff(plotter)).min()
+    if not N.isfinite(cellsize) or cellsize >= spacing:
+        return 1
+    if cellsize <= 0:
+        return len(plotter)
+    return min( int(math.ceil(spacing / cellsize)), len(plotter) )
+
+def _blockCentres(num, step):
+    """Mean index of each block of step indices, for num indices."""
+    starts = N.arange(0, num, step)
+    ends = N.minimum(starts+step, num)
+    return (starts+ends-1)*0.5
+
+def _blockMean(vals, ystep, xstep):
+    """Average finite values in 2D array in blocks of ystep x xstep."""
+    ny, nx = -(-vals.shape[0] // ystep), -(-vals.shape[1] // xstep)
+    padded = N.empty( (ny*ystep, nx*xstep) )
+    padded.fill(N.nan)
+    padded[:vals.shape[0], :vals.shape[1]] = vals
+    blocks = padded.reshape(ny, ystep, nx, xstep)
+
+    finite = N.isfinite(blocks)
+    total = N.where(finite, blocks, 0.).sum(axis=3).sum(axis=1)
+    count = finite.sum(axis=3).sum(axis=1)
+    olderr = N.seterr(invalid='ignore', divide='ignore')
+    try:
+        return total / count
+    finally:
+        N.seterr(**olderr)
+
 # allow the factory to instantiate a vector field
 document.thefactory.register( VectorField )
 
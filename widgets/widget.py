@@ -309,7 +309,7 @@ class Widget(object):
 
             # iterate over children in reverse order
             for c in reversed(self.children):
-                c.draw(bounds, painthelper, outerbounds=outerbounds)
+                painthelper.drawWidget(c, bounds, outerbounds=outerbounds)
  
         # return our final bounds
         return bounds
@@ -27,6 +27,7 @@ import glob
 import veusz.qtall as qt4
 
 import veusz.document as document
+import veusz.document.dbusinterface as dbusinterface
 import veusz.utils as utils
 import veusz.utils.vzdbus as vzdbus
 import veusz.setting as setting
@@ -48,6 +49,7 @@ from veusz.dialogs.stylesheet import StylesheetDialog
 from veusz.dialogs.custom import CustomDialog
 from veusz.dialogs.safetyimport import SafetyImportDialog
 from veusz.dialogs.histodata import HistoDataDialog
+from veusz.dialogs.drawprofile import DrawProfileDialog
 from veusz.dialogs.plugin import handlePlugin
 import veusz.dialogs.importdialog as importdialog
 import veusz.dialogs.dataeditdialog as dataeditdialog
@@ -128,6 +130,11 @@ class MainWindow(qt4.QMainWindow):
         self.filename = ''
         self.updateTitlebar()
 
+        # thread saving document in background, and whether to save
+        # again when it has finished
+        self.savethread = None
+        self.saveagain = False
+
         # keep a list of references to dialogs
         self.dialogs = []
 
@@ -233,7 +240,7 @@ class MainWindow(qt4.QMainWindow):
                      self.slotAllowedImportsDoc)
 
         # add on dbus interface
-        self.dbusdocinterface = document.DBusInterface(self.document)
+        self.dbusdocinterface = dbusinterface.DBusInterface(self.document)
         self.dbuswininterface = DBusWinInterface(
             self.vzactions, self.dbusdocinterface.index)
 
@@ -497,6 +504,9 @@ class MainWindow(qt4.QMainWindow):
             'view.addtool':
                 a(self, _('Show or hide insert toolbar'), _('Insert toolbar'),
                   None, checkable=True),
+            'view.drawprofile':
+                a(self, _('Show how long each widget takes to draw'),
+                  _('&Draw profile...'), self.slotViewDrawProfile),
             
             'data.import':
                 a(self, _('Import data into Veusz'), _('&Import...'),
@@ -519,6 +529,9 @@ class MainWindow(qt4.QMainWindow):
             'data.reload':
                 a(self, _('Reload linked datasets'), _('&Reload'),
                   self.slotDataReload, icon='kde-view-refresh'),
+            'data.fitall':
+                a(self, _('Fit all fit widgets in the document'),
+                  _('&Fit all'), self.slotDataFitAll),
 
             'help.home':
                 a(self, _('Go to the Veusz home page on the internet'),
@@ -585,12 +598,15 @@ class MainWindow(qt4.QMainWindow):
             ]
         viewmenu = [
             ['view.viewwindows', _('&Windows'), viewwindowsmenu],
+            '',
+            'view.drawprofile',
             ''
             ]
         insertmenu = [
             ]
 
         # load dataset plugins and create menu
+        document.Document.loadPendingPlugins()
         datapluginsmenu = self.definePlugins( plugins.datasetpluginregistry,
                                               self.vzactions, 'data.ops' )
 
@@ -598,7 +614,7 @@ class MainWindow(qt4.QMainWindow):
             ['data.ops', _('&Operations'), datapluginsmenu],
             'data.import', 'data.edit', 'data.create',
             'data.create2d', 'data.capture', 'data.histogram',
-            'data.reload',
+            'data.reload', 'data.fitall',
             ]
         helpmenu = [
             'help.home', 'help.project', 'help.bug',
@@ -750,6 +766,16 @@ class MainWindow(qt4.QMainWindow):
         self.showDialog(dialog)
         return dialog
 
+    def slotViewDrawProfile(self):
+        """Show how long the widgets on the page take to draw."""
+        dialog = DrawProfileDialog(self, self.document)
+        self.showDialog(dialog)
+        return dialog
+
+    def slotDataFitAll(self):
+        """Fit all the fit widgets in the document."""
+        self.interpreter.interface.FitWidgets()
+
     def slotHelpHomepage(self):
         """Go to the veusz homepage."""
         qt4.QDesktopServices.openUrl(qt4.QUrl('http://home.gna.org/veusz/'))
@@ -828,6 +854,9 @@ class MainWindow(qt4.QMainWindow):
             elif v == qt4.QMessageBox.Yes:
                 self.slotFileSave()
 
+        # do not leave the document partially saved
+        self.waitForSave()
+
         # store working directory
         setdb['dirname'] = self.dirname
         setdb['dirname_export'] = self.dirname_export
@@ -871,27 +900,68 @@ class MainWindow(qt4.QMainWindow):
         self.CreateWindow()
 
     def slotFileSave(self):
-        """Save file."""
+        """Save file.
+
+        A snapshot of the document is taken, which is written to the
+        file in the background.
+        """
 
         if self.filename == '':
             self.slotFileSaveAs()
+            return
+
+        if self.savethread is not None:
+            # save the latest version when the current save is done
+            self.saveagain = True
+            return
+
+        dirname = os.path.dirname( os.path.abspath(self.filename) )
+        snapshot = self.document.saveSnapshot(reldirname=dirname)
+
+        self.savethread = document.SaveThread(snapshot, self.filename)
+        self.connect( self.savethread, qt4.SIGNAL('sigProgress'),
+                      self.slotSaveProgress )
+        self.connect( self.savethread, qt4.SIGNAL('finished()'),
+                      self.slotSaveFinished )
+        self.savethread.start()
+
+    def slotSaveProgress(self, percent):
+        """Show progress of saving document."""
+        if self.savethread is not None:
+            self.updateStatusbar(_("Saving to %s (%i%%)") %
+                                 (self.savethread.filename, percent))
+
+    def slotSaveFinished(self):
+        """Saving document in background has finished."""
+
+        thread, self.savethread = self.savethread, None
+        if thread is None:
+            # already handled by waitForSave
+            return
+        # the finished signal can arrive before run() has returned
+        thread.wait()
+
+        if thread.error is not None:
+            qt4.QMessageBox.critical(
+                self, _("Error - Veusz"),
+                _("Unable to save document as '%s'\n\n%s") %
+                (thread.filename, utils.decodeDefault(thread.error.strerror)))
         else:
-            # show busy cursor
-            qt4.QApplication.setOverrideCursor( qt4.QCursor(qt4.Qt.WaitCursor) )
-            try:
-                ofile = open(self.filename, 'w')
-                self.document.saveToFile(ofile)
-                self.updateStatusbar(_("Saved to %s") % self.filename)
-            except EnvironmentError, e:
-                qt4.QApplication.restoreOverrideCursor()
-                qt4.QMessageBox.critical(
-                    self, _("Error - Veusz"),
-                    _("Unable to save document as '%s'\n\n%s") %
-                    (self.filename, utils.decodeDefault(e.strerror)))
-            else:
-                # restore the cursor
-                qt4.QApplication.restoreOverrideCursor()
-                
+            # only unmodified if not changed since snapshot
+            if self.document.changeset == thread.snapshot.changeset:
+                self.document.setModified(False)
+            self.updateStatusbar(_("Saved to %s") % thread.filename)
+
+        if self.saveagain:
+            self.saveagain = False
+            self.slotFileSave()
+
+    def waitForSave(self):
+        """Wait until any document saving in the background is done."""
+        while self.savethread is not None:
+            self.savethread.wait()
+            self.slotSaveFinished()
+
     def updateTitlebar(self):
         """Put the filename into the title bar."""
         if self.filename == '':
@@ -1030,9 +1100,12 @@ class MainWindow(qt4.QMainWindow):
             self.setupDefaultDoc()
             return
 
+        # saved documents can be loaded without executing them
+        commands = document.parseSavedDocument(script)
+
         # check code for any security issues
         ignore_unsafe = setting.transient_settings['unsafe_mode']
-        if not ignore_unsafe:
+        if not ignore_unsafe and commands is None:
             errors = utils.checkCode(script, securityonly=True)
             if errors:
                 qt4.QApplication.restoreOverrideCursor()
@@ -1082,7 +1155,10 @@ class MainWindow(qt4.QMainWindow):
 
         try:
             # actually run script text
-            exec script in env
+            if commands is None:
+                exec script in env
+            else:
+                document.runSavedCommands(commands, interface, env)
         except Exception, e:
             # need to remember to restore stdout, stderr
             sys.stdout, sys.stderr = stdout, stderr
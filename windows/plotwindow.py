@@ -64,6 +64,13 @@ class PickerCrosshairItem( qt4.QGraphicsPathItem ):
         qt4.QGraphicsPathItem.focusOutEvent(self, event)
         self.hide()
 
+def _imageToPNG(img):
+    """Return QImage encoded as PNG data."""
+    buf = qt4.QBuffer()
+    buf.open(qt4.QIODevice.WriteOnly)
+    img.save(buf, 'PNG')
+    return str(buf.data())
+
 class RenderControl(qt4.QObject):
     """Object for rendering plots in a separate thread."""
 
@@ -118,7 +125,7 @@ class RenderControl(qt4.QObject):
         """
 
         self.mutex.lock()
-        jobid, helper = self.latestjobs[-1]
+        jobid, helper, cachekey = self.latestjobs[-1]
         del self.latestjobs[-1]
         lastadded = self.latestaddedjob
         self.mutex.unlock()
@@ -136,6 +143,11 @@ class RenderControl(qt4.QObject):
             helper.renderToPainter(painter)
             painter.end()
 
+            if cachekey is not None:
+                cache = document.getRenderCache()
+                if cache is not None:
+                    cache.put(cachekey, _imageToPNG(img))
+
             self.mutex.lock()
             # just throw away result if it older than the latest one
             if jobid > self.latestdrawnjob:
@@ -147,8 +159,10 @@ class RenderControl(qt4.QObject):
         # tell any listeners that a job has been processed
         self.plotwindow.emit( qt4.SIGNAL("queuechange"), -1 )
 
-    def addJob(self, helper):
-        """Process drawing job in PaintHelper given."""
+    def addJob(self, helper, cachekey=None):
+        """Process drawing job in PaintHelper given.
+        If cachekey is set, store the image in the render cache with
+        the key."""
 
         # indicate that there is a new item to be processed to listeners
         self.plotwindow.emit( qt4.SIGNAL("queuechange"), 1 )
@@ -156,7 +170,7 @@ class RenderControl(qt4.QObject):
         # add the job to the queue
         self.mutex.lock()
         self.latestaddedjob += 1
-        self.latestjobs.append( (self.latestaddedjob, helper) )
+        self.latestjobs.append( (self.latestaddedjob, helper, cachekey) )
         self.mutex.unlock()
 
         if self.threads:
@@ -262,6 +276,9 @@ class PlotWindow( qt4.QGraphicsView ):
         # state of last plot from painthelper
         self.painthelper = None
 
+        # (pagenumber, size) of page to draw after showing a cached image
+        self.pendingpaint = None
+
         self.lastwidgetsselected = []
         self.oldzoom = -1.
         self.zoomfactor = 1.
@@ -871,6 +888,7 @@ class PlotWindow( qt4.QGraphicsView ):
 
             # print >>sys.stderr, "updating"
             self.pickeritem.hide()
+            self.pendingpaint = None
             
             self.pagenumber = min( self.document.getNumberPages() - 1,
                                    self.pagenumber )
@@ -880,22 +898,22 @@ class PlotWindow( qt4.QGraphicsView ):
                 size = self.document.pageSize(
                     self.pagenumber, scaling=self.zoomfactor)
 
-                # draw the data into the buffer
-                # errors cause an exception window to pop up
-                try:
-                    phelper = document.PaintHelper(
-                        size, scaling=self.zoomfactor, dpi=self.dpi)
-                    self.document.paintTo(phelper, self.pagenumber)
-
-                except Exception:
-                    # stop updates this time round and show exception dialog
-                    d = exceptiondialog.ExceptionDialog(sys.exc_info(), self)
-                    self.oldzoom = self.zoomfactor
-                    self.docchangeset = self.document.changeset
-                    d.exec_()
-
-                self.painthelper = phelper
-                self.rendercontrol.addJob(phelper)
+                cache = document.getRenderCache()
+                if cache is None:
+                    self.paintPage(size)
+                else:
+                    params = ( 'view', size, self.zoomfactor, self.dpi,
+                               self.antialias,
+                               setting.settingdb.color('page').rgb() )
+                    cachekey = document.pageCacheKey(
+                        self.document, self.pagenumber, params) + '.png'
+
+                    if self.showCachedPage(cache, cachekey):
+                        # draw the page once the cached image is shown
+                        self.pendingpaint = (self.pagenumber, size)
+                        qt4.QTimer.singleShot(0, self.slotPaintPending)
+                    else:
+                        self.paintPage(size, cachekey=cachekey)
             else:
                 self.painthelper = None
                 self.pagenumber = 0
@@ -912,6 +930,52 @@ class PlotWindow( qt4.QGraphicsView ):
             self.oldzoom = self.zoomfactor
             self.docchangeset = self.document.changeset
 
+    def paintPage(self, size, cachekey=None):
+        """Draw the current page with the size given, rendering it in
+        the background. If cachekey is set, the image is stored in the
+        render cache with the key."""
+
+        # draw the data into the buffer
+        # errors cause an exception window to pop up
+        try:
+            phelper = document.PaintHelper(
+                size, scaling=self.zoomfactor, dpi=self.dpi)
+            self.document.paintTo(phelper, self.pagenumber)
+
+        except Exception:
+            # stop updates this time round and show exception dialog
+            d = exceptiondialog.ExceptionDialog(sys.exc_info(), self)
+            self.oldzoom = self.zoomfactor
+            self.docchangeset = self.document.changeset
+            cachekey = None
+            d.exec_()
+
+        self.painthelper = phelper
+        self.rendercontrol.addJob(phelper, cachekey=cachekey)
+
+    def showCachedPage(self, cache, cachekey):
+        """Show image of page from the render cache if available.
+        Returns whether it was shown."""
+
+        data = cache.get(cachekey)
+        if data is None:
+            return False
+        img = qt4.QImage()
+        if not img.loadFromData(data, 'PNG'):
+            return False
+        self.slotRenderFinished(-1, img, None)
+        return True
+
+    def slotPaintPending(self):
+        """Draw page shown from the render cache, unless superseded."""
+
+        if ( self.pendingpaint is not None and
+             self.pendingpaint[0] == self.pagenumber ):
+            size = self.pendingpaint[1]
+            self.pendingpaint = None
+            self.paintPage(size)
+            self.updateControlGraphs(self.lastwidgetsselected)
+
     def slotRenderFinished(self, jobid, img, helper):
         """Update image on display if rendering (usually in other
         thread) finished."""
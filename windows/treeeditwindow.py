@@ -72,6 +72,9 @@ class SettingsProxy(object):
         """Is setting with name multivalued?"""
         return False
 
+    def settingPaths(self, name):
+        """Return list of paths of settings proxied with name."""
+
     def resetToDefault(self, name):
         """Reset setting to default."""
 
@@ -136,6 +139,10 @@ class SettingsProxySingle(SettingsProxy):
         """Return setnsmode of Settings."""
         return self.settings.setnsmode
 
+    def settingPaths(self, name):
+        """Return list of paths of settings proxied with name."""
+        return [self.settings.get(name).path]
+
     def resetToDefault(self, name):
         """Reset setting to default."""
         setn = self.settings.get(name)
@@ -284,6 +291,10 @@ class SettingsProxyMulti(SettingsProxy):
                 return True
         return False
 
+    def settingPaths(self, name):
+        """Return list of paths of settings proxied with name."""
+        return [s.get(name).path for s in self._settingsatlevel]
+
     def resetToDefault(self, name):
         """Reset settings to default."""
         ops = []
@@ -1168,7 +1179,7 @@ class SettingLabel(qt4.QWidget):
         self.setFocusPolicy(qt4.Qt.StrongFocus)
 
         self.document = document
-        self.connect(document, qt4.SIGNAL('sigModified'), self.slotDocModified)
+        self.connect(document, qt4.SIGNAL('sigChanged'), self.slotDocChanged)
 
         self.setting = setting
         self.setnsproxy = setnsproxy
@@ -1210,6 +1221,12 @@ class SettingLabel(qt4.QWidget):
         else:
             return qt4.QWidget.keyReleaseEvent(self, event)
 
+    def slotDocChanged(self, changes):
+        """Update if the settings shown may have changed."""
+        if changes.settingsChanged(
+            self.setnsproxy.settingPaths(self.setting.name)):
+            self.slotDocModified()
+
     def slotDocModified(self):
         """If the document has been modified."""
 
@@ -39,14 +39,22 @@ class WidgetTreeModel(qt4.QAbstractItemModel):
 
         self.document = document
 
-        self.connect( self.document, qt4.SIGNAL("sigModified"),
-                      self.slotDocumentModified )
+        self.connect( self.document, qt4.SIGNAL("sigChanged"),
+                      self.slotDocumentChanged )
         self.connect( self.document, qt4.SIGNAL("sigWiped"),
                       self.slotDocumentModified )
 
         # suspend signals to the view that the model has changed
         self.suspendmodified = False
 
+    def slotDocumentChanged(self, changes):
+        """Update if widgets have been added, removed, renamed or
+        moved, or hidden widgets changed. Other changes do not alter
+        the tree."""
+        if ( changes.unknown or changes.widgetstructure or
+             any([p.endswith('/hide') for p in changes.settings]) ):
+            self.slotDocumentModified()
+
     def slotDocumentModified(self):
         """The document has been changed."""
         if not self.suspendmodified: